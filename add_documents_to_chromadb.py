@@ -1,153 +1,684 @@
-import chromadb
-from chromadb.utils import embedding_functions
+import argparse # Para la interfaz de línea de comandos
 import os # Necesario para listar archivos y construir rutas
-import pdfplumber # Para leer archivos PDF
+import re # Para dividir el texto en oraciones
+import json # Para el índice local de archivos ingeridos
+import hashlib # Para detectar cambios por hash de contenido
+import time # Para medir el rendimiento de la ingesta
+from pdf_text_extraction import extraer_texto_pdf, extraer_textos_en_paralelo, CacheTextoExtraido # Extracción de texto de PDFs
+from embedding_stage import EtapaEmbeddings, nombre_seguro # Cálculo de embeddings por lotes con caché
+from query_cache import registrar_en_diario # Diario de ingesta para invalidar cachés de consultas
+from bm25_index import IndiceBM25 # Índice léxico (BM25) con los mismos IDs que la colección
+import instrumentation # Tiempos por etapa y contadores
+from instrumentation import metricas
 
-# --- 0. Configuración de la Carpeta de Documentos ---
+# --- 0. Configuración ---
 # Nombre de la subcarpeta donde guardarás tus archivos de texto y PDF
 DOCUMENTS_FOLDER = "shared"
+# Ruta a la carpeta de la base de datos ChromaDB persistente
+CHROMA_DB_PATH = "./my_chroma_db"
+# Nombre de la colección donde se guardan los documentos
+COLLECTION_NAME = "shared" # Nuevo nombre para incluir PDFs
+# Modelo de sentence-transformers usado para los embeddings
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+# Cálculo de embeddings: backend ("torch", "torch-quantized" u "onnx", ver embedding_stage.py),
+# textos por llamada al modelo e hilos de torch (None = valor por defecto)
+EMBEDDING_BACKEND = "torch"
+EMBEDDING_BATCH_SIZE = 64
+TORCH_THREADS = None
+# Fragmentación del texto: cada archivo se divide en fragmentos de CHUNK_SIZE palabras
+# con CHUNK_OVERLAP palabras de solapamiento. CHUNK_MODE puede ser "palabras" (ventana fija)
+# u "oraciones" (ventana de oraciones completas hasta CHUNK_SIZE palabras).
+CHUNK_MODE = "palabras"
+CHUNK_SIZE = 200
+CHUNK_OVERLAP = 40
+# Número máximo de fragmentos por llamada a collection.upsert
+ADD_BATCH_SIZE = 64
+# Separador entre el ID del archivo ('file::<ruta>') y el índice del fragmento
+CHUNK_ID_SEPARATOR = "::chunk::"
+# Índice local (ruta -> mtime, tamaño, hash y IDs de fragmentos) para saber qué archivos
+# cambiaron sin consultar la colección. Se borra junto con la base de datos al resetearla.
+# Cada archivo guarda una sola colección de una sola base de datos: la colección por defecto de
+# CHROMA_DB_PATH usa INGEST_INDEX_PATH y las demás el de INGEST_INDEX_PATH_TEMPLATE (ver rutas_de_indices)
+INGEST_INDEX_PATH = "./indice_ingesta_chromadb.json"
+INGEST_INDEX_PATH_TEMPLATE = "./indice_ingesta_{coleccion}.json"
+# Patrón de los encabezados markdown: en los .md (p. ej. los exportados con create_pdf.py --format markdown)
+# cada sección es un límite de fragmento y su ruta de encabezados se antepone al texto de sus fragmentos
+MARKDOWN_HEADING_PATTERN = re.compile(r"^(#{1,6})[ \t]+(.+?)[ \t#]*$")
+# Índice BM25 (SQLite) que se mantiene junto a la colección para las búsquedas por palabras clave
+BM25_INDEX_PATH = "./indice_bm25.sqlite3"
+BM25_INDEX_PATH_TEMPLATE = "./indice_bm25_{coleccion}.sqlite3"
+# Extracción de texto de PDFs en paralelo: número de procesos, granularidad ("archivo" o "pagina")
+# y segundos máximos por página antes de omitirla
+EXTRACTION_WORKERS = os.cpu_count() or 1
+EXTRACTION_GRANULARITY = "archivo"
+PAGE_TIMEOUT_SECONDS = 60
 
-# Asegúrate de que la carpeta exista, si no, créala para que el usuario sepa dónde poner los archivos
-if not os.path.exists(DOCUMENTS_FOLDER):
-    os.makedirs(DOCUMENTS_FOLDER)
-    print(f"Carpeta '{DOCUMENTS_FOLDER}' creada. Por favor, añade tus archivos de texto (.txt) o PDF (.pdf) allí.")
-
-# --- 1. Configurar el Cliente de ChromaDB (Persistente Localmente) ---
-try:
-    client = chromadb.PersistentClient(path="./my_chroma_db")
-    print("Cliente de ChromaDB (persistente) inicializado.")
-except Exception as e:
-    print(f"Error al inicializar el cliente persistente: {e}")
-    print("Intentando con un cliente efímero (en memoria)...")
-    client = chromadb.EphemeralClient()
-    print("Cliente de ChromaDB (efímero) inicializado.")
-
-# --- 2. Seleccionar una Función de Embedding ---
-try:
-    sentence_transformer_ef = embedding_functions.SentenceTransformerEmbeddingFunction(model_name="all-MiniLM-L6-v2")
-    print(f"Función de embedding '{sentence_transformer_ef.model_name}' cargada.")
-except Exception as e:
-    print(f"Error al cargar la función de embedding: {e}")
-    print("Asegúrate de tener 'sentence-transformers' instalado y conexión a internet la primera vez.")
-    exit()
-
-# --- 3. Crear o Cargar una Colección ---
-collection_name = "shared" # Nuevo nombre para incluir PDFs
-try:
-    collection = client.get_or_create_collection(
-        name=collection_name,
-        embedding_function=sentence_transformer_ef
-    )
-    print(f"Colección '{collection_name}' obtenida/creada.")
-except Exception as e:
-    print(f"Error al obtener o crear la colección '{collection_name}': {e}")
-    exit()
-
-# --- 4. Leer Archivos y Añadir Documentos a la Colección ---
-documentos_para_anadir = []
-ids_para_anadir = []
-metadatos_para_anadir = [] # Opcional: para guardar el tipo de archivo
-
-# Obtener IDs ya en la colección para evitar duplicados
-archivos_procesados_previamente = set()
-if collection.count() > 0: # Solo intentar obtener IDs si la colección no está vacía
+def asegurar_carpeta_documentos(documents_folder=DOCUMENTS_FOLDER):
+    # Asegúrate de que la carpeta exista, si no, créala para que el usuario sepa dónde poner los archivos
+    if not os.path.exists(documents_folder):
+        os.makedirs(documents_folder)
+        print(f"Carpeta '{documents_folder}' creada. Por favor, añade tus archivos de texto (.txt), markdown (.md) o PDF (.pdf) allí.")
+
+def inicializar_cliente(db_path=CHROMA_DB_PATH):
+    """
+    Configura el cliente de ChromaDB (persistente localmente).
+    Si falla, recurre a un cliente efímero (en memoria).
+    """
+    import chromadb # Importación diferida: solo se carga si hay que tocar la base de datos
     try:
-        # Obtenemos solo los IDs, ya que es lo único que necesitamos para la comparación.
-        # Pedir 'documents' o 'metadatas' podría ser costoso si la colección es muy grande.
-        existing_items_ids = collection.get(include=[])['ids'] 
-        if existing_items_ids:
-             archivos_procesados_previamente = set(existing_items_ids)
+        client = chromadb.PersistentClient(path=db_path)
+        print("Cliente de ChromaDB (persistente) inicializado.")
     except Exception as e:
-        print(f"Advertencia: No se pudieron obtener los IDs existentes de la colección: {e}")
+        print(f"Error al inicializar el cliente persistente: {e}")
+        print("Intentando con un cliente efímero (en memoria)...")
+        client = chromadb.EphemeralClient()
+        print("Cliente de ChromaDB (efímero) inicializado.")
+    return client
+
+def cargar_funcion_embedding(model_name=EMBEDDING_MODEL_NAME, backend=EMBEDDING_BACKEND, batch_size=EMBEDDING_BATCH_SIZE,
+                             torch_threads=TORCH_THREADS):
+    """
+    Carga la función de embedding (una EtapaEmbeddings, con caché de embeddings en disco).
+    Devuelve None si no se pudo cargar.
+    """
+    etapa_embeddings = EtapaEmbeddings(model_name, backend, batch_size, torch_threads)
+    return etapa_embeddings if cargar_modelo(etapa_embeddings) else None
+
+def cargar_modelo(etapa_embeddings):
+    """
+    Carga el modelo de una EtapaEmbeddings creada sin cargar. Devuelve False si no se pudo cargar.
+    """
+    try:
+        etapa_embeddings.cargar()
+        print(f"Función de embedding '{etapa_embeddings.model_name}' cargada (backend '{etapa_embeddings.backend}', "
+              f"dispositivo '{etapa_embeddings.dispositivo}', lotes de {etapa_embeddings.batch_size}).")
+        return True
+    except Exception as e:
+        print(f"Error al cargar la función de embedding: {e}")
+        print("Asegúrate de tener 'sentence-transformers' instalado y conexión a internet la primera vez.")
+        return False
+
+def obtener_coleccion(client, collection_name, embedding_function):
+    """
+    Crea o carga una colección. Devuelve None si no se pudo obtener.
+    """
+    try:
+        collection = client.get_or_create_collection(
+            name=collection_name,
+            embedding_function=embedding_function
+        )
+        print(f"Colección '{collection_name}' obtenida/creada.")
+        return collection
+    except Exception as e:
+        print(f"Error al obtener o crear la colección '{collection_name}': {e}")
+        return None
 
+def tipo_de_archivo(nombre_archivo):
+    """
+    Devuelve 'txt', 'md' o 'pdf' según la extensión, o None si el tipo no está soportado.
+    """
+    if nombre_archivo.lower().endswith(".txt"):
+        return "txt"
+    if nombre_archivo.lower().endswith(".md"):
+        return "md"
+    if nombre_archivo.lower().endswith(".pdf"):
+        return "pdf"
+    return None
 
-print(f"\nBuscando archivos en la carpeta '{DOCUMENTS_FOLDER}'...")
-archivos_encontrados = 0
-archivos_nuevos_anadidos = 0
+def leer_documento(ruta_archivo, tipo_archivo):
+    """
+    Lee el contenido de texto de un archivo soportado. Lanza una excepción si no se puede leer.
+    """
+    if tipo_archivo in ("txt", "md"):
+        with open(ruta_archivo, 'r', encoding='utf-8') as f:
+            return f.read()
+    return extraer_texto_pdf(ruta_archivo)
 
-for nombre_archivo in os.listdir(DOCUMENTS_FOLDER):
-    ruta_archivo = os.path.join(DOCUMENTS_FOLDER, nombre_archivo)
-    id_documento = f"file::{ruta_archivo}" # Usar la ruta del archivo como ID único
+def dividir_en_fragmentos(texto, tamano=CHUNK_SIZE, solapamiento=CHUNK_OVERLAP, modo=CHUNK_MODE):
+    """
+    Divide el texto en fragmentos de unas `tamano` palabras que se solapan `solapamiento` palabras.
+    En modo "oraciones" los fragmentos no cortan oraciones por la mitad.
+    """
+    solapamiento = max(0, min(solapamiento, tamano - 1))
+    if modo == "oraciones":
+        oraciones = [o for o in re.split(r'(?<=[.!?])\s+|\n{2,}', texto) if o.strip()]
+        fragmentos = []
+        actual = []
+        palabras_actuales = 0
+        for oracion in oraciones:
+            n_palabras = len(oracion.split())
+            if actual and palabras_actuales + n_palabras > tamano:
+                fragmentos.append(" ".join(actual))
+                # Conservar las últimas oraciones que sumen como mucho `solapamiento` palabras
+                conservadas = []
+                palabras_conservadas = 0
+                for previa in reversed(actual):
+                    palabras_previa = len(previa.split())
+                    if palabras_conservadas + palabras_previa > solapamiento:
+                        break
+                    conservadas.insert(0, previa)
+                    palabras_conservadas += palabras_previa
+                actual, palabras_actuales = conservadas, palabras_conservadas
+            actual.append(oracion.strip())
+            palabras_actuales += n_palabras
+        if actual:
+            fragmentos.append(" ".join(actual))
+        return fragmentos
 
-    if id_documento in archivos_procesados_previamente:
-        print(f"  - Archivo '{nombre_archivo}' ya procesado anteriormente (ID: {id_documento}). Saltando.")
-        continue
+    palabras = texto.split()
+    if not palabras:
+        return []
+    paso = tamano - solapamiento
+    fragmentos = []
+    for inicio in range(0, len(palabras), paso):
+        fragmentos.append(" ".join(palabras[inicio:inicio + tamano]))
+        if inicio + tamano >= len(palabras):
+            break
+    return fragmentos
 
-    contenido_extraido = ""
-    tipo_archivo = "desconocido"
+def dividir_en_secciones(texto):
+    """
+    Divide un texto markdown por sus encabezados (fuera de los bloques ```) y devuelve una lista de
+    tuplas (ruta, texto), donde `ruta` son los encabezados que contienen la sección unidos con ' > '.
+    El texto anterior al primer encabezado forma una sección con ruta vacía.
+    """
+    secciones = []
+    ruta = [] # Pila de (nivel, título)
+    lineas = []
+    en_bloque_codigo = False
 
-    if nombre_archivo.lower().endswith(".txt"):
-        archivos_encontrados += 1
-        tipo_archivo = "txt"
-        try:
-            with open(ruta_archivo, 'r', encoding='utf-8') as f:
-                contenido_extraido = f.read()
-            print(f"  - Archivo TXT '{nombre_archivo}' leído.")
-        except Exception as e:
-            print(f"  - Error al leer el archivo TXT '{nombre_archivo}': {e}")
+    def cerrar_seccion():
+        contenido = "\n".join(lineas).strip()
+        if contenido:
+            secciones.append((" > ".join(titulo for _, titulo in ruta), contenido))
+        lineas.clear()
+
+    for linea in texto.splitlines():
+        if linea.lstrip().startswith("```"):
+            en_bloque_codigo = not en_bloque_codigo
+        coincidencia = None if en_bloque_codigo else MARKDOWN_HEADING_PATTERN.match(linea)
+        if coincidencia is None:
+            lineas.append(linea)
             continue
+        cerrar_seccion()
+        nivel = len(coincidencia.group(1))
+        while ruta and ruta[-1][0] >= nivel:
+            ruta.pop()
+        ruta.append((nivel, coincidencia.group(2).strip()))
+    cerrar_seccion()
+    return secciones
+
+def id_de_fragmento(id_documento, indice):
+    return f"{id_documento}{CHUNK_ID_SEPARATOR}{indice}"
 
-    elif nombre_archivo.lower().endswith(".pdf"):
-        archivos_encontrados += 1
-        tipo_archivo = "pdf"
+def id_documento_de(id_fragmento):
+    """
+    Devuelve el ID del archivo ('file::<ruta>') al que pertenece un ID de fragmento.
+    Los documentos añadidos antes de la fragmentación usan directamente el ID del archivo.
+    """
+    return id_fragmento.split(CHUNK_ID_SEPARATOR, 1)[0]
+
+def preparar_fragmentos(id_documento, contenido, metadatos_base):
+    """
+    Devuelve una lista de tuplas (id, texto, metadatos) con los fragmentos de un documento.
+    Los documentos markdown se fragmentan por secciones, de modo que ningún fragmento mezcla dos
+    secciones; cada fragmento lleva delante la ruta de encabezados y esta se guarda en 'section'.
+    """
+    if metadatos_base.get("file_type") == "md":
+        fragmentos = []
+        for ruta, texto_seccion in dividir_en_secciones(contenido):
+            for fragmento in dividir_en_fragmentos(texto_seccion):
+                fragmentos.append((f"{ruta}\n{fragmento}" if ruta else fragmento, {"section": ruta}))
+    else:
+        fragmentos = [(fragmento, {}) for fragmento in dividir_en_fragmentos(contenido)]
+    return [
+        (
+            id_de_fragmento(id_documento, indice),
+            fragmento,
+            {**metadatos_base, **metadatos_seccion, "document_id": id_documento, "chunk_index": indice, "chunk_count": len(fragmentos)},
+        )
+        for indice, (fragmento, metadatos_seccion) in enumerate(fragmentos)
+    ]
+
+class EscritorPorLotes:
+    """
+    Acumula fragmentos y los escribe en la colección con `upsert` en lotes de como mucho
+    `tamano_lote` elementos, de modo que la memoria no crece con el tamaño del corpus y
+    un error solo afecta a un lote. Lleva la cuenta de documentos y fragmentos por segundo; un documento
+    cuenta como escrito cuando se escribe el lote con su último fragmento y ninguno de ellos ha fallado.
+    Si se indica `etapa_embeddings`, los embeddings de cada lote se calculan con ella y se pasan
+    explícitamente al upsert en lugar de dejar que la colección los calcule uno a uno.
+    Si se indica `indice_bm25`, cada lote escrito también se indexa en él.
+    """
+    def __init__(self, collection, tamano_lote=ADD_BATCH_SIZE, etapa_embeddings=None, indice_bm25=None):
+        self.collection = collection
+        self.tamano_lote = max(1, tamano_lote)
+        self.etapa_embeddings = etapa_embeddings
+        self.indice_bm25 = indice_bm25
+        self.ids, self.documentos, self.metadatos = [], [], []
+        self.documentos_completos = [] # IDs de documento cuyo último fragmento está en el lote actual
+        self.documentos_escritos = 0
+        self.fragmentos_escritos = 0
+        self.fragmentos_fallidos = 0
+        self.documentos_fallidos = set() # IDs de documento con algún fragmento sin escribir
+        self.inicio = time.monotonic()
+
+    def anadir_documento(self, fragmentos):
+        for posicion, (id_fragmento, texto, metadatos) in enumerate(fragmentos, 1):
+            self.ids.append(id_fragmento)
+            self.documentos.append(texto)
+            self.metadatos.append(metadatos)
+            if posicion == len(fragmentos):
+                self.documentos_completos.append(metadatos.get("document_id"))
+            if len(self.ids) >= self.tamano_lote:
+                self.vaciar()
+
+    def vaciar(self):
+        if not self.ids:
+            return
+        n_fragmentos = len(self.ids)
         try:
-            texto_pdf = []
-            with pdfplumber.open(ruta_archivo) as pdf:
-                for pagina in pdf.pages:
-                    texto_pagina = pagina.extract_text()
-                    if texto_pagina: # Asegurarse de que se extrajo texto
-                        texto_pdf.append(texto_pagina)
-            contenido_extraido = "\n".join(texto_pdf) # Unir el texto de todas las páginas
-            print(f"  - Archivo PDF '{nombre_archivo}' leído.")
+            embeddings = None
+            if self.etapa_embeddings is not None:
+                with metricas.etapa("embeddings", n_fragmentos, "fragmentos"):
+                    embeddings = self.etapa_embeddings.codificar(self.documentos)
+            with metricas.etapa("collection_upsert", n_fragmentos, "fragmentos"):
+                self.collection.upsert(ids=self.ids, documents=self.documentos, metadatas=self.metadatos, embeddings=embeddings)
+            if self.indice_bm25 is not None:
+                with metricas.etapa("indice_bm25", n_fragmentos, "fragmentos"):
+                    self.indice_bm25.anadir(zip(self.ids, self.documentos))
+            self.fragmentos_escritos += n_fragmentos
+            metricas.contar("fragmentos_escritos", n_fragmentos)
         except Exception as e:
-            print(f"  - Error al leer el archivo PDF '{nombre_archivo}': {e}")
+            self.fragmentos_fallidos += len(self.ids)
+            metricas.contar("fragmentos_fallidos", n_fragmentos)
+            self.documentos_fallidos.update(metadatos.get("document_id") for metadatos in self.metadatos)
+            print(f"Error al añadir un lote de {len(self.ids)} fragmentos: {e}")
+        self.documentos_escritos += sum(1 for id_documento in self.documentos_completos if id_documento not in self.documentos_fallidos)
+        self.ids, self.documentos, self.metadatos = [], [], []
+        self.documentos_completos = []
+        self.mostrar_progreso()
+
+    def mostrar_progreso(self):
+        duracion = max(time.monotonic() - self.inicio, 1e-9)
+        print(f"    Progreso: {self.documentos_escritos} documentos, {self.fragmentos_escritos} fragmentos "
+              f"({self.documentos_escritos / duracion:.2f} documentos/s, {self.fragmentos_escritos / duracion:.2f} fragmentos/s)")
+
+def leer_documentos(pendientes, cache_texto=None, workers=EXTRACTION_WORKERS, granularidad=EXTRACTION_GRANULARITY,
+                    timeout_pagina=PAGE_TIMEOUT_SECONDS):
+    """
+    Lee los archivos pendientes ({ruta: (tipo, sha256)}) y produce tuplas (ruta, contenido, omitidas, error)
+    a medida que terminan. Los .txt y .md se leen directamente; el texto de los PDFs se toma de la caché
+    si está y, si no, se extrae con un pool de procesos y se guarda en la caché. `omitidas` son las páginas
+    de un PDF saltadas por superar `timeout_pagina`: ese texto incompleto no se guarda en la caché.
+    """
+    rutas_pdf = []
+    sha_por_ruta = {}
+    for ruta_archivo, (tipo_archivo, sha256) in pendientes.items():
+        if tipo_archivo == "pdf":
+            texto_en_cache = cache_texto.obtener(sha256) if cache_texto is not None else None
+            if texto_en_cache is not None:
+                metricas.contar("extracciones_en_cache")
+                yield ruta_archivo, texto_en_cache, [], None
+                continue
+            rutas_pdf.append(ruta_archivo)
+            sha_por_ruta[ruta_archivo] = sha256
             continue
+        try:
+            with metricas.etapa("lectura_txt", 1, "archivos"):
+                contenido = leer_documento(ruta_archivo, tipo_archivo)
+            yield ruta_archivo, contenido, [], None
+        except Exception as e:
+            yield ruta_archivo, None, [], e
+    if rutas_pdf:
+        # Se mide la espera del proceso principal por cada PDF: la extracción ocurre en el pool de procesos
+        extracciones = extraer_textos_en_paralelo(rutas_pdf, min(workers, len(rutas_pdf)), granularidad, timeout_pagina)
+        for ruta_archivo, texto, omitidas, error in metricas.iterar("extraccion_pdf", extracciones, "archivos"):
+            if error is None and not omitidas and cache_texto is not None:
+                try:
+                    cache_texto.guardar(sha_por_ruta[ruta_archivo], texto)
+                except OSError as e:
+                    print(f"  - Advertencia: no se pudo guardar en caché el texto de '{ruta_archivo}': {e}")
+            yield ruta_archivo, texto, omitidas, error
+
+def calcular_sha256(ruta_archivo):
+    digest = hashlib.sha256()
+    with open(ruta_archivo, 'rb') as f:
+        for bloque in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(bloque)
+    return digest.hexdigest()
+
+def rutas_de_indices(collection_name, db_path=CHROMA_DB_PATH):
+    """
+    Devuelve (índice de ingesta, índice BM25) de una colección de la base de datos `db_path`. La colección
+    por defecto de CHROMA_DB_PATH usa los de siempre; las demás, unos propios, porque cada archivo de índice
+    solo guarda una colección de una base de datos. Las de otra base de datos llevan '<base de datos>@' delante.
+    """
+    base_de_datos = os.path.normpath(db_path)
+    if base_de_datos != os.path.normpath(CHROMA_DB_PATH):
+        coleccion = f"{nombre_seguro(base_de_datos)}@{nombre_seguro(collection_name)}"
+    elif collection_name == COLLECTION_NAME:
+        return INGEST_INDEX_PATH, BM25_INDEX_PATH
     else:
-        # Opcional: podrías añadir manejo para otros tipos de archivo aquí
-        # print(f"  - Archivo '{nombre_archivo}' no es .txt ni .pdf. Saltando.")
-        continue # Saltar archivos no soportados
+        coleccion = nombre_seguro(collection_name)
+    return INGEST_INDEX_PATH_TEMPLATE.format(coleccion=coleccion), BM25_INDEX_PATH_TEMPLATE.format(coleccion=coleccion)
 
-    if contenido_extraido and contenido_extraido.strip(): # Solo añadir si se extrajo contenido
-        documentos_para_anadir.append(contenido_extraido)
-        ids_para_anadir.append(id_documento)
-        metadatos_para_anadir.append({"source_file": nombre_archivo, "file_type": tipo_archivo}) # Añadir metadatos
-        print(f"    Preparado para añadir (ID: {id_documento}).")
-    elif tipo_archivo != "desconocido": # Si fue un tipo soportado pero no se extrajo contenido
-        print(f"  - Archivo '{nombre_archivo}' de tipo '{tipo_archivo}' no contenía texto extraíble o estaba vacío. Saltando.")
+def indice_es_de(indice, collection_name, db_path=CHROMA_DB_PATH):
+    """True si el índice de ingesta es de esa colección y base de datos (los anteriores a guardar 'db' se aceptan)."""
+    return indice.get("collection") == collection_name and indice.get("db") in (None, os.path.normpath(db_path))
 
+def cargar_indice_ingesta(ruta_indice=INGEST_INDEX_PATH):
+    """
+    Carga el índice local de archivos ingeridos. Devuelve None si no existe o no se puede leer.
+    """
+    if not os.path.exists(ruta_indice):
+        return None
+    try:
+        with open(ruta_indice, 'r', encoding='utf-8') as f:
+            indice = json.load(f)
+        indice.setdefault("files", {})
+        return indice
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Advertencia: No se pudo leer el índice de ingesta '{ruta_indice}': {e}")
+        return None
+
+def guardar_indice_ingesta(indice, ruta_indice=INGEST_INDEX_PATH):
+    ruta_temporal = f"{ruta_indice}.tmp"
+    with open(ruta_temporal, 'w', encoding='utf-8') as f:
+        json.dump(indice, f, ensure_ascii=False)
+    os.replace(ruta_temporal, ruta_indice)
 
-if not archivos_encontrados:
-    print(f"No se encontraron archivos .txt o .pdf en la carpeta '{DOCUMENTS_FOLDER}'.")
+def entrada_indice(ruta_archivo, sha256, ids_fragmentos):
+    estado = os.stat(ruta_archivo)
+    return {"mtime": estado.st_mtime, "size": estado.st_size, "sha256": sha256, "ids": list(ids_fragmentos)}
 
-if documentos_para_anadir:
+def reconstruir_indice_desde_coleccion(collection, collection_name, db_path=CHROMA_DB_PATH):
+    """
+    Crea el índice a partir de los IDs que ya están en la colección (solo se hace una vez,
+    cuando aún no existe el índice local). Los archivos ya presentes se consideran sin cambios.
+    """
+    indice = {"collection": collection_name, "db": os.path.normpath(db_path), "files": {}}
+    if collection.count() == 0:
+        return indice
     try:
-        print(f"\nAñadiendo {len(documentos_para_anadir)} nuevos documentos a la colección '{collection_name}'...")
-        collection.add(
-            documents=documentos_para_anadir,
-            ids=ids_para_anadir,
-            metadatas=metadatos_para_anadir # Añadir los metadatos
-        )
-        archivos_nuevos_anadidos = len(documentos_para_anadir)
-        print(f"{archivos_nuevos_anadidos} nuevos documentos añadidos exitosamente.")
+        ids_existentes = collection.get(include=[])['ids']
+    except Exception as e:
+        print(f"Advertencia: No se pudieron obtener los IDs existentes de la colección: {e}")
+        return indice
+    ids_por_documento = {}
+    for id_existente in ids_existentes:
+        ids_por_documento.setdefault(id_documento_de(id_existente), []).append(id_existente)
+    for id_documento, ids in ids_por_documento.items():
+        ruta_archivo = id_documento[len("file::"):] if id_documento.startswith("file::") else None
+        if ruta_archivo and os.path.isfile(ruta_archivo):
+            indice["files"][ruta_archivo] = entrada_indice(ruta_archivo, calcular_sha256(ruta_archivo), ids)
+    print(f"Índice de ingesta creado a partir de {len(indice['files'])} archivos ya presentes en la colección.")
+    return indice
+
+def abrir_indice_bm25(collection, ruta=BM25_INDEX_PATH):
+    """
+    Abre el índice BM25 de la colección. Si está vacío y la colección no, lo construye a partir
+    de los fragmentos ya guardados (solo pasa la primera vez o tras borrar el archivo).
+    """
+    indice_bm25 = IndiceBM25(ruta, collection.name)
+    if indice_bm25.contar() == 0 and collection.count() > 0:
+        print(f"Construyendo el índice BM25 '{ruta}' a partir de la colección '{collection.name}'...")
+        print(f"Índice BM25 construido con {indice_bm25.reconstruir_desde_coleccion(collection)} fragmentos.")
+    return indice_bm25
+
+def escanear_carpeta(documents_folder, indice):
+    """
+    Compara los archivos de la carpeta con el índice sin abrir la base de datos. Devuelve
+    (pendientes, rutas_actuales, sin_cambios, actualizadas): los archivos nuevos o modificados,
+    las rutas presentes, los archivos sin cambios y cuántas entradas del índice solo cambiaron de fecha.
+    """
+    pendientes = {} # ruta -> datos del archivo nuevo o modificado
+    rutas_actuales = set()
+    sin_cambios = 0
+    actualizadas = 0
+    for nombre_archivo in sorted(os.listdir(documents_folder)):
+        ruta_archivo = os.path.join(documents_folder, nombre_archivo)
+        id_documento = f"file::{ruta_archivo}" # Usar la ruta del archivo como ID único
+
+        tipo_archivo = tipo_de_archivo(nombre_archivo)
+        if tipo_archivo is None:
+            # Opcional: podrías añadir manejo para otros tipos de archivo aquí
+            continue # Saltar archivos no soportados
+
+        rutas_actuales.add(ruta_archivo)
+        entrada = indice["files"].get(ruta_archivo)
+        estado = os.stat(ruta_archivo)
+        if entrada and entrada.get("mtime") == estado.st_mtime and entrada.get("size") == estado.st_size:
+            sin_cambios += 1
+            continue
+        sha256 = calcular_sha256(ruta_archivo)
+        if entrada and entrada.get("sha256") == sha256:
+            entrada.update(mtime=estado.st_mtime, size=estado.st_size) # Solo cambió la fecha de modificación
+            sin_cambios += 1
+            actualizadas += 1
+            continue
+        pendientes[ruta_archivo] = {"nombre": nombre_archivo, "tipo": tipo_archivo, "entrada": entrada,
+                                    "sha256": sha256, "id_documento": id_documento}
+    return pendientes, rutas_actuales, sin_cambios, actualizadas
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Añade a ChromaDB los archivos .txt, .md y .pdf nuevos o modificados de una carpeta.")
+    parser.add_argument("--carpeta", default=DOCUMENTS_FOLDER, help=f"Carpeta con los documentos (por defecto: {DOCUMENTS_FOLDER})")
+    parser.add_argument("--db", default=CHROMA_DB_PATH, help=f"Ruta de la base de datos ChromaDB (por defecto: {CHROMA_DB_PATH})")
+    parser.add_argument("--coleccion", default=COLLECTION_NAME, help=f"Nombre de la colección (por defecto: {COLLECTION_NAME})")
+    parser.add_argument("--indice", help=f"Índice local de ingesta (por defecto: {INGEST_INDEX_PATH} para la colección "
+                                         f"'{COLLECTION_NAME}' de {CHROMA_DB_PATH} y {INGEST_INDEX_PATH_TEMPLATE} para las demás)")
+    parser.add_argument("--bm25", help=f"Índice BM25 (por defecto: {BM25_INDEX_PATH} para la colección "
+                                       f"'{COLLECTION_NAME}' de {CHROMA_DB_PATH} y {BM25_INDEX_PATH_TEMPLATE} para las demás)")
+    parser.add_argument("--workers", type=int, default=EXTRACTION_WORKERS, help="Procesos de extracción de texto de PDFs")
+    parser.add_argument("--granularidad", choices=["archivo", "pagina"], default=EXTRACTION_GRANULARITY,
+                        help="Reparto de la extracción de PDFs entre procesos")
+    parser.add_argument("--backend", choices=["torch", "torch-quantized", "onnx"], default=EMBEDDING_BACKEND,
+                        help="Backend para calcular los embeddings")
+    parser.add_argument("--batch-size", type=int, default=EMBEDDING_BATCH_SIZE, help="Textos por llamada al modelo de embeddings")
+    parser.add_argument("--torch-threads", type=int, default=TORCH_THREADS, help="Hilos de torch (por defecto, los de torch)")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Solo muestra qué archivos se añadirían, actualizarían o purgarían, sin tocar la colección")
+    instrumentation.anadir_argumentos(parser)
+    return parser.parse_args(argv)
+
+def ingerir_carpeta(carpeta, collection_name, db_path=CHROMA_DB_PATH, etapa_embeddings=None, ruta_indice=None,
+                    ruta_bm25=None, workers=EXTRACTION_WORKERS, granularidad=EXTRACTION_GRANULARITY, dry_run=False,
+                    client=None):
+    """
+    Añade a la colección `collection_name` los archivos nuevos o modificados de `carpeta` y purga los de
+    los archivos eliminados. Devuelve un diccionario con las estadísticas, o None si no se pudo abrir la colección.
+    Si no se pasa `client`, el cliente de ChromaDB de `db_path` solo se crea cuando hace falta.
+    Sin `ruta_indice` ni `ruta_bm25` se usan los índices de la colección (ver rutas_de_indices).
+    """
+    ruta_indice_coleccion, ruta_bm25_coleccion = rutas_de_indices(collection_name, db_path)
+    ruta_indice = ruta_indice or ruta_indice_coleccion
+    ruta_bm25 = ruta_bm25 or ruta_bm25_coleccion
+    stats = {'archivos': 0, 'sin_cambios': 0, 'modificados': 0, 'eliminados': 0, 'documentos_escritos': 0,
+             'fragmentos_escritos': 0, 'fragmentos_fallidos': 0, 'total_fragmentos': None}
+    # El modelo de embeddings y el cliente de ChromaDB solo se cargan si hay algo que escribir
+    if etapa_embeddings is None:
+        etapa_embeddings = EtapaEmbeddings(EMBEDDING_MODEL_NAME, EMBEDDING_BACKEND, EMBEDDING_BATCH_SIZE, TORCH_THREADS)
+    collection = None
+
+    # Índice local para detectar archivos nuevos, modificados o eliminados sin consultar la colección
+    indice = cargar_indice_ingesta(ruta_indice)
+    if indice is not None and not indice_es_de(indice, collection_name, db_path):
+        # Reconstruirlo aquí sobrescribiría el índice de la otra colección o base de datos
+        print(f"Error: El índice de ingesta '{ruta_indice}' pertenece a la colección '{indice.get('collection')}' "
+              f"de '{indice.get('db')}', no a '{collection_name}' de '{db_path}'. Usa --indice con otra ruta.")
+        return None
+    indice_reconstruido = indice is None
+    if indice_reconstruido:
+        client = client or inicializar_cliente(db_path)
+        collection = obtener_coleccion(client, collection_name, etapa_embeddings)
+        if collection is None:
+            return None
+        indice = reconstruir_indice_desde_coleccion(collection, collection_name, db_path)
+    indice.setdefault("db", os.path.normpath(db_path)) # Los índices anteriores no guardaban la base de datos
+
+    print(f"\nBuscando archivos en la carpeta '{carpeta}'...")
+    with metricas.etapa("escaneo"):
+        pendientes, rutas_actuales, archivos_sin_cambios, entradas_actualizadas = escanear_carpeta(carpeta, indice)
+    archivos_encontrados = len(rutas_actuales)
+    rutas_eliminadas = [ruta for ruta in indice["files"] if ruta not in rutas_actuales]
+    stats.update(archivos=archivos_encontrados, sin_cambios=archivos_sin_cambios)
+
+    if dry_run:
+        for ruta_archivo, datos in pendientes.items():
+            print(f"  - Se {'actualizaría' if datos['entrada'] else 'añadiría'}: {ruta_archivo}")
+        for ruta_archivo in rutas_eliminadas:
+            print(f"  - Se purgaría (archivo eliminado): {ruta_archivo}")
+        print(f"\n[Dry run] Archivos sin cambios: {archivos_sin_cambios}. Nuevos o modificados: {len(pendientes)}. Eliminados: {len(rutas_eliminadas)}.")
+        return stats
+
+    if not pendientes and not rutas_eliminadas:
+        if indice_reconstruido or entradas_actualizadas:
+            guardar_indice_ingesta(indice, ruta_indice)
+        if not archivos_encontrados:
+            print(f"No se encontraron archivos .txt, .md o .pdf en la carpeta '{carpeta}'.")
+        else:
+            print(f"No hay nuevos documentos de archivos para añadir a la colección ({archivos_sin_cambios} archivos sin cambios).")
+        return stats
+
+    # --- 1. Configurar el Cliente de ChromaDB y Crear o Cargar la Colección ---
+    if collection is None:
+        client = client or inicializar_cliente(db_path)
+        collection = obtener_coleccion(client, collection_name, etapa_embeddings)
+        if collection is None:
+            return None
+
+    # --- 2. Cargar el Modelo de Embeddings ---
+    if pendientes and not cargar_modelo(etapa_embeddings):
+        return None
+
+    # --- 3. Leer Archivos y Añadir Documentos a la Colección (y al índice BM25) ---
+    indice_bm25 = abrir_indice_bm25(collection, ruta_bm25)
+    escritor = EscritorPorLotes(collection, ADD_BATCH_SIZE, etapa_embeddings, indice_bm25)
+    archivos_modificados = 0
+    nuevas_entradas = {}
+
+    cache_texto = CacheTextoExtraido()
+    if pendientes:
+        print(f"Leyendo {len(pendientes)} archivos nuevos o modificados ({workers} procesos de extracción)...")
+    for ruta_archivo, contenido_extraido, omitidas, error in leer_documentos({ruta: (datos["tipo"], datos["sha256"]) for ruta, datos in pendientes.items()},
+                                                                   cache_texto, workers, granularidad):
+        datos = pendientes[ruta_archivo]
+        nombre_archivo, tipo_archivo, entrada = datos["nombre"], datos["tipo"], datos["entrada"]
+        sha256, id_documento = datos["sha256"], datos["id_documento"]
+        if error is not None:
+            print(f"  - Error al leer el archivo {tipo_archivo.upper()} '{nombre_archivo}': {error}")
+            continue
+        print(f"  - Archivo {tipo_archivo.upper()} '{nombre_archivo}' leído.")
+        metadatos = {"source_file": nombre_archivo, "file_type": tipo_archivo}
+        if omitidas:
+            metricas.contar("extracciones_incompletas")
+            metadatos["extraccion_incompleta"] = True
+            print(f"    Texto incompleto ({len(omitidas)} páginas omitidas): se volverá a extraer en la próxima ejecución.")
+
+        fragmentos = []
+        if contenido_extraido and contenido_extraido.strip(): # Solo añadir si se extrajo contenido
+            inicio_fragmentacion = time.perf_counter()
+            fragmentos = preparar_fragmentos(id_documento, contenido_extraido, metadatos)
+            metricas.registrar_etapa("fragmentacion", time.perf_counter() - inicio_fragmentacion, len(fragmentos), "fragmentos")
+        else: # Si fue un tipo soportado pero no se extrajo contenido
+            print(f"  - Archivo '{nombre_archivo}' de tipo '{tipo_archivo}' no contenía texto extraíble o estaba vacío. Saltando.")
+
+        if entrada:
+            # Archivo modificado: borrar los fragmentos antiguos que el upsert no va a sobrescribir
+            archivos_modificados += 1
+            ids_nuevos = {id_fragmento for id_fragmento, _, _ in fragmentos}
+            ids_obsoletos = [id_antiguo for id_antiguo in entrada.get("ids", []) if id_antiguo not in ids_nuevos]
+            if ids_obsoletos:
+                try:
+                    collection.delete(ids=ids_obsoletos)
+                    indice_bm25.borrar(ids_obsoletos)
+                except Exception as e:
+                    print(f"  - Error al borrar los fragmentos antiguos de '{nombre_archivo}': {e}")
+                    continue
+        if fragmentos:
+            print(f"    {len(fragmentos)} fragmentos preparados para {'actualizar' if entrada else 'añadir'} (ID: {id_documento}).")
+            escritor.anadir_documento(fragmentos)
+        ids_fragmentos = [id_fragmento for id_fragmento, _, _ in fragmentos]
+        if omitidas:
+            # Sin fecha, tamaño ni hash el archivo se vuelve a procesar, pero se conservan sus IDs para purgarlos entonces
+            nuevas_entradas[ruta_archivo] = (id_documento, {"ids": ids_fragmentos})
+        else:
+            nuevas_entradas[ruta_archivo] = (id_documento, entrada_indice(ruta_archivo, sha256, ids_fragmentos))
+
+    escritor.vaciar()
+    for ruta_archivo, (id_documento, entrada) in nuevas_entradas.items():
+        if id_documento in escritor.documentos_fallidos:
+            indice["files"].pop(ruta_archivo, None) # Se reintentará en la próxima ejecución
+        else:
+            indice["files"][ruta_archivo] = entrada
+    if nuevas_entradas:
+        registrar_en_diario("upsert", collection_name, [id_documento for id_documento, _ in nuevas_entradas.values()])
+
+    # Archivos que ya no están en la carpeta: purgar sus fragmentos de la colección
+    documentos_purgados = []
+    for ruta_archivo in rutas_eliminadas:
+        ids_eliminados = indice["files"][ruta_archivo].get("ids", [])
+        try:
+            if ids_eliminados:
+                collection.delete(ids=ids_eliminados)
+                indice_bm25.borrar(ids_eliminados)
+            del indice["files"][ruta_archivo]
+            documentos_purgados.append(f"file::{ruta_archivo}")
+            print(f"  - Archivo eliminado '{ruta_archivo}': {len(ids_eliminados)} fragmentos purgados de la colección.")
+        except Exception as e:
+            print(f"  - Error al purgar los fragmentos del archivo eliminado '{ruta_archivo}': {e}")
+    if documentos_purgados:
+        registrar_en_diario("delete", collection_name, documentos_purgados)
+    guardar_indice_ingesta(indice, ruta_indice)
+    indice_bm25.cerrar()
+    if cache_texto.aciertos or cache_texto.fallos:
+        cache_texto.desalojar()
+        print(f"Caché de texto extraído: {cache_texto.resumen()}.")
+    if escritor.fragmentos_escritos or escritor.fragmentos_fallidos:
+        print(f"Embeddings: {etapa_embeddings.resumen()}.")
+
+    print(f"\nArchivos sin cambios: {archivos_sin_cambios}. Modificados: {archivos_modificados}. Eliminados: {len(rutas_eliminadas)}.")
+    if escritor.documentos_escritos:
+        print(f"{escritor.documentos_escritos} documentos nuevos o modificados ({escritor.fragmentos_escritos} fragmentos) escritos en la colección '{collection_name}'.")
+    elif not escritor.fragmentos_fallidos:
+        print("No hay nuevos documentos de archivos para añadir a la colección.")
+    if escritor.fragmentos_fallidos:
+        print(f"Error: {escritor.fragmentos_fallidos} fragmentos de {len(escritor.documentos_fallidos)} documentos no se pudieron añadir. "
+              f"Vuelve a ejecutar el script para reintentarlos.")
+
+    stats.update(modificados=archivos_modificados, eliminados=len(rutas_eliminadas), documentos_escritos=escritor.documentos_escritos,
+                 fragmentos_escritos=escritor.fragmentos_escritos, fragmentos_fallidos=escritor.fragmentos_fallidos,
+                 total_fragmentos=collection.count())
+    print(f"Total de fragmentos en la colección '{collection_name}' ahora: {stats['total_fragmentos']}")
+    return stats
+
+def main(argv=None):
+    args = parse_args(argv)
+    instrumentation.configurar_desde_args(args)
+    asegurar_carpeta_documentos(args.carpeta)
+    etapa_embeddings = EtapaEmbeddings(EMBEDDING_MODEL_NAME, args.backend, args.batch_size, args.torch_threads)
+    stats = ingerir_carpeta(args.carpeta, args.coleccion, args.db, etapa_embeddings, args.indice, args.bm25,
+                            args.workers, args.granularidad, args.dry_run)
+    if stats is None or stats['total_fragmentos'] is None:
+        return
+
+    # --- La búsqueda se sirve desde search_service.py ---
+
+    # --- Opcional: Listar todas las colecciones ---
+    try:
+        client = inicializar_cliente(args.db)
+        print("\nColecciones en la base de datos:")
+        collections_list = client.list_collections()
+        if not collections_list:
+            print("  No hay colecciones en la base de datos.")
+        for coll_obj in collections_list:
+            print(f"  - Nombre: {coll_obj.name}, ID: {coll_obj.id}, Fragmentos: {coll_obj.count()}")
     except Exception as e:
-        print(f"Error al añadir documentos desde archivos: {e}")
-else:
-    if archivos_encontrados > 0:
-        print("\nNo hay nuevos documentos de archivos para añadir a la colección.")
-
-print(f"Total de documentos en la colección '{collection_name}' ahora: {collection.count()}")
-
-# --- SECCIÓN DE BÚSQUEDA ELIMINADA ---
-
-# --- Opcional: Listar todas las colecciones ---
-try:
-    print("\nColecciones en la base de datos:")
-    collections_list = client.list_collections()
-    if not collections_list:
-        print("  No hay colecciones en la base de datos.")
-    for coll_obj in collections_list:
-        print(f"  - Nombre: {coll_obj.name}, ID: {coll_obj.id}, Documentos: {coll_obj.count()}")
-except Exception as e:
-    print(f"Error al listar colecciones: {e}")
-
-print("\n¡Proceso de carga de documentos completado!")
+        print(f"Error al listar colecciones: {e}")
+
+    instrumentation.mostrar_resumen()
+    print("\n¡Proceso de carga de documentos completado!")
+
+if __name__ == "__main__":
+    main()
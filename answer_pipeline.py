@@ -0,0 +1,179 @@
+import json
+import math
+import os
+import re
+import time
+
+# --- CONFIGURACIÓN ---
+# Modelo y servidor compatibles con la API de OpenAI (se pueden cambiar con OPENAI_MODEL y
+# OPENAI_BASE_URL). Con otra URL base se puede usar cualquier servidor que hable la misma API,
+# p. ej. openai_stub_server.py para probar sin conexión
+LLM_MODEL = "gpt-4o-mini"
+LLM_BASE_URL = None # None = api.openai.com
+LLM_TEMPERATURE = 0.2
+# Fragmentos recuperados antes de deduplicar y recortar al presupuesto
+ANSWER_CANDIDATES = 20
+# Tokens (aproximados) de contexto como máximo en el prompt
+ANSWER_CONTEXT_TOKEN_BUDGET = 3000
+# Estimación de tokens sin cargar un tokenizador: ~4 caracteres por token en español e inglés
+CHARS_PER_TOKEN = 4
+# Similitud de Jaccard entre trigramas de palabras a partir de la cual dos fragmentos se consideran casi iguales
+NEAR_DUPLICATE_THRESHOLD = 0.8
+
+SYSTEM_PROMPT = (
+    "Eres un asistente que responde preguntas sobre la documentación interna. "
+    "Responde solo con la información de las fuentes proporcionadas y cita las fuentes usadas con su número entre corchetes, "
+    "por ejemplo [2]. Si las fuentes no contienen la respuesta, dilo."
+)
+
+def estimar_tokens(texto):
+    return math.ceil(len(texto or "") / CHARS_PER_TOKEN)
+
+def trigramas(texto):
+    palabras = re.findall(r'\w+', (texto or "").lower())
+    if len(palabras) < 3:
+        return {tuple(palabras)}
+    return {tuple(palabras[i:i + 3]) for i in range(len(palabras) - 2)}
+
+def es_casi_duplicado(trigramas_fragmento, seleccionados, umbral=NEAR_DUPLICATE_THRESHOLD):
+    for otros in seleccionados:
+        union = len(trigramas_fragmento | otros)
+        if union and len(trigramas_fragmento & otros) / union >= umbral:
+            return True
+    return False
+
+def empaquetar_contexto(resultados, presupuesto_tokens=ANSWER_CONTEXT_TOKEN_BUDGET, umbral=NEAR_DUPLICATE_THRESHOLD):
+    """
+    Elige, en orden de relevancia, los fragmentos que caben en `presupuesto_tokens`, saltando los
+    casi duplicados de uno ya elegido. Si ni el primero cabe, se incluye recortado.
+    Devuelve (fragmentos elegidos, número de casi duplicados descartados).
+    """
+    elegidos = []
+    trigramas_elegidos = []
+    descartados = 0
+    restantes = presupuesto_tokens
+    for resultado in resultados:
+        documento = resultado.get("documento") or ""
+        trigramas_fragmento = trigramas(documento)
+        if es_casi_duplicado(trigramas_fragmento, trigramas_elegidos, umbral):
+            descartados += 1
+            continue
+        tokens = estimar_tokens(documento)
+        if tokens > restantes:
+            if elegidos:
+                continue # Puede que uno más corto todavía quepa
+            resultado = {**resultado, "documento": documento[:restantes * CHARS_PER_TOKEN]}
+            tokens = restantes
+        elegidos.append(resultado)
+        trigramas_elegidos.append(trigramas_fragmento)
+        restantes -= tokens
+        if restantes <= 0:
+            break
+    return elegidos, descartados
+
+def construir_mensajes(pregunta, fragmentos):
+    """Mensajes de chat con las fuentes numeradas desde 1, en el mismo orden que `fragmentos`."""
+    bloques = []
+    for numero, fragmento in enumerate(fragmentos, start=1):
+        metadatos = fragmento.get("metadatos") or {}
+        origen = metadatos.get("source_file") or fragmento["id"]
+        bloques.append(f"[{numero}] ({origen})\n{fragmento['documento']}")
+    contexto = "\n\n".join(bloques) if bloques else "(no se encontraron fuentes)"
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": f"Fuentes:\n\n{contexto}\n\nPregunta: {pregunta}"},
+    ]
+
+class BackendOpenAI:
+    """
+    Genera la respuesta con cualquier servidor compatible con la API de chat de OpenAI.
+    `generar` produce los fragmentos de texto según llegan (stream=True).
+    """
+    def __init__(self, modelo=LLM_MODEL, base_url=LLM_BASE_URL, api_key=None, temperatura=LLM_TEMPERATURE):
+        from openai import OpenAI # Importación diferida: la búsqueda no necesita el cliente de OpenAI
+        # Los servidores locales no suelen pedir clave, pero el cliente exige una
+        api_key = api_key or os.getenv("OPENAI_API_KEY") or ("sin-clave" if base_url else None)
+        self.cliente = OpenAI(base_url=base_url, api_key=api_key)
+        self.modelo = modelo
+        self.temperatura = temperatura
+
+    def generar(self, mensajes):
+        respuesta = self.cliente.chat.completions.create(
+            model=self.modelo, messages=mensajes, temperature=self.temperatura, stream=True,
+        )
+        for trozo in respuesta:
+            if trozo.choices and trozo.choices[0].delta.content:
+                yield trozo.choices[0].delta.content
+
+def evento_sse(evento, datos):
+    return f"event: {evento}\ndata: {json.dumps(datos, ensure_ascii=False)}\n\n"
+
+class Respondedor:
+    """
+    Recupera fragmentos con un Buscador, los empaqueta en el presupuesto de tokens y pide la
+    respuesta al backend de LLM (cualquier objeto con un método `generar(mensajes)`).
+    """
+    def __init__(self, buscador, backend_llm, presupuesto_tokens=ANSWER_CONTEXT_TOKEN_BUDGET, candidatos=ANSWER_CANDIDATES):
+        self.buscador = buscador
+        self.backend_llm = backend_llm
+        self.presupuesto_tokens = presupuesto_tokens
+        self.candidatos = candidatos
+
+    def preparar(self, pregunta, filtro=None, filtro_documento=None, modo="vector", presupuesto_tokens=None):
+        """Devuelve (mensajes, fuentes, estadísticas de la recuperación)."""
+        resultados = self.buscador.buscar([pregunta], self.candidatos, filtro, filtro_documento, modo)[0]
+        fuentes, descartados = empaquetar_contexto(resultados, presupuesto_tokens or self.presupuesto_tokens)
+        estadisticas = {
+            "recuperados": len(resultados),
+            "casi_duplicados": descartados,
+            "usados": len(fuentes),
+            "tokens_contexto": sum(estimar_tokens(fuente["documento"]) for fuente in fuentes),
+        }
+        return construir_mensajes(pregunta, fuentes), fuentes, estadisticas
+
+    @staticmethod
+    def resumen_fuentes(fuentes):
+        return [
+            {"numero": numero, "id": fuente["id"], "metadatos": fuente.get("metadatos")}
+            for numero, fuente in enumerate(fuentes, start=1)
+        ]
+
+    def responder(self, pregunta, **opciones):
+        """Respuesta completa (sin streaming)."""
+        mensajes, fuentes, estadisticas = self.preparar(pregunta, **opciones)
+        return {
+            "pregunta": pregunta,
+            "respuesta": "".join(self.backend_llm.generar(mensajes)),
+            "fuentes": self.resumen_fuentes(fuentes),
+            "estadisticas": estadisticas,
+        }
+
+    def responder_sse(self, pregunta, al_terminar=None, **opciones):
+        """
+        Produce eventos SSE: 'fuentes' (antes de llamar al LLM), un 'token' por trozo de texto
+        recibido y 'fin' con las estadísticas (o 'error'). `al_terminar(segundos, primer_token, error)`
+        se llama al acabar para registrar las métricas.
+        """
+        inicio = time.perf_counter()
+        primer_token = None
+        error = False
+        try:
+            mensajes, fuentes, estadisticas = self.preparar(pregunta, **opciones)
+            yield evento_sse("fuentes", {"fuentes": self.resumen_fuentes(fuentes), **estadisticas})
+            trozos = 0
+            for texto in self.backend_llm.generar(mensajes):
+                if primer_token is None:
+                    primer_token = time.perf_counter() - inicio
+                trozos += 1
+                yield evento_sse("token", {"texto": texto})
+            yield evento_sse("fin", {
+                "trozos": trozos,
+                "primer_token_ms": round(primer_token * 1000, 2) if primer_token is not None else None,
+                "total_ms": round((time.perf_counter() - inicio) * 1000, 2),
+            })
+        except Exception as e: # La respuesta HTTP ya empezó: el error se comunica como un evento más
+            error = True
+            yield evento_sse("error", {"detalle": str(e)})
+        finally:
+            if al_terminar is not None:
+                al_terminar(time.perf_counter() - inicio, primer_token, error)
@@ -0,0 +1,344 @@
+import argparse # Para la interfaz de línea de comandos
+import asyncio
+import hashlib
+import random
+import re
+import time
+import uuid
+from collections import Counter
+from urllib.parse import urlencode
+
+from fastapi import FastAPI, Request
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
+
+# --- CONFIGURACIÓN ---
+# Servidor local que imita las partes de Confluence que usa create_pdf.py, para medir el recorrido
+# del árbol y la exportación a PDF sin tocar el wiki de producción
+MOCK_HOST = "127.0.0.1"
+MOCK_PORT = 8090
+# Forma del árbol: páginas raíz del espacio, hijos por página y niveles por debajo de las raíces.
+# "uniforme" = todas las páginas tienen `ramificacion` hijos; "aleatorio" = entre 0 y 2 * ramificacion;
+# "lineal" = una sola cadena de `profundidad` páginas bajo cada raíz (árboles muy profundos)
+MOCK_ROOTS = 5
+MOCK_BRANCHING = 4
+MOCK_DEPTH = 3
+MOCK_TREE_SHAPES = ("uniforme", "aleatorio", "lineal")
+# Tamaño de página máximo de las APIs de listado (Confluence recorta el `limit` pedido)
+MOCK_MAX_PAGE_LIMIT = 100
+# Latencia añadida a cada petición y su variación (+/- ratio)
+MOCK_LATENCY_MS = 20
+MOCK_LATENCY_JITTER_RATIO = 0.3
+# Segundos que tarda en "renderizarse" cada PDF y su variación (+/- ratio)
+MOCK_RENDER_SECONDS = 1.0
+MOCK_RENDER_JITTER_RATIO = 0.3
+# Fracción de peticiones que fallan con 500 y fracción que reciben 429 con Retry-After
+MOCK_ERROR_RATE = 0.0
+MOCK_RATE_LIMIT_RATE = 0.0
+MOCK_RETRY_AFTER_SECONDS = 1
+# Tamaño de cada PDF servido y bloque en que se envía
+MOCK_PDF_BYTES = 256 * 1024
+MOCK_PDF_CHUNK_BYTES = 64 * 1024
+# Fracción de descargas de PDF que se cortan a mitad (para probar la reanudación con Range)
+MOCK_CUT_RATE = 0.0
+MOCK_ATL_TOKEN = "mock-atl-token"
+
+# Nombre con el que se cuentan las peticiones de cada ruta (el middleware se ejecuta antes del enrutado)
+ENDPOINT_PATTERNS = [
+    ("space_pages", re.compile(r"^/rest/api/space/[^/]+/content/page$")),
+    ("cql_search", re.compile(r"^/rest/api/content/search$")),
+    ("child_pages", re.compile(r"^/rest/api/content/[^/]+/child/page$")),
+    ("page_details", re.compile(r"^/rest/api/content/[^/]+$")),
+    ("viewpage", re.compile(r"^/pages/viewpage\.action$")),
+    ("pdfpageexport", re.compile(r"^/spaces/flyingpdf/pdfpageexport\.action$")),
+    ("task_progress", re.compile(r"^/services/api/v1/task/[^/]+/progress$")),
+    ("task_result", re.compile(r"^/services/api/v1/task/[^/]+/result$")),
+    ("pdf_download", re.compile(r"^/download/[^/]+\.pdf$")),
+]
+
+def endpoint_name(path):
+    for name, pattern in ENDPOINT_PATTERNS:
+        if pattern.match(path):
+            return name
+    return path
+
+def build_tree(roots=MOCK_ROOTS, branching=MOCK_BRANCHING, depth=MOCK_DEPTH, shape="uniforme", seed=0):
+    """
+    Genera un árbol de páginas determinista. Devuelve (ids_raíz, {id: [ids_hijos]}, {id: (id_padre, título)}).
+    Los IDs son números consecutivos en orden BFS, como cadenas (igual que en la API de Confluence).
+    """
+    rng = random.Random(seed)
+    next_id = 1000
+    root_ids = []
+    children = {}
+    pages = {}
+    frontier = []
+    for i in range(roots):
+        page_id = str(next_id)
+        next_id += 1
+        root_ids.append(page_id)
+        pages[page_id] = (None, f"Raíz {i + 1}")
+        frontier.append(page_id)
+    for level in range(1, depth + 1):
+        next_frontier = []
+        for parent_id in frontier:
+            if shape == "lineal":
+                count = 1
+            elif shape == "aleatorio":
+                count = rng.randint(0, 2 * branching)
+            else:
+                count = branching
+            children[parent_id] = []
+            for j in range(count):
+                page_id = str(next_id)
+                next_id += 1
+                children[parent_id].append(page_id)
+                pages[page_id] = (parent_id, f"{pages[parent_id][1]} / Página {level}.{j + 1}")
+                next_frontier.append(page_id)
+        frontier = next_frontier
+    return root_ids, children, pages
+
+class MockConfluence:
+    """Estado del servidor simulado: árbol, tareas de exportación en curso y contadores de peticiones."""
+    def __init__(self, roots=MOCK_ROOTS, branching=MOCK_BRANCHING, depth=MOCK_DEPTH, shape="uniforme",
+                 latency_ms=MOCK_LATENCY_MS, render_seconds=MOCK_RENDER_SECONDS, error_rate=MOCK_ERROR_RATE,
+                 rate_limit_rate=MOCK_RATE_LIMIT_RATE, pdf_bytes=MOCK_PDF_BYTES, seed=0, cut_rate=MOCK_CUT_RATE):
+        self.root_ids, self.children, self.pages = build_tree(roots, branching, depth, shape, seed)
+        self.latency_ms = latency_ms
+        self.render_seconds = render_seconds
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.pdf_bytes = pdf_bytes
+        self.pdf_content = (b"%PDF-1.4\n" + b"0" * pdf_bytes)[:pdf_bytes]
+        self.pdf_etag = f'"{hashlib.md5(self.pdf_content).hexdigest()}"' # Como S3: MD5 del contenido
+        self.cut_rate = cut_rate
+        self.rng = random.Random(seed)
+        self.tasks = {} # task_id -> (page_id, inicio, segundos de render)
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.requests = Counter() # endpoint -> peticiones
+        self.statuses = Counter() # código HTTP -> respuestas
+        self.bytes_sent = 0
+        self.injected_errors = Counter() # endpoint -> errores inyectados (500 y 429)
+
+    def stats(self):
+        return {
+            "pages": len(self.pages),
+            "requests": dict(self.requests),
+            "total_requests": sum(self.requests.values()),
+            "statuses": {str(status): count for status, count in self.statuses.items()},
+            "bytes_sent": self.bytes_sent,
+            "injected_errors": dict(self.injected_errors),
+        }
+
+    def page_json(self, page_id, with_ancestors=False):
+        parent_id, title = self.pages[page_id]
+        item = {"id": page_id, "type": "page", "title": title, "version": {"number": 1, "when": "2024-01-01T00:00:00.000Z"}}
+        if with_ancestors:
+            ancestors = []
+            while parent_id is not None:
+                ancestors.insert(0, {"id": parent_id})
+                parent_id = self.pages[parent_id][0]
+            item["ancestors"] = ancestors
+        return item
+
+    def page_body(self, page_id):
+        """XHTML determinista en formato de almacenamiento: encabezados, párrafos, lista, tabla y macro de código."""
+        title = self.pages[page_id][1]
+        return (
+            f"<h1>Introducción</h1><p>Contenido de <strong>{title}</strong> (ID {page_id}).</p>"
+            f'<ac:structured-macro ac:name="toc"><ac:parameter ac:name="maxLevel">2</ac:parameter></ac:structured-macro>'
+            f"<h2>Detalles</h2><ul><li>Elemento uno</li><li>Elemento dos con <code>código</code></li></ul>"
+            f"<table><tbody><tr><th>Clave</th><th>Valor</th></tr><tr><td>id</td><td>{page_id}</td></tr></tbody></table>"
+            f'<h2>Ejemplo</h2><ac:structured-macro ac:name="code"><ac:parameter ac:name="language">python</ac:parameter>'
+            f"<ac:plain-text-body><![CDATA[print('{page_id}')]]></ac:plain-text-body></ac:structured-macro>"
+        )
+
+    def descendants(self, page_id):
+        pending = list(self.children.get(page_id, []))
+        while pending:
+            child_id = pending.pop(0)
+            yield child_id
+            pending.extend(self.children.get(child_id, []))
+
+def paginate(request, ids, to_json):
+    """Respuesta de listado paginada al estilo de Confluence (start/limit y _links.next)."""
+    start = int(request.query_params.get("start", 0))
+    limit = min(int(request.query_params.get("limit", 25)), MOCK_MAX_PAGE_LIMIT)
+    selected = ids[start:start + limit]
+    body = {"results": [to_json(page_id) for page_id in selected], "start": start, "limit": limit, "size": len(selected), "_links": {}}
+    if start + limit < len(ids):
+        params = dict(request.query_params)
+        params.update({"start": str(start + limit), "limit": str(limit)})
+        body["_links"]["next"] = f"{request.url.path}?{urlencode(params)}"
+    return body
+
+def create_app(mock=None):
+    mock = mock or MockConfluence()
+    app = FastAPI(title="Confluence simulado para benchmarks")
+    app.state.mock = mock
+
+    @app.middleware("http")
+    async def simulate_network(request: Request, call_next):
+        if request.url.path.startswith("/__"):
+            return await call_next(request)
+        endpoint = endpoint_name(request.url.path)
+        mock.requests[endpoint] += 1
+        if mock.latency_ms:
+            jitter = 1 + mock.rng.uniform(-MOCK_LATENCY_JITTER_RATIO, MOCK_LATENCY_JITTER_RATIO)
+            await asyncio.sleep(mock.latency_ms * jitter / 1000)
+        roll = mock.rng.random()
+        if roll < mock.rate_limit_rate:
+            mock.injected_errors[endpoint] += 1
+            response = PlainTextResponse("Rate limited", status_code=429, headers={"Retry-After": str(MOCK_RETRY_AFTER_SECONDS)})
+        elif roll < mock.rate_limit_rate + mock.error_rate:
+            mock.injected_errors[endpoint] += 1
+            response = PlainTextResponse("Error simulado", status_code=500)
+        else:
+            response = await call_next(request)
+        mock.statuses[response.status_code] += 1
+        return response
+
+    @app.get("/rest/api/space/{space_key}/content/page")
+    def space_pages(space_key: str, request: Request):
+        return paginate(request, mock.root_ids, mock.page_json)
+
+    @app.get("/rest/api/content/search")
+    def cql_search(request: Request, cql: str = "", expand: str = ""):
+        id_list = re.match(r"^id in \(([^)]*)\)", cql)
+        if id_list:
+            ids = [page_id.strip() for page_id in id_list.group(1).split(",") if page_id.strip() in mock.pages]
+        elif cql.startswith("ancestor="):
+            ids = list(mock.descendants(cql.split("=", 1)[1].split()[0]))
+        else:
+            ids = [page_id for page_id in mock.pages if mock.pages[page_id][0] is not None]
+        representations = [name for name in ("storage", "view") if f"body.{name}" in expand]
+
+        def to_json(page_id):
+            item = mock.page_json(page_id, with_ancestors=not id_list)
+            if representations:
+                item["body"] = {name: {"value": mock.page_body(page_id), "representation": name} for name in representations}
+            return item
+        return paginate(request, ids, to_json)
+
+    @app.get("/rest/api/content/{page_id}/child/page")
+    def child_pages(page_id: str, request: Request):
+        if page_id not in mock.pages:
+            return JSONResponse({"message": "No content found"}, status_code=404)
+        return paginate(request, mock.children.get(page_id, []), mock.page_json)
+
+    @app.get("/rest/api/content/{page_id}")
+    def page_details(page_id: str):
+        if page_id not in mock.pages:
+            return JSONResponse({"message": "No content found"}, status_code=404)
+        return mock.page_json(page_id)
+
+    @app.get("/pages/viewpage.action")
+    def viewpage(pageId: str = ""):
+        title = mock.pages.get(pageId, (None, "Página"))[1]
+        body = f'<html><head><meta name="atlassian-token" content="{MOCK_ATL_TOKEN}"><title>{title}</title></head><body>{title}</body></html>'
+        mock.bytes_sent += len(body)
+        return HTMLResponse(body)
+
+    @app.get("/spaces/flyingpdf/pdfpageexport.action")
+    def pdfpageexport(pageId: str = "", atl_token: str = ""):
+        if atl_token != MOCK_ATL_TOKEN:
+            return HTMLResponse("<html><body>XSRF check failed</body></html>", status_code=403)
+        if pageId not in mock.pages:
+            return HTMLResponse("<html><body>Page not found</body></html>", status_code=404)
+        task_id = uuid.uuid4().hex
+        jitter = 1 + mock.rng.uniform(-MOCK_RENDER_JITTER_RATIO, MOCK_RENDER_JITTER_RATIO)
+        mock.tasks[task_id] = (pageId, time.monotonic(), mock.render_seconds * jitter)
+        body = f'<html><head><meta name="ajs-taskId" content="{task_id}"></head><body>Exportando...</body></html>'
+        mock.bytes_sent += len(body)
+        return HTMLResponse(body)
+
+    @app.get("/services/api/v1/task/{task_id}/progress")
+    def task_progress(task_id: str):
+        if task_id not in mock.tasks:
+            return JSONResponse({"message": "Task not found"}, status_code=404)
+        _, started_at, render_seconds = mock.tasks[task_id]
+        elapsed = time.monotonic() - started_at
+        if elapsed < render_seconds:
+            return {"progress": int(100 * elapsed / render_seconds), "state": "RUNNING"}
+        return {"progress": 100, "state": "COMPLETED", "result": f"/services/api/v1/task/{task_id}/result"}
+
+    @app.get("/services/api/v1/task/{task_id}/result")
+    def task_result(task_id: str, request: Request):
+        if task_id not in mock.tasks:
+            return PlainTextResponse("Task not found", status_code=404)
+        return PlainTextResponse(f"{str(request.base_url).rstrip('/')}/download/{task_id}.pdf")
+
+    @app.get("/download/{task_id}.pdf")
+    def pdf_download(task_id: str, request: Request):
+        if task_id not in mock.tasks:
+            return PlainTextResponse("Not found", status_code=404)
+        total = len(mock.pdf_content)
+        headers = {"ETag": mock.pdf_etag, "Accept-Ranges": "bytes"}
+        start, status_code = 0, 200
+        requested_range = re.fullmatch(r"bytes=(\d+)-", request.headers.get("range", ""))
+        if requested_range and request.headers.get("if-range", mock.pdf_etag) == mock.pdf_etag:
+            start, status_code = int(requested_range.group(1)), 206
+            if start >= total:
+                return PlainTextResponse("", status_code=416, headers={"Content-Range": f"bytes */{total}"})
+            headers["Content-Range"] = f"bytes {start}-{total - 1}/{total}"
+        headers["Content-Length"] = str(total - start)
+        # Una descarga cortada envía la mitad de lo que falta y cierra la conexión
+        end = start + (total - start) // 2 if mock.rng.random() < mock.cut_rate else total
+        if end < total:
+            mock.injected_errors["pdf_download"] += 1
+
+        def chunks():
+            for offset in range(start, end, MOCK_PDF_CHUNK_BYTES):
+                chunk = mock.pdf_content[offset:min(offset + MOCK_PDF_CHUNK_BYTES, end)]
+                mock.bytes_sent += len(chunk)
+                yield chunk
+
+        return StreamingResponse(chunks(), status_code=status_code, media_type="application/pdf", headers=headers)
+
+    @app.get("/__stats")
+    def stats():
+        return mock.stats()
+
+    @app.post("/__reset")
+    def reset():
+        mock.reset_stats()
+        return {"ok": True}
+
+    return app
+
+def add_mock_arguments(parser):
+    """Opciones del servidor simulado; las comparten este script y run_benchmarks.py."""
+    parser.add_argument("--raices", type=int, default=MOCK_ROOTS, help=f"Páginas raíz del espacio (por defecto: {MOCK_ROOTS})")
+    parser.add_argument("--ramificacion", type=int, default=MOCK_BRANCHING, help=f"Hijos por página (por defecto: {MOCK_BRANCHING})")
+    parser.add_argument("--profundidad", type=int, default=MOCK_DEPTH, help=f"Niveles bajo las raíces (por defecto: {MOCK_DEPTH})")
+    parser.add_argument("--forma", choices=MOCK_TREE_SHAPES, default="uniforme", help="Forma del árbol (por defecto: uniforme)")
+    parser.add_argument("--latencia-ms", type=float, default=MOCK_LATENCY_MS, help=f"Latencia por petición (por defecto: {MOCK_LATENCY_MS})")
+    parser.add_argument("--render-s", type=float, default=MOCK_RENDER_SECONDS, help=f"Segundos de render por PDF (por defecto: {MOCK_RENDER_SECONDS})")
+    parser.add_argument("--tasa-errores", type=float, default=MOCK_ERROR_RATE, help="Fracción de peticiones que fallan con 500")
+    parser.add_argument("--tasa-429", type=float, default=MOCK_RATE_LIMIT_RATE, help="Fracción de peticiones que reciben 429")
+    parser.add_argument("--pdf-bytes", type=int, default=MOCK_PDF_BYTES, help=f"Tamaño de cada PDF (por defecto: {MOCK_PDF_BYTES})")
+    parser.add_argument("--tasa-cortes", type=float, default=MOCK_CUT_RATE,
+                        help="Fracción de descargas de PDF que se cortan a mitad")
+    parser.add_argument("--semilla", type=int, default=0, help="Semilla para el árbol aleatorio, la latencia y los errores")
+
+def mock_from_args(args):
+    return MockConfluence(args.raices, args.ramificacion, args.profundidad, args.forma, args.latencia_ms, args.render_s,
+                          args.tasa_errores, args.tasa_429, args.pdf_bytes, args.semilla, cut_rate=args.tasa_cortes)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor que imita la API de Confluence usada por create_pdf.py.")
+    parser.add_argument("--host", default=MOCK_HOST, help=f"Dirección de escucha (por defecto: {MOCK_HOST})")
+    parser.add_argument("--port", type=int, default=MOCK_PORT, help=f"Puerto (por defecto: {MOCK_PORT})")
+    add_mock_arguments(parser)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    mock = mock_from_args(args)
+    print(f"Confluence simulado con {len(mock.pages)} páginas en http://{args.host}:{args.port} (estadísticas en /__stats)")
+    import uvicorn # Importación diferida: solo hace falta para arrancar el servidor
+    uvicorn.run(create_app(mock), host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
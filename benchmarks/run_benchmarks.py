@@ -0,0 +1,187 @@
+import argparse # Para la interfaz de línea de comandos
+import contextlib
+import io
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+# Los benchmarks se ejecutan como `python benchmarks/run_benchmarks.py` desde la raíz del repositorio
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import create_pdf # El código que se mide, sin modificar
+from mock_confluence_server import add_mock_arguments, create_app, mock_from_args
+
+# --- CONFIGURACIÓN ---
+BENCH_HOST = "127.0.0.1"
+BENCH_SPACE_KEY = "BENCH"
+BENCH_SCENARIOS = ("crawl", "export", "markdown")
+# Páginas exportadas como máximo en los escenarios "export" y "markdown" (las primeras del árbol en orden BFS)
+BENCH_EXPORT_PAGES = 40
+BENCH_REPETITIONS = 1
+
+class BackgroundServer:
+    """Servidor uvicorn en un hilo del mismo proceso, en un puerto libre."""
+    def __init__(self, app, host=BENCH_HOST):
+        import uvicorn # Importación diferida, como en el resto de servidores del repositorio
+        self.server = uvicorn.Server(uvicorn.Config(app, host=host, port=0, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, name="mock-confluence", daemon=True)
+        self.host = host
+
+    def __enter__(self):
+        self.thread.start()
+        while not self.server.started:
+            if not self.thread.is_alive():
+                raise RuntimeError("No se pudo arrancar el servidor simulado.")
+            time.sleep(0.05)
+        port = self.server.servers[0].sockets[0].getsockname()[1]
+        self.base_url = f"http://{self.host}:{port}"
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+def create_session(args):
+    return create_pdf.create_confluence_session({'user': 'bench', 'token': 'bench'}, args.max_requests_per_host,
+                                                max(args.export_concurrency, args.crawl_workers),
+                                                args.max_requests_per_second, args.max_retries)
+
+def run_crawl(base_url, mock, args):
+    """Lista las páginas raíz y recorre el árbol como create_pdf.main()."""
+    session = create_session(args)
+    mock.reset_stats()
+    started_at = time.perf_counter()
+    root_pages = create_pdf.get_all_pages_in_space(session, base_url, BENCH_SPACE_KEY, limit=create_pdf.CRAWL_REQUEST_LIMIT) or []
+    failed_parents = set()
+    children_by_parent = create_pdf.crawl_page_tree(session, root_pages, base_url, BENCH_SPACE_KEY,
+                                                    max_workers=args.crawl_workers, crawl_mode=args.crawl_mode,
+                                                    failed_parents=failed_parents)
+    seconds = time.perf_counter() - started_at
+    found = {page['id'] for page in root_pages}
+    for children in children_by_parent.values():
+        found.update(child['id'] for child in children)
+    return {
+        "paginas": len(found),
+        "paginas_esperadas": len(mock.pages),
+        "ramas_fallidas": len(failed_parents),
+        "segundos": seconds,
+        "paginas_min": 60 * len(found) / seconds if seconds else 0.0,
+        **mock.stats(),
+    }
+
+def run_export(base_url, mock, args):
+    """Exporta a PDF las primeras `--paginas-export` páginas con export_pages_concurrently."""
+    page_ids = list(mock.pages)[:args.paginas_export] if args.paginas_export else list(mock.pages)
+    pages_to_export = {page_id: f"{mock.pages[page_id][1]} ({page_id})" for page_id in page_ids}
+    session = create_session(args)
+    mock.reset_stats()
+    with tempfile.TemporaryDirectory(prefix="bench-export-") as output_dir:
+        started_at = time.perf_counter()
+        successful, failed = create_pdf.export_pages_concurrently(session, pages_to_export, base_url, output_dir,
+                                                                  args.export_concurrency)
+        seconds = time.perf_counter() - started_at
+    stats = mock.stats()
+    return {
+        "paginas": successful,
+        "fallidas": failed,
+        "paginas_esperadas": len(pages_to_export),
+        "segundos": seconds,
+        "paginas_min": 60 * successful / seconds if seconds else 0.0,
+        "polls_por_pagina": round(stats["requests"].get("task_progress", 0) / max(1, len(pages_to_export)), 2),
+        "mb_s": stats["bytes_sent"] / 1024 ** 2 / seconds if seconds else 0.0,
+        **stats,
+    }
+
+def run_markdown(base_url, mock, args):
+    """Exporta las mismas páginas que 'export' como markdown (contenido en bloque) con export_pages_as_markdown."""
+    page_ids = list(mock.pages)[:args.paginas_export] if args.paginas_export else list(mock.pages)
+    pages_to_export = {page_id: f"{mock.pages[page_id][1]} ({page_id})" for page_id in page_ids}
+    session = create_session(args)
+    mock.reset_stats()
+    with tempfile.TemporaryDirectory(prefix="bench-markdown-") as output_dir:
+        started_at = time.perf_counter()
+        successful, failed = create_pdf.export_pages_as_markdown(session, pages_to_export, base_url, output_dir,
+                                                                 args.export_concurrency)
+        seconds = time.perf_counter() - started_at
+    stats = mock.stats()
+    return {
+        "paginas": successful,
+        "fallidas": failed,
+        "paginas_esperadas": len(pages_to_export),
+        "segundos": seconds,
+        "paginas_min": 60 * successful / seconds if seconds else 0.0,
+        "polls_por_pagina": round(stats["requests"].get("task_progress", 0) / max(1, len(pages_to_export)), 2),
+        "mb_s": stats["bytes_sent"] / 1024 ** 2 / seconds if seconds else 0.0,
+        **stats,
+    }
+
+RUNNERS = {"crawl": run_crawl, "export": run_export, "markdown": run_markdown}
+
+def print_result(scenario, repetition, result):
+    extra = f" fallidas={result['fallidas']} polls/página={result['polls_por_pagina']} MB/s={result['mb_s']:.2f}" if scenario in ("export", "markdown") else ""
+    print(f"[{scenario} #{repetition}] páginas={result['paginas']}/{result['paginas_esperadas']} "
+          f"tiempo={result['segundos']:.2f}s páginas/min={result['paginas_min']:.0f} "
+          f"peticiones={result['total_requests']}{extra}")
+    for endpoint, count in sorted(result["requests"].items()):
+        errors = result["injected_errors"].get(endpoint, 0)
+        print(f"    {endpoint:<16} {count:>7} peticiones" + (f" ({errors} errores inyectados)" if errors else ""))
+    if result.get('ramas_fallidas'):
+        print(f"    Páginas cuyos hijos no se pudieron obtener: {result['ramas_fallidas']}")
+    if result['paginas'] < result['paginas_esperadas']:
+        print(f"    Atención: faltan {result['paginas_esperadas'] - result['paginas']} páginas.")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Mide el recorrido del árbol y la exportación a PDF o markdown de create_pdf.py contra un Confluence simulado.")
+    parser.add_argument("--escenarios", nargs="+", choices=BENCH_SCENARIOS, default=list(BENCH_SCENARIOS),
+                        help="Escenarios a ejecutar (por defecto: todos)")
+    parser.add_argument("--repeticiones", type=int, default=BENCH_REPETITIONS, help="Ejecuciones de cada escenario")
+    parser.add_argument("--paginas-export", type=int, default=BENCH_EXPORT_PAGES,
+                        help=f"Páginas exportadas en los escenarios 'export' y 'markdown' (0 = todas; por defecto: {BENCH_EXPORT_PAGES})")
+    parser.add_argument("--crawl-workers", type=int, default=create_pdf.DEFAULT_CRAWL_WORKERS, help="Hilos del recorrido del árbol")
+    parser.add_argument("--crawl-mode", choices=["bfs", "cql"], default="bfs", help="Recorrido del árbol (por defecto: bfs)")
+    parser.add_argument("--export-concurrency", type=int, default=create_pdf.DEFAULT_EXPORT_CONCURRENCY, help="Exportaciones simultáneas")
+    parser.add_argument("--max-requests-per-host", type=int, default=create_pdf.DEFAULT_MAX_REQUESTS_PER_HOST,
+                        help="Peticiones simultáneas como máximo contra el servidor")
+    parser.add_argument("--max-requests-per-second", type=float, default=0,
+                        help="Ritmo máximo de peticiones por segundo contra el servidor (por defecto: 0 = sin límite)")
+    parser.add_argument("--max-retries", type=int, default=create_pdf.HTTP_MAX_RETRIES,
+                        help="Reintentos de cada petición ante errores 5xx, 429 y timeouts")
+    parser.add_argument("--salida-json", help="Añadir los resultados (uno por línea) a este archivo JSONL para comparar ejecuciones")
+    parser.add_argument("--verbose", action="store_true", help="Mostrar los logs y mensajes de create_pdf.py")
+    add_mock_arguments(parser)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.CRITICAL)
+    mock = mock_from_args(args)
+    print(f"Confluence simulado: {len(mock.pages)} páginas (forma {args.forma}), latencia {args.latencia_ms} ms, "
+          f"render {args.render_s} s, errores {args.tasa_errores:.0%}, 429 {args.tasa_429:.0%}, cortes {args.tasa_cortes:.0%}")
+    results = []
+    with BackgroundServer(create_app(mock)) as server:
+        for scenario in args.escenarios:
+            durations = []
+            for repetition in range(1, max(1, args.repeticiones) + 1):
+                # create_pdf imprime el progreso de cada página; solo se muestra con --verbose
+                with contextlib.redirect_stdout(sys.stdout if args.verbose else io.StringIO()):
+                    result = RUNNERS[scenario](server.base_url, mock, args)
+                print_result(scenario, repetition, result)
+                durations.append(result["segundos"])
+                results.append({"escenario": scenario, "repeticion": repetition, "ts": time.time(),
+                                "parametros": {key: value for key, value in vars(args).items() if key != "salida_json"}, **result})
+            if len(durations) > 1:
+                print(f"[{scenario}] mediana {statistics.median(durations):.2f}s (mín. {min(durations):.2f}s, máx. {max(durations):.2f}s)")
+
+    if args.salida_json:
+        with open(args.salida_json, 'a', encoding='utf-8') as f:
+            for result in results:
+                f.write(json.dumps(result, ensure_ascii=False) + "\n")
+        print(f"Resultados añadidos a '{args.salida_json}'.")
+
+if __name__ == "__main__":
+    main()
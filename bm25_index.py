@@ -0,0 +1,217 @@
+import math
+import os
+import re
+import sqlite3 # Índice invertido persistente sin dependencias nuevas
+import threading
+from collections import Counter
+
+from export_chromadb_data import iterar_lotes # Lectura de la colección por lotes con limit/offset
+
+# --- CONFIGURACIÓN ---
+# Archivo SQLite del índice BM25; contiene los mismos IDs de fragmento que la colección de ChromaDB
+BM25_INDEX_PATH = "./indice_bm25.sqlite3"
+# Parámetros de BM25
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Fragmentos leídos de la colección por lote al reconstruir el índice
+BM25_REBUILD_BATCH_SIZE = 1000
+# Al buscar, los candidatos salen solo de las listas de postings de los términos que aparecen en como
+# mucho esta fracción de los fragmentos; los más frecuentes (las listas más largas) siguen puntuando,
+# pero solo se leen para esos candidatos. Si todos los términos la superan, todos aportan candidatos.
+BM25_MAX_DF_RATIO = 0.5
+# Con menos fragmentos que estos todos los términos aportan candidatos: las listas son cortas
+BM25_DF_CAP_MIN_FRAGMENTS = 1000
+# IDs de candidatos por consulta al leer los postings de los términos frecuentes
+BM25_CANDIDATES_BATCH_SIZE = 500
+# Palabras vacías (español e inglés) que no se indexan ni se buscan
+BM25_STOPWORDS = frozenset("""
+    a al algo algunas algunos ante antes como con contra cual cuando de del desde donde durante e el ella ellas
+    ellos en entre era es esa esas ese eso esos esta estaba estas este esto estos fue ha han hay la las le les lo
+    los mas me mi mis muy ni no nos o os otra otras otro otros para pero por porque que quien se sea ser si sin
+    sobre son su sus tambien también te tiene todo todos tu un una uno unos y ya
+    and are as at be by for from has have in is it its of on or that the this to was were will with
+""".split())
+# Versión de tokenizar(); al cambiarla, el índice se vacía al abrirlo para escribir y se reconstruye
+BM25_TOKENIZER_VERSION = 2
+
+# Palabras y también identificadores con guiones, puntos o barras bajas (PROJ-1234, 0x80070005, E_ACCESSDENIED)
+_TOKEN_RE = re.compile(r'\w+(?:[-.:/]\w+)*')
+_PARTES_RE = re.compile(r'[-.:/_]')
+
+def tokenizar(texto):
+    """
+    Devuelve los términos de un texto en minúsculas, sin palabras vacías. Un identificador compuesto
+    como 'PROJ-1234' produce el término completo y también sus partes ('proj', '1234').
+    """
+    terminos = []
+    for token in _TOKEN_RE.findall(texto.lower()):
+        if token not in BM25_STOPWORDS:
+            terminos.append(token)
+        partes = [parte for parte in _PARTES_RE.split(token) if parte]
+        if len(partes) > 1:
+            terminos.extend(parte for parte in partes if parte not in BM25_STOPWORDS)
+    return terminos
+
+class IndiceBM25:
+    """
+    Índice invertido en SQLite con puntuación BM25. Se actualiza de forma incremental:
+    `anadir` sustituye los fragmentos con el mismo ID (como upsert) y `borrar` los quita.
+    Se puede usar desde varios hilos a la vez.
+    """
+    def __init__(self, ruta=BM25_INDEX_PATH, collection_name=None):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        self._conexion = sqlite3.connect(ruta, check_same_thread=False)
+        self._conexion.execute("PRAGMA journal_mode=WAL")
+        self._conexion.execute("PRAGMA synchronous=NORMAL")
+        self._conexion.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (clave TEXT PRIMARY KEY, valor TEXT);
+            CREATE TABLE IF NOT EXISTS fragmentos (id TEXT PRIMARY KEY, longitud INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS postings (
+                termino TEXT NOT NULL, id TEXT NOT NULL, tf INTEGER NOT NULL, PRIMARY KEY (termino, id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS postings_por_id ON postings (id);
+        """)
+        if collection_name is not None:
+            coleccion_del_indice = self._meta("collection")
+            if coleccion_del_indice not in (None, collection_name):
+                # El índice era de otra colección: se empieza de cero
+                self._vaciar_tablas()
+            if self._meta("tokenizador") != str(BM25_TOKENIZER_VERSION):
+                # Creado con otra versión de tokenizar(): se vacía para que abrir_indice_bm25 lo reconstruya
+                self._vaciar_tablas()
+                self._guardar_meta("tokenizador", BM25_TOKENIZER_VERSION)
+            self._guardar_meta("collection", collection_name)
+            self._conexion.commit()
+
+    def _meta(self, clave, defecto=None):
+        fila = self._conexion.execute("SELECT valor FROM meta WHERE clave = ?", (clave,)).fetchone()
+        return fila[0] if fila else defecto
+
+    def _guardar_meta(self, clave, valor):
+        self._conexion.execute("INSERT OR REPLACE INTO meta (clave, valor) VALUES (?, ?)", (clave, str(valor)))
+
+    def _vaciar_tablas(self):
+        self._conexion.executescript("DELETE FROM postings; DELETE FROM fragmentos; DELETE FROM meta WHERE clave NOT IN ('collection', 'tokenizador');")
+
+    def _estadisticas(self):
+        return int(self._meta("n_fragmentos", 0)), int(self._meta("longitud_total", 0))
+
+    def _borrar_sin_commit(self, ids):
+        n_fragmentos, longitud_total = self._estadisticas()
+        for inicio in range(0, len(ids), 500): # SQLite limita el número de parámetros por consulta
+            lote = ids[inicio:inicio + 500]
+            marcas = ",".join("?" * len(lote))
+            filas = self._conexion.execute(f"SELECT COUNT(*), COALESCE(SUM(longitud), 0) FROM fragmentos WHERE id IN ({marcas})", lote).fetchone()
+            n_fragmentos -= filas[0]
+            longitud_total -= filas[1]
+            self._conexion.execute(f"DELETE FROM postings WHERE id IN ({marcas})", lote)
+            self._conexion.execute(f"DELETE FROM fragmentos WHERE id IN ({marcas})", lote)
+        self._guardar_meta("n_fragmentos", n_fragmentos)
+        self._guardar_meta("longitud_total", longitud_total)
+
+    def anadir(self, fragmentos):
+        """Indexa una lista de tuplas (id, texto), sustituyendo las versiones anteriores de esos IDs."""
+        fragmentos = list(fragmentos)
+        if not fragmentos:
+            return
+        with self._lock:
+            self._borrar_sin_commit([id_fragmento for id_fragmento, _ in fragmentos])
+            n_fragmentos, longitud_total = self._estadisticas()
+            for id_fragmento, texto in fragmentos:
+                terminos = tokenizar(texto or "")
+                self._conexion.execute("INSERT OR REPLACE INTO fragmentos (id, longitud) VALUES (?, ?)", (id_fragmento, len(terminos)))
+                self._conexion.executemany(
+                    "INSERT OR REPLACE INTO postings (termino, id, tf) VALUES (?, ?, ?)",
+                    [(termino, id_fragmento, tf) for termino, tf in Counter(terminos).items()],
+                )
+                n_fragmentos += 1
+                longitud_total += len(terminos)
+            self._guardar_meta("n_fragmentos", n_fragmentos)
+            self._guardar_meta("longitud_total", longitud_total)
+            self._conexion.commit()
+
+    def borrar(self, ids):
+        ids = list(ids)
+        if not ids:
+            return
+        with self._lock:
+            self._borrar_sin_commit(ids)
+            self._conexion.commit()
+
+    def vaciar(self):
+        with self._lock:
+            self._vaciar_tablas()
+            self._conexion.commit()
+
+    def coleccion(self):
+        with self._lock:
+            return self._meta("collection")
+
+    def contar(self):
+        with self._lock:
+            return self._estadisticas()[0]
+
+    def buscar(self, consulta, k=10):
+        """
+        Devuelve hasta `k` tuplas (id, puntuación BM25) ordenadas de mayor a menor puntuación.
+        Solo se leen las listas de postings de los términos de la consulta; las de los que superan
+        BM25_MAX_DF_RATIO, solo para los fragmentos que contienen alguno de los demás.
+        """
+        terminos = sorted(set(tokenizar(consulta)))
+        if not terminos:
+            return []
+        with self._lock:
+            n_fragmentos, longitud_total = self._estadisticas()
+            if not n_fragmentos:
+                return []
+            longitud_media = longitud_total / n_fragmentos
+            marcas = ",".join("?" * len(terminos))
+            frecuencias = dict(self._conexion.execute(
+                f"SELECT termino, COUNT(*) FROM postings WHERE termino IN ({marcas}) GROUP BY termino", terminos
+            ).fetchall())
+            if not frecuencias:
+                return []
+            terminos = list(frecuencias)
+            if n_fragmentos >= BM25_DF_CAP_MIN_FRAGMENTS:
+                terminos = [termino for termino in frecuencias if frecuencias[termino] <= BM25_MAX_DF_RATIO * n_fragmentos] or terminos
+            frecuentes = [termino for termino in frecuencias if termino not in terminos]
+            marcas = ",".join("?" * len(terminos))
+            filas = self._conexion.execute(
+                f"SELECT p.id, p.termino, p.tf, f.longitud FROM postings p JOIN fragmentos f ON f.id = p.id WHERE p.termino IN ({marcas})",
+                terminos,
+            ).fetchall()
+            if frecuentes:
+                candidatos = sorted({fila[0] for fila in filas})
+                marcas_frecuentes = ",".join("?" * len(frecuentes))
+                for inicio in range(0, len(candidatos), BM25_CANDIDATES_BATCH_SIZE):
+                    lote = candidatos[inicio:inicio + BM25_CANDIDATES_BATCH_SIZE]
+                    filas.extend(self._conexion.execute(
+                        f"SELECT p.id, p.termino, p.tf, f.longitud FROM postings p JOIN fragmentos f ON f.id = p.id "
+                        f"WHERE p.termino IN ({marcas_frecuentes}) AND p.id IN ({','.join('?' * len(lote))})",
+                        frecuentes + lote,
+                    ).fetchall())
+        puntuaciones = {}
+        for id_fragmento, termino, tf, longitud in filas:
+            df = frecuencias[termino]
+            idf = math.log(1 + (n_fragmentos - df + 0.5) / (df + 0.5))
+            normalizacion = tf + BM25_K1 * (1 - BM25_B + BM25_B * longitud / longitud_media)
+            puntuaciones[id_fragmento] = puntuaciones.get(id_fragmento, 0.0) + idf * tf * (BM25_K1 + 1) / normalizacion
+        return sorted(puntuaciones.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def reconstruir_desde_coleccion(self, collection, tamano_lote=BM25_REBUILD_BATCH_SIZE):
+        """Vacía el índice y lo vuelve a llenar con los fragmentos que ya están en la colección."""
+        self.vaciar()
+        for data in iterar_lotes(collection, ['documents'], tamano_lote):
+            self.anadir(zip(data['ids'], data['documents']))
+        return self.contar()
+
+    def cerrar(self):
+        with self._lock:
+            self._conexion.close()
+
+def borrar_archivo_indice(ruta=BM25_INDEX_PATH):
+    """Elimina el archivo del índice (y los de WAL de SQLite) si existen."""
+    for sufijo in ("", "-wal", "-shm"):
+        if os.path.exists(ruta + sufijo):
+            os.remove(ruta + sufijo)
@@ -1,46 +1,329 @@
 import requests
+import argparse # Para la interfaz de línea de comandos
 import logging
 import sys
 import os
 import re # Para sanitizar nombres de archivo
 import time # Para el polling
+import random # Para el jitter del polling
+import math # Para validar números leídos del entorno
+from email.utils import parsedate_to_datetime # Para interpretar cabeceras Retry-After con fecha
 import json # Para parsear respuestas de API
+import hashlib # Para el hash de contenido del manifiesto incremental
+import threading # Para limitar peticiones concurrentes por host
+from concurrent.futures import ThreadPoolExecutor, as_completed # Para exportaciones concurrentes
 from dotenv import load_dotenv
 import urllib3 # Para parse_url
 from requests.auth import HTTPBasicAuth
-from bs4 import BeautifulSoup 
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry # Reintentos con backoff en el adaptador HTTP
+import codecs # Para decodificar HTML en streaming
+from html.parser import HTMLParser # Para buscar meta etiquetas sin construir un árbol DOM
+from storage_to_markdown import storage_to_markdown # Conversión del contenido de las páginas a markdown
+import instrumentation # Tiempos por etapa y contadores compartidos con los scripts de ingesta
+from instrumentation import metricas
 
-# --- BEGIN LOGGING CONFIGURATION (File and Console) ---
 LOG_FILENAME = 'confluence_script_direct_pdf_debug.log'
-logging.getLogger().setLevel(logging.DEBUG)
-
-# Configuración del FileHandler
-fh = logging.FileHandler(LOG_FILENAME, mode='w', encoding='utf-8')
-fh.setLevel(logging.DEBUG)
-file_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(lineno)d - %(message)s')
-fh.setFormatter(file_formatter)
-logging.getLogger().addHandler(fh)
-
-# Configuración del StreamHandler (consola)
-ch = logging.StreamHandler(sys.stdout)
-ch.setLevel(logging.INFO) # Mostrar INFO y superior en consola
-console_formatter = logging.Formatter('%(levelname)s:%(name)s:%(message)s')
-ch.setFormatter(console_formatter)
-logging.getLogger().addHandler(ch)
-# --- END LOGGING CONFIGURATION ---
-
-logging.info(f"Los logs de depuración se están escribiendo en: {LOG_FILENAME}")
-logging.info("La consola mostrará mensajes de nivel INFO y superiores.")
-
-if hasattr(urllib3, 'disable_warnings') and hasattr(urllib3.exceptions, 'InsecureRequestWarning'):
-    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-    logging.info("Advertencia InsecureRequestWarning para urllib3 deshabilitada.")
+LOG_LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR")
+DEFAULT_LOG_LEVEL = "INFO" # Nivel del archivo de log; con DEBUG se vuelcan también los cuerpos de las respuestas
+
+def configure_logging(log_filename=LOG_FILENAME, log_level=DEFAULT_LOG_LEVEL):
+    """
+    Configura el log a archivo (`log_level`) y a consola (INFO). Se llama desde main() y no al importar
+    el módulo, para que importarlo no cree el archivo de log ni añada handlers.
+    Los volcados de DEBUG solo se construyen si el nivel DEBUG está activo.
+    """
+    file_level = getattr(logging, log_level.upper(), logging.INFO)
+    logging.getLogger().setLevel(min(file_level, logging.INFO))
+
+    # Configuración del FileHandler
+    fh = logging.FileHandler(log_filename, mode='w', encoding='utf-8')
+    fh.setLevel(file_level)
+    file_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(lineno)d - %(message)s')
+    fh.setFormatter(file_formatter)
+    logging.getLogger().addHandler(fh)
+
+    # Configuración del StreamHandler (consola)
+    ch = logging.StreamHandler(sys.stdout)
+    ch.setLevel(logging.INFO) # Mostrar INFO y superior en consola
+    console_formatter = logging.Formatter('%(levelname)s:%(name)s:%(message)s')
+    ch.setFormatter(console_formatter)
+    logging.getLogger().addHandler(ch)
+
+    logging.info(f"Los logs (nivel {logging.getLevelName(file_level)}) se están escribiendo en: {log_filename}")
+    logging.info("La consola mostrará mensajes de nivel INFO y superiores.")
+
+    if hasattr(urllib3, 'disable_warnings') and hasattr(urllib3.exceptions, 'InsecureRequestWarning'):
+        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+        logging.info("Advertencia InsecureRequestWarning para urllib3 deshabilitada.")
 
 # Constantes de configuración
 DEFAULT_REQUEST_LIMIT = 25
+CRAWL_REQUEST_LIMIT = 200 # Tamaño de página máximo que aceptan las APIs de listado; el servidor lo recorta si es menor
+DEFAULT_CRAWL_WORKERS = 8 # Hilos para pedir en paralelo los hijos de un nivel del árbol
 DEFAULT_REQUEST_TIMEOUT = 180 
-POLLING_INTERVAL_SECONDS = 10 
-MAX_POLLING_ATTEMPTS = 30 
+POLL_INITIAL_INTERVAL_SECONDS = 0.5 # Primer intervalo de polling; los siguientes crecen exponencialmente
+POLL_MAX_INTERVAL_SECONDS = 15 # Intervalo máximo entre polls
+POLL_BACKOFF_FACTOR = 1.6
+POLL_JITTER_RATIO = 0.2 # +/-20% de variación aleatoria para no sincronizar los polls
+EXPORT_DEADLINE_SECONDS = 30 * 60 # Plazo total por exportación en lugar de un número fijo de intentos
+META_SCAN_CHUNK_SIZE = 16 * 1024 # Bytes leídos por iteración al buscar una meta etiqueta en streaming
+META_SCAN_PREVIEW_CHARS = 4000 # Caracteres de la página que se conservan para diagnóstico
+EXPORT_MANIFEST_FILENAME = ".confluence_export_manifest.json" # Manifiesto de la sincronización incremental
+MANIFEST_SAVE_EVERY = 25 # Guardar el manifiesto cada N PDFs descargados
+DEFAULT_EXPORT_CONCURRENCY = 8 # Tareas de exportación a PDF en curso simultáneamente
+DEFAULT_MAX_REQUESTS_PER_HOST = 4 # Peticiones HTTP simultáneas como máximo contra un mismo host
+DEFAULT_MAX_REQUESTS_PER_SECOND = 10 # Ritmo medio máximo de peticiones por host (token bucket); 0 = sin límite
+HTTP_MAX_RETRIES = 5 # Reintentos por petición ante errores 5xx, 429, de conexión y timeouts
+HTTP_BACKOFF_FACTOR = 1.0 # Espera antes del reintento n: factor * 2^(n-1) segundos, o lo que indique Retry-After
+HTTP_BACKOFF_MAX_SECONDS = 120 # Espera máxima entre reintentos cuando no hay Retry-After
+HTTP_RETRY_STATUSES = (429, 500, 502, 503, 504)
+HTTP_RETRY_METHODS = frozenset(['GET', 'HEAD']) # Solo se reintentan las peticiones idempotentes
+# El polling del progreso gestiona los 429 con su propio planificador (Retry-After + backoff del poll)
+POLL_RETRY_STATUSES = tuple(status for status in HTTP_RETRY_STATUSES if status != 429)
+CHECKPOINT_FILENAME = ".confluence_export_checkpoint.json" # Estado del recorrido y la exportación para reanudar
+CHECKPOINT_SAVE_EVERY = 10 # Guardar el checkpoint cada N páginas exportadas o fallidas
+CHECKPOINT_MAX_AGE_HOURS = 24 # Un checkpoint más antiguo se descarta y se empieza desde cero
+CHECKPOINT_MAX_PAGE_ATTEMPTS = 3 # Ejecuciones que falla una página antes de dejar de reintentarla desde el checkpoint
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024 # Búfer de escritura en disco al descargar el PDF final
+DOWNLOAD_READ_SIZE = 64 * 1024 # Bytes por lectura de la red (lo que se pierde como mucho si se corta la conexión)
+DOWNLOAD_RESUME_ATTEMPTS = 3 # Reanudaciones seguidas sin recibir datos nuevos antes de dar la descarga por fallida
+PARTIAL_DOWNLOAD_SUFFIX = ".part" # El PDF se descarga en '<nombre>.pdf.part' y se renombra al terminar
+# Formato de exportación: 'pdf' (Confluence renderiza cada página) o 'markdown' (el contenido de la página
+# pedido en bloque por la API REST y convertido a markdown, mucho más rápido para indexar)
+EXPORT_FORMATS = ("pdf", "markdown")
+EXPORT_FILE_EXTENSIONS = {"pdf": ".pdf", "markdown": ".md"}
+BODY_REPRESENTATIONS = ("storage", "view") # body.storage (XHTML de almacenamiento) o body.view (HTML renderizado)
+BODY_BATCH_SIZE = 25 # Páginas por búsqueda CQL al pedir su contenido en bloque
+
+class CountingRetry(Retry):
+    """Retry de urllib3 que cuenta cada reintento en las métricas."""
+    def increment(self, *args, **kwargs):
+        metricas.contar("reintentos_http")
+        return super().increment(*args, **kwargs)
+
+def build_retry(max_retries=HTTP_MAX_RETRIES, backoff_factor=HTTP_BACKOFF_FACTOR):
+    """
+    Reintentos de urllib3 para la sesión de descarga final (fuera del wiki): peticiones idempotentes
+    ante errores de conexión, timeouts y las respuestas de HTTP_RETRY_STATUSES, respetando Retry-After.
+    Si se agotan, se devuelve la última respuesta y raise_for_status() del llamante decide.
+    HostLimitedSession no los usa: reintenta en request() para pasar cada intento por sus límites.
+    """
+    return CountingRetry(
+        total=max_retries, connect=max_retries, read=max_retries, status=max_retries,
+        backoff_factor=backoff_factor, status_forcelist=HTTP_RETRY_STATUSES,
+        allowed_methods=HTTP_RETRY_METHODS, respect_retry_after_header=True, raise_on_status=False,
+    )
+
+class TokenBucket:
+    """
+    Limitador de ritmo: de media `rate` peticiones por segundo, con ráfagas de hasta `capacity`.
+    Se puede usar desde varios hilos a la vez.
+    """
+    def __init__(self, rate, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.clock = clock
+        self.sleep = sleep
+        self._tokens = self.capacity
+        self._updated_at = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Espera hasta que haya un token disponible y lo consume. Devuelve los segundos esperados."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = self.clock()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                wait = (1 - self._tokens) / self.rate
+            self.sleep(wait)
+            waited += wait
+
+class HostLimitedSession(requests.Session):
+    """
+    Sesión de requests compartida por todas las peticiones al wiki:
+    - pool de conexiones reutilizadas (`pool_maxsize` por host);
+    - ritmo máximo por host con un token bucket (`max_requests_per_second`, 0 = sin límite);
+    - número máximo de peticiones simultáneas por host. Permite tener muchas tareas de exportación
+      en curso sin saturar el wiki: las esperas entre polls no ocupan ningún hueco, solo las peticiones en vuelo;
+    - reintentos de GET/HEAD con backoff exponencial ante errores de conexión, timeouts y `retry_statuses`
+      (por defecto HTTP_RETRY_STATUSES), respetando Retry-After. Cada intento consume un token y ocupa
+      un hueco del host, y las esperas entre intentos se hacen sin ocupar ninguno.
+    """
+    def __init__(self, max_requests_per_host=DEFAULT_MAX_REQUESTS_PER_HOST, pool_maxsize=DEFAULT_EXPORT_CONCURRENCY,
+                 max_requests_per_second=DEFAULT_MAX_REQUESTS_PER_SECOND, max_retries=HTTP_MAX_RETRIES,
+                 backoff_factor=HTTP_BACKOFF_FACTOR):
+        super().__init__()
+        self.max_requests_per_host = max(1, max_requests_per_host)
+        self.max_requests_per_second = max_requests_per_second
+        self.max_retries = max(0, max_retries)
+        self.backoff_factor = backoff_factor
+        self._host_semaphores = {}
+        self._host_buckets = {}
+        self._host_semaphores_lock = threading.Lock()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(pool_maxsize, self.max_requests_per_host))
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+
+    def _limits_for(self, url):
+        host = urllib3.util.parse_url(url).host or ''
+        with self._host_semaphores_lock:
+            if host not in self._host_semaphores:
+                self._host_semaphores[host] = threading.BoundedSemaphore(self.max_requests_per_host)
+                self._host_buckets[host] = TokenBucket(self.max_requests_per_second) if self.max_requests_per_second else None
+            return self._host_semaphores[host], self._host_buckets[host]
+
+    def _backoff(self, attempt):
+        return min(HTTP_BACKOFF_MAX_SECONDS, self.backoff_factor * (2 ** attempt))
+
+    def request(self, method, url, *args, retry_statuses=HTTP_RETRY_STATUSES, **kwargs):
+        semaphore, bucket = self._limits_for(url)
+        max_retries = self.max_retries if method.upper() in HTTP_RETRY_METHODS else 0
+        attempt = 0
+        while True:
+            metricas.contar("peticiones_http")
+            if bucket is not None:
+                waited = bucket.acquire()
+                if waited:
+                    metricas.registrar_etapa("espera_rate_limit", waited)
+            try:
+                with semaphore:
+                    response = super().request(method, url, *args, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                metricas.contar("errores_conexion")
+                if attempt >= max_retries:
+                    raise
+                delay = self._backoff(attempt)
+            except requests.exceptions.RequestException:
+                metricas.contar("errores_conexion")
+                raise
+            else:
+                if response.status_code == 429:
+                    metricas.contar("respuestas_429")
+                elif response.status_code >= 500:
+                    metricas.contar("respuestas_5xx")
+                if response.status_code not in retry_statuses or attempt >= max_retries:
+                    if not kwargs.get('stream'):
+                        metricas.contar("bytes_recibidos", len(response.content))
+                    return response
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                delay = retry_after if retry_after is not None else self._backoff(attempt)
+                response.close()
+            attempt += 1
+            metricas.contar("reintentos_http")
+            logging.debug(f"Reintento {attempt}/{max_retries} de {method} {url} en {delay:.1f}s")
+            with metricas.etapa("espera_reintentos"):
+                time.sleep(delay)
+
+def debug_enabled():
+    """Para no construir volcados de respuestas que ningún handler va a escribir."""
+    return logging.getLogger().isEnabledFor(logging.DEBUG)
+
+def parse_retry_after(value):
+    """Devuelve los segundos indicados por una cabecera Retry-After (segundos o fecha HTTP), o None."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at is None:
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+class ExportPollScheduler:
+    """
+    Calcula cuánto esperar entre polls del progreso de una exportación.
+    Empieza con intervalos cortos y crece exponencialmente con jitter; si el progreso
+    avanza, extrapola el tiempo restante y adelanta el siguiente poll. Respeta Retry-After
+    y aplica un plazo total en lugar de un número fijo de intentos.
+    """
+    def __init__(self, deadline_seconds=EXPORT_DEADLINE_SECONDS, clock=time.monotonic):
+        self.clock = clock
+        self.started_at = clock()
+        self.deadline_at = self.started_at + deadline_seconds
+        self.polls = 0
+        self._first_sample = None # (instante, progreso) del primer progreso > 0
+        self._last_sample = None
+
+    def elapsed(self):
+        return self.clock() - self.started_at
+
+    def record_progress(self, progress):
+        self.polls += 1
+        try:
+            progress = float(progress)
+        except (TypeError, ValueError):
+            return
+        sample = (self.clock(), progress)
+        if progress > 0 and self._first_sample is None:
+            self._first_sample = sample
+        self._last_sample = sample
+
+    def record_failed_poll(self):
+        self.polls += 1
+
+    def estimated_remaining_seconds(self):
+        if self._first_sample is None or self._last_sample is None:
+            return None
+        (t0, p0), (t1, p1) = self._first_sample, self._last_sample
+        if t1 <= t0 or p1 <= p0:
+            return None
+        rate = (p1 - p0) / (t1 - t0) # puntos porcentuales por segundo
+        return max(0.0, (100.0 - p1) / rate)
+
+    def next_delay(self, retry_after=None):
+        """Segundos hasta el siguiente poll, o None si ya no queda tiempo antes del plazo."""
+        remaining_budget = self.deadline_at - self.clock()
+        if remaining_budget <= 0:
+            return None
+        delay = min(POLL_MAX_INTERVAL_SECONDS, POLL_INITIAL_INTERVAL_SECONDS * (POLL_BACKOFF_FACTOR ** self.polls))
+        estimated_remaining = self.estimated_remaining_seconds()
+        if estimated_remaining is not None:
+            delay = min(delay, max(POLL_INITIAL_INTERVAL_SECONDS, estimated_remaining))
+        delay *= random.uniform(1 - POLL_JITTER_RATIO, 1 + POLL_JITTER_RATIO)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return min(delay, remaining_budget)
+
+def get_bool_env(name, default=False):
+    value = os.getenv(name)
+    if value is None or value.strip() == "":
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "y", "s", "si", "sí")
+
+def get_int_env(name, default, minimum=1):
+    value = os.getenv(name)
+    if value is None or value.strip() == "":
+        return default
+    try:
+        return max(minimum, int(value))
+    except ValueError:
+        logging.warning(f"Valor no válido para {name}: '{value}'. Usando el valor por defecto {default}.")
+        return default
+
+def get_float_env(name, default, minimum=0.0):
+    value = os.getenv(name)
+    if value is None or value.strip() == "":
+        return default
+    try:
+        number = float(value)
+    except ValueError:
+        number = None
+    if number is None or not math.isfinite(number):
+        logging.warning(f"Valor no válido para {name}: '{value}'. Usando el valor por defecto {default}.")
+        return default
+    return max(minimum, number)
 
 def sanitize_filename(filename):
     if not isinstance(filename, str):
@@ -52,21 +335,55 @@ def sanitize_filename(filename):
         filename = "pagina_sin_titulo"
     return filename
 
+class MetaTagScanner(HTMLParser):
+    """Parser incremental que solo busca el atributo 'content' de <meta name="...">."""
+    def __init__(self, meta_name):
+        super().__init__(convert_charrefs=True)
+        self.meta_name = meta_name
+        self.content = None
+
+    def handle_starttag(self, tag, attrs):
+        if self.content is None and tag == 'meta':
+            attributes = dict(attrs)
+            if attributes.get('name') == self.meta_name and attributes.get('content'):
+                self.content = attributes['content']
+
+def find_meta_content(response, meta_name):
+    """
+    Lee una respuesta HTML (pedida con stream=True) por bloques y devuelve una tupla
+    (contenido_de_la_meta_o_None, inicio_de_la_página). Deja de descargar en cuanto encuentra la etiqueta.
+    """
+    scanner = MetaTagScanner(meta_name)
+    decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')(errors='replace')
+    preview = []
+    preview_length = 0
+    try:
+        for chunk in response.iter_content(chunk_size=META_SCAN_CHUNK_SIZE):
+            text = decoder.decode(chunk)
+            if preview_length < META_SCAN_PREVIEW_CHARS:
+                preview.append(text[:META_SCAN_PREVIEW_CHARS - preview_length])
+                preview_length += len(preview[-1])
+            scanner.feed(text)
+            if scanner.content is not None:
+                break
+    finally:
+        response.close()
+    return scanner.content, ''.join(preview)
+
 def get_atl_token(session, page_view_url):
     try:
         logging.info(f"Intentando obtener atl_token desde: {page_view_url}")
         headers = {'Referer': page_view_url} 
-        response = session.get(page_view_url, headers=headers, timeout=DEFAULT_REQUEST_TIMEOUT, verify=False)
+        response = session.get(page_view_url, headers=headers, timeout=DEFAULT_REQUEST_TIMEOUT, verify=False, stream=True)
         response.raise_for_status()
-        soup = BeautifulSoup(response.content, 'html.parser')
-        token_tag = soup.find('meta', attrs={'name': 'atlassian-token'})
-        if token_tag and token_tag.get('content'):
-            token = token_tag.get('content')
+        token, page_preview = find_meta_content(response, 'atlassian-token')
+        if token:
             logging.info(f"atl_token encontrado: {token}")
             return token
         else:
             logging.error(f"No se pudo encontrar la meta etiqueta 'atlassian-token' en {page_view_url}")
-            logging.debug(f"Contenido de la página donde se buscó el token (primeros 1000 chars): {response.text[:1000]}")
+            if debug_enabled():
+                logging.debug(f"Contenido de la página donde se buscó el token (primeros 1000 chars): {page_preview[:1000]}")
             return None
     except requests.exceptions.RequestException as e:
         logging.error(f"Error al solicitar la página para obtener atl_token ({page_view_url}): {e}")
@@ -75,48 +392,249 @@ def get_atl_token(session, page_view_url):
         logging.error(f"Error inesperado al parsear atl_token desde {page_view_url}: {e}")
         return None
 
-def download_page_as_pdf(session, page_id, page_title, base_url, output_dir):
+class AtlTokenCache:
+    """
+    Guarda el atl_token (token XSRF) por sesión y URL base para reutilizarlo en todas las
+    exportaciones. Solo se vuelve a pedir cuando Confluence rechaza el token en caché.
+    """
+    def __init__(self):
+        self._tokens = {}
+        self._lock = threading.Lock()
+
+    def get(self, session, base_url, page_view_url):
+        cache_key = (id(session), base_url)
+        with self._lock:
+            if self._tokens.get(cache_key):
+                return self._tokens[cache_key]
+            with metricas.etapa("atl_token"):
+                token = get_atl_token(session, page_view_url)
+            if token:
+                self._tokens[cache_key] = token
+            return token
+
+    def refresh(self, session, base_url, page_view_url, rejected_token):
+        cache_key = (id(session), base_url)
+        with self._lock:
+            current_token = self._tokens.get(cache_key)
+            if current_token and current_token != rejected_token:
+                return current_token # Otro hilo ya lo renovó
+            metricas.contar("reintentos")
+            with metricas.etapa("atl_token"):
+                token = get_atl_token(session, page_view_url)
+            if token:
+                self._tokens[cache_key] = token
+            else:
+                self._tokens.pop(cache_key, None)
+            return token
+
+atl_token_cache = AtlTokenCache()
+
+class ExportFilenameAllocator:
+    """
+    Asigna a cada página un nombre de archivo único (PDF o markdown según `extension`): el título saneado y,
+    si otra página ya usa ese nombre (sin distinguir mayúsculas, como en Windows o macOS), el título seguido
+    de `_<id>`. Las asignaciones conocidas (p. ej. las del manifiesto) se respetan para que los nombres sean
+    estables entre ejecuciones.
+    """
+    def __init__(self, known_filenames=None, extension=".pdf"):
+        self.extension = extension
+        self._by_page = {}
+        self._owners = {}
+        self._lock = threading.Lock()
+        for page_id, filename in (known_filenames or {}).items():
+            if filename.lower() not in self._owners:
+                self._claim(str(page_id), filename)
+
+    def _claim(self, page_id, filename):
+        self._by_page[page_id] = filename
+        self._owners[filename.lower()] = page_id
+
+    def filename_for(self, page_id, page_title):
+        page_id = str(page_id)
+        with self._lock:
+            if page_id not in self._by_page:
+                sanitized_title = sanitize_filename(page_title)
+                filename = f"{sanitized_title}{self.extension}"
+                if filename.lower() in self._owners:
+                    filename = f"{sanitized_title}_{page_id}{self.extension}"
+                self._claim(page_id, filename)
+            return self._by_page[page_id]
+
+class DownloadVerificationError(Exception):
+    """El archivo descargado no coincide con lo anunciado por el servidor (tamaño, ETag o tipo de contenido)."""
+
+def create_download_session(max_retries=HTTP_MAX_RETRIES):
+    """
+    Sesión sin autenticación para la descarga final del PDF (p. ej. desde S3, que no acepta las cabeceras
+    del wiki), con el mismo pool de conexiones y los mismos reintentos que HostLimitedSession.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=DEFAULT_EXPORT_CONCURRENCY, max_retries=build_retry(max_retries))
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+download_session = create_download_session()
+
+def parse_content_range_total(value):
+    """Tamaño total de un 'Content-Range: bytes 100-199/1234', o None si no se indica."""
+    match = re.match(r'bytes\s+\d+-\d+/(\d+)', value or '')
+    return int(match.group(1)) if match else None
+
+def md5_from_etag(etag):
+    """MD5 contenido en un ETag simple (el de S3 para subidas de una parte); None si el ETag no es un MD5."""
+    etag = (etag or '').strip()
+    if etag.startswith('W/'):
+        return None
+    etag = etag.strip('"')
+    return etag.lower() if re.fullmatch(r'[0-9a-fA-F]{32}', etag) else None
+
+def stream_download(url, dest_path, session=None, timeout=DEFAULT_REQUEST_TIMEOUT * 2, accepted_content_types=None,
+                    chunk_size=DOWNLOAD_CHUNK_SIZE, resume_attempts=DOWNLOAD_RESUME_ATTEMPTS):
+    """
+    Descarga `url` en `dest_path` con un búfer de escritura de `chunk_size` bytes sobre un archivo temporal
+    '.part' que se renombra de forma atómica al terminar, así que nunca queda un PDF truncado con el nombre
+    definitivo. Si la conexión se corta, la descarga continúa desde el último byte escrito con una petición
+    Range (con If-Range = ETag); se abandona tras `resume_attempts` cortes seguidos sin recibir datos nuevos.
+    Al final se comprueba el tamaño (Content-Length/Content-Range) y, si el ETag es un MD5, el contenido.
+    Si `dest_path` ya existe con el mismo contenido no se reescribe.
+    Devuelve (bytes_descargados, sin_cambios). Lanza requests.RequestException o DownloadVerificationError.
+    """
+    session = session or download_session
+    part_path = f"{dest_path}{PARTIAL_DOWNLOAD_SUFFIX}"
+    if os.path.exists(part_path):
+        os.remove(part_path) # Restos de otra ejecución: cada exportación tiene su propia URL y su propio contenido
+    downloaded_bytes = 0
+    expected_size = None
+    etag = None
+    interruptions = 0
+    try:
+        while True:
+            offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+            bytes_before_attempt = downloaded_bytes
+            headers = {}
+            if offset:
+                headers['Range'] = f"bytes={offset}-"
+                if etag:
+                    headers['If-Range'] = etag
+            try:
+                with session.get(url, headers=headers, timeout=timeout, verify=False, stream=True) as response:
+                    response.raise_for_status()
+                    content_type = response.headers.get('Content-Type', '').lower()
+                    if accepted_content_types and not any(accepted in content_type for accepted in accepted_content_types):
+                        raise DownloadVerificationError(f"Content-Type inesperado: '{content_type}'")
+                    # Con compresión de transporte los bytes escritos no se pueden comparar con lo anunciado
+                    encoded = response.headers.get('Content-Encoding', 'identity').lower() != 'identity'
+                    if response.status_code == 206:
+                        expected_size = parse_content_range_total(response.headers.get('Content-Range'))
+                    else:
+                        offset = 0 # Sin Range, o el servidor lo ignoró porque el archivo cambió: se empieza de nuevo
+                        content_length = response.headers.get('Content-Length', '')
+                        expected_size = int(content_length) if content_length.isdigit() and not encoded else None
+                    etag = response.headers.get('ETag') or etag
+                    with open(part_path, 'ab' if offset else 'wb', buffering=chunk_size) as f:
+                        for chunk in response.iter_content(chunk_size=DOWNLOAD_READ_SIZE):
+                            f.write(chunk)
+                            downloaded_bytes += len(chunk)
+                received_size = os.path.getsize(part_path)
+                if expected_size is None or received_size >= expected_size:
+                    break
+                interruption = f"se recibieron {received_size} de {expected_size} bytes"
+            except (requests.exceptions.ChunkedEncodingError, requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                interruption = str(e)
+            interruptions = 0 if downloaded_bytes > bytes_before_attempt else interruptions + 1
+            if interruptions > resume_attempts:
+                raise DownloadVerificationError(f"Descarga incompleta tras {resume_attempts} reanudaciones sin progreso: {interruption}")
+            metricas.contar("descargas_reanudadas")
+            logging.warning(f"Descarga de '{dest_path}' interrumpida ({interruption}). Reanudando desde el byte "
+                            f"{os.path.getsize(part_path) if os.path.exists(part_path) else 0}.")
+
+        received_size = os.path.getsize(part_path)
+        if expected_size is not None and received_size != expected_size:
+            raise DownloadVerificationError(f"Tamaño incorrecto: {received_size} bytes, se esperaban {expected_size}")
+        expected_md5 = None if encoded else md5_from_etag(etag)
+        if expected_md5 and compute_file_digest(part_path, 'md5') != expected_md5:
+            raise DownloadVerificationError(f"El contenido no coincide con el ETag {etag}")
+
+        if (os.path.exists(dest_path) and os.path.getsize(dest_path) == received_size
+                and compute_file_digest(dest_path) == compute_file_digest(part_path)):
+            os.remove(part_path)
+            return downloaded_bytes, True
+        os.replace(part_path, dest_path)
+        return downloaded_bytes, False
+    except BaseException:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+
+def download_page_as_pdf(session, page_id, page_title, base_url, output_dir, pdf_filename=None):
+    """
+    Exporta la página a PDF en Confluence y lo descarga en `output_dir` con el nombre `pdf_filename`
+    (por defecto, el título saneado). Devuelve la ruta del PDF o False si falló.
+    """
+    export_started_at = time.monotonic()
     page_view_url = f"{base_url.rstrip('/')}/pages/viewpage.action?pageId={page_id}" 
-    atl_token = get_atl_token(session, page_view_url)
+    atl_token = atl_token_cache.get(session, base_url, page_view_url)
 
     if not atl_token:
         logging.error(f"No se pudo obtener atl_token para la página ID {page_id}. Saltando descarga de PDF.")
         return False
 
     initial_export_url = f"{base_url.rstrip('/')}/spaces/flyingpdf/pdfpageexport.action"
-    initial_params = {'pageId': page_id, 'atl_token': atl_token, 'unmatched-route': 'true'}
     initial_headers = {'Referer': page_view_url, 'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8'}
     
-    logging.info(f"Iniciando exportación a PDF para '{page_title}' (ID: {page_id}) desde {initial_export_url} con params: {initial_params}")
-    
     try:
-        response_initial = session.get(initial_export_url, params=initial_params, headers=initial_headers, timeout=DEFAULT_REQUEST_TIMEOUT, verify=False)
+        task_id, progress_page_preview = None, ''
+        export_request_started_at = time.perf_counter()
+        for token_attempt in range(2):
+            initial_params = {'pageId': page_id, 'atl_token': atl_token, 'unmatched-route': 'true'}
+            logging.info(f"Iniciando exportación a PDF para '{page_title}' (ID: {page_id}) desde {initial_export_url} con params: {initial_params}")
+            response_initial = session.get(initial_export_url, params=initial_params, headers=initial_headers, timeout=DEFAULT_REQUEST_TIMEOUT, verify=False, stream=True)
+            token_rejected = response_initial.status_code == 403
+            if not token_rejected:
+                response_initial.raise_for_status()
+                logging.info(f"Respuesta inicial de exportación: Status {response_initial.status_code}, URL: {response_initial.url}")
+                task_id, progress_page_preview = find_meta_content(response_initial, 'ajs-taskId')
+                token_rejected = not task_id and 'xsrf' in progress_page_preview.lower()
+            if not token_rejected or token_attempt == 1:
+                break
+            response_initial.close()
+            logging.warning(f"Confluence rechazó el atl_token en caché al exportar '{page_title}'. Renovándolo.")
+            atl_token = atl_token_cache.refresh(session, base_url, page_view_url, rejected_token=atl_token)
+            if not atl_token:
+                logging.error(f"No se pudo renovar el atl_token para la página ID {page_id}. Saltando descarga de PDF.")
+                return False
+        metricas.registrar_etapa("inicio_exportacion", time.perf_counter() - export_request_started_at)
         response_initial.raise_for_status()
-        logging.info(f"Respuesta inicial de exportación: Status {response_initial.status_code}, URL: {response_initial.url}")
-
-        soup_progress_page = BeautifulSoup(response_initial.content, 'html.parser')
-        task_id_tag = soup_progress_page.find('meta', attrs={'name': 'ajs-taskId'})
         
-        if not task_id_tag or not task_id_tag.get('content'):
+        if not task_id:
             logging.error(f"No se pudo encontrar 'ajs-taskId' en la página de progreso para '{page_title}'.")
-            logging.debug(f"Contenido de la página de progreso (primeros 2000 chars): {response_initial.text[:2000]}")
+            if debug_enabled():
+                logging.debug(f"Contenido de la página de progreso (primeros 2000 chars): {progress_page_preview[:2000]}")
             return False
         
-        task_id = task_id_tag.get('content')
         logging.info(f"Task ID extraído: {task_id} para '{page_title}'")
 
         progress_url_template = f"{base_url.rstrip('/')}/services/api/v1/task/{task_id}/progress"
         
-        for attempt in range(MAX_POLLING_ATTEMPTS):
-            logging.info(f"Polling attempt {attempt + 1}/{MAX_POLLING_ATTEMPTS} para task ID {task_id} ('{page_title}')")
+        scheduler = ExportPollScheduler(EXPORT_DEADLINE_SECONDS)
+        while True:
+            retry_after = None
+            if debug_enabled():
+                logging.debug(f"Polling attempt {scheduler.polls + 1} ({scheduler.elapsed():.1f}s transcurridos) para task ID {task_id} ('{page_title}')")
             try:
-                response_progress = session.get(progress_url_template, headers={'Accept': 'application/json', 'Referer': response_initial.url}, timeout=DEFAULT_REQUEST_TIMEOUT, verify=False)
+                metricas.contar("polls")
+                response_progress = session.get(progress_url_template, headers={'Accept': 'application/json', 'Referer': response_initial.url}, timeout=DEFAULT_REQUEST_TIMEOUT, verify=False,
+                                                retry_statuses=POLL_RETRY_STATUSES)
                 response_progress.raise_for_status()
                 progress_data = response_progress.json()
-                logging.debug(f"Respuesta del progreso para task ID {task_id}: {progress_data}")
+                if debug_enabled():
+                    logging.debug(f"Respuesta del progreso para task ID {task_id}: {progress_data}")
 
                 current_progress = progress_data.get("progress", 0)
                 current_state = progress_data.get("state", "UNKNOWN")
+                scheduler.record_progress(current_progress)
+                retry_after = parse_retry_after(response_progress.headers.get('Retry-After'))
                 
                 print(f"    Progreso para '{page_title}': {current_progress}% - Estado: {current_state}")
 
@@ -125,6 +643,9 @@ def download_page_as_pdf(session, page_id, page_title, base_url, output_dir):
                     return False
                 
                 if current_progress == 100 and current_state != "RUNNING": 
+                    render_seconds = scheduler.elapsed()
+                    metricas.registrar_etapa("render_pdf", render_seconds, 1, "páginas")
+                    download_started_at = time.perf_counter()
                     logging.info(f"La tarea de exportación {task_id} completada para '{page_title}'. Obteniendo enlace de descarga final.")
                     
                     intermediate_link_api_url_path = progress_data.get("result")
@@ -154,42 +675,53 @@ def download_page_as_pdf(session, page_id, page_title, base_url, output_dir):
                         
                     logging.info(f"URL final de descarga de PDF para '{page_title}': {actual_pdf_download_url}")
 
-                    # Usar requests.get() para la descarga desde S3 para evitar enviar cabeceras de sesión.
-                    response_pdf = requests.get(
-                        actual_pdf_download_url, 
-                        timeout=DEFAULT_REQUEST_TIMEOUT * 2, 
-                        verify=False, 
-                        stream=True
-                    )
-                    response_pdf.raise_for_status()
-
-                    content_type_pdf = response_pdf.headers.get('Content-Type', '').lower()
-                    if 'application/pdf' not in content_type_pdf and 'application/octet-stream' not in content_type_pdf:
-                        logging.error(f"El contenido final descargado para '{page_title}' no parece ser un PDF. Content-Type: '{content_type_pdf}'. URL: {actual_pdf_download_url}")
+                    # La descarga desde S3 usa download_session para no enviar las cabeceras de autenticación del wiki.
+                    pdf_path = os.path.join(output_dir, pdf_filename or f"{sanitize_filename(page_title)}.pdf")
+                    try:
+                        downloaded_bytes, unchanged = stream_download(
+                            actual_pdf_download_url, pdf_path, accepted_content_types=('application/pdf', 'application/octet-stream')
+                        )
+                    except DownloadVerificationError as e:
+                        logging.error(f"La descarga del PDF de '{page_title}' no es válida ({e}). URL: {actual_pdf_download_url}")
                         return False
-
-                    sanitized_title = sanitize_filename(page_title)
-                    pdf_filename = os.path.join(output_dir, f"{sanitized_title}.pdf")
-                    with open(pdf_filename, 'wb') as f:
-                        for chunk in response_pdf.iter_content(chunk_size=8192):
-                            f.write(chunk)
-                    logging.info(f"PDF descargado exitosamente: {pdf_filename}")
-                    print(f"    PDF guardado en: {pdf_filename}")
-                    return True
-                
-                time.sleep(POLLING_INTERVAL_SECONDS)
+                    metricas.registrar_etapa("descarga_pdf", time.perf_counter() - download_started_at, downloaded_bytes, "bytes")
+                    metricas.contar("bytes_descargados", downloaded_bytes)
+                    if unchanged:
+                        metricas.contar("pdfs_sin_cambios")
+                    logging.info(f"PDF descargado exitosamente: {pdf_path}{' (sin cambios, no se reescribe)' if unchanged else ''}")
+                    logging.info(f"Latencia de exportación: page_id={page_id} polls={scheduler.polls} "
+                                 f"render_s={render_seconds:.2f} total_s={time.monotonic() - export_started_at:.2f}")
+                    print(f"    PDF {'sin cambios' if unchanged else 'guardado'} en: {pdf_path}")
+                    return pdf_path
 
             except requests.exceptions.RequestException as e_poll:
-                logging.error(f"Error durante el polling para task ID {task_id} ('{page_title}'): {e_poll}")
-                if hasattr(e_poll, 'response') and e_poll.response is not None and e_poll.response.status_code == 404:
-                    logging.error(f"La URL de progreso {progress_url_template} devolvió 404. La tarea {task_id} puede haber expirado o ser inválida.")
-                    return False 
-                time.sleep(POLLING_INTERVAL_SECONDS) 
+                scheduler.record_failed_poll()
+                metricas.contar("reintentos")
+                poll_response = getattr(e_poll, 'response', None)
+                if poll_response is not None and poll_response.status_code == 429:
+                    retry_after = parse_retry_after(poll_response.headers.get('Retry-After'))
+                    logging.warning(f"Confluence limitó el polling (429) para task ID {task_id} ('{page_title}'). Retry-After: {retry_after}")
+                else:
+                    logging.error(f"Error durante el polling para task ID {task_id} ('{page_title}'): {e_poll}")
+                if poll_response is not None:
+                    if poll_response.status_code == 404:
+                        logging.error(f"La URL de progreso {progress_url_template} devolvió 404. La tarea {task_id} puede haber expirado o ser inválida.")
+                        return False 
+                    if retry_after is None:
+                        retry_after = parse_retry_after(poll_response.headers.get('Retry-After'))
             except json.JSONDecodeError as e_json:
                 logging.error(f"Error al decodificar JSON de progreso para task ID {task_id} ('{page_title}'): {e_json}. Respuesta: {response_progress.text[:200]}")
                 return False
+
+            delay = scheduler.next_delay(retry_after)
+            if delay is None:
+                break
+            with metricas.etapa("espera_polling"):
+                time.sleep(delay)
         
-        logging.error(f"Se excedió el máximo de intentos de polling para la tarea {task_id} ('{page_title}').")
+        logging.error(f"Se superó el plazo de {EXPORT_DEADLINE_SECONDS}s para la tarea {task_id} ('{page_title}') tras {scheduler.polls} polls.")
+        logging.info(f"Latencia de exportación: page_id={page_id} polls={scheduler.polls} "
+                     f"render_s=None total_s={time.monotonic() - export_started_at:.2f} resultado=timeout")
         return False
 
     except requests.exceptions.HTTPError as http_err:
@@ -207,26 +739,51 @@ def download_page_as_pdf(session, page_id, page_title, base_url, output_dir):
     print(f"    Error al descargar PDF para: {page_title}")
     return False
 
+def page_version_info(page_item):
+    version = page_item.get('version') or {}
+    return {'version': version.get('number'), 'lastModified': version.get('when')}
+
 def get_page_details_by_id(session, page_id, base_url):
     api_url = f"{base_url.rstrip('/')}/rest/api/content/{page_id}"
     headers = {'Accept': 'application/json'}
     logging.info(f"Obteniendo detalles para la página ID: {page_id} desde {api_url}")
     try:
-        response = session.get(api_url, headers=headers, timeout=DEFAULT_REQUEST_TIMEOUT, verify=False)
+        response = session.get(api_url, params={'expand': 'version'}, headers=headers, timeout=DEFAULT_REQUEST_TIMEOUT, verify=False)
         response.raise_for_status()
         data = response.json()
-        return {'id': data.get('id'), 'title': data.get('title', 'N/A')}
+        return {'id': data.get('id'), 'title': data.get('title', 'N/A'), **page_version_info(data)}
     except Exception as e:
         logging.error(f"[get_page_details_by_id] Error para la página {page_id}: {e}", exc_info=True)
     return None
 
-def get_all_pages_in_space(session, base_url, space_key):
+def resolve_next_url(base_url, next_url_from_api):
+    """Convierte el enlace '_links.next' de la API de Confluence en una URL absoluta."""
+    if next_url_from_api.startswith(base_url):
+        return next_url_from_api
+    if next_url_from_api.startswith('/wiki/'):
+        parsed_main_url = urllib3.util.parse_url(base_url)
+        domain_root = f"{parsed_main_url.scheme}://{parsed_main_url.host}"
+        if parsed_main_url.port:
+             domain_root += f":{parsed_main_url.port}"
+        return f"{domain_root}{next_url_from_api}"
+    if next_url_from_api.startswith('/rest/api/'):
+        return f"{base_url.rstrip('/')}{next_url_from_api}"
+    if next_url_from_api.startswith('http'):
+        return next_url_from_api
+    logging.warning(f"Formato de URL 'next' no reconocido completamente: {next_url_from_api}, intentando unir con base_url.")
+    return f"{base_url.rstrip('/')}{next_url_from_api if next_url_from_api.startswith('/') else '/' + next_url_from_api}"
+
+def get_all_pages_in_space(session, base_url, space_key, limit=DEFAULT_REQUEST_LIMIT):
+    """
+    Lista las páginas del espacio. Devuelve None si alguna petición falla (tras los reintentos de la
+    sesión), para no confundir un error con un espacio vacío.
+    """
     pages_data = []
     api_base_for_space = f"{base_url.rstrip('/')}/rest/api/space/{space_key}/content/page"
     current_api_url = api_base_for_space
-    current_api_params = {'start': 0, 'limit': DEFAULT_REQUEST_LIMIT, 'expand': 'title'}
+    current_api_params = {'start': 0, 'limit': limit, 'expand': 'version'}
     headers = {'Accept': 'application/json'}
-    logging.info(f"Obteniendo todas las páginas en el espacio '{space_key}': {current_api_url} con límite={DEFAULT_REQUEST_LIMIT}")
+    logging.info(f"Obteniendo todas las páginas en el espacio '{space_key}': {current_api_url} con límite={limit}")
     is_first_request = True
     while current_api_url:
         params_for_request = current_api_params if is_first_request and current_api_url == api_base_for_space else None
@@ -239,37 +796,24 @@ def get_all_pages_in_space(session, base_url, space_key):
             current_pages_results = data.get('results', [])
             if not current_pages_results: break
             for page_item in current_pages_results:
-                pages_data.append({'id': page_item.get('id'), 'title': page_item.get('title', 'N/A')})
+                pages_data.append({'id': page_item.get('id'), 'title': page_item.get('title', 'N/A'), **page_version_info(page_item)})
             
             next_url_from_api = data.get('_links', {}).get('next')
             if next_url_from_api:
-                if next_url_from_api.startswith(base_url): 
-                    current_api_url = next_url_from_api
-                elif next_url_from_api.startswith('/wiki/'): 
-                    parsed_main_url = urllib3.util.parse_url(base_url)
-                    domain_root = f"{parsed_main_url.scheme}://{parsed_main_url.host}"
-                    if parsed_main_url.port:
-                         domain_root += f":{parsed_main_url.port}"
-                    current_api_url = f"{domain_root}{next_url_from_api}"
-                elif next_url_from_api.startswith('/rest/api/'): 
-                     current_api_url = f"{base_url.rstrip('/')}{next_url_from_api}"
-                elif next_url_from_api.startswith('http'): 
-                    current_api_url = next_url_from_api
-                else: 
-                    logging.warning(f"Formato de URL 'next' no reconocido completamente: {next_url_from_api}, intentando unir con base_url.")
-                    current_api_url = f"{base_url.rstrip('/')}{next_url_from_api if next_url_from_api.startswith('/') else '/' + next_url_from_api}"
-                current_api_params = None 
+                current_api_url = resolve_next_url(base_url, next_url_from_api)
+                current_api_params = None
             else: break
         except Exception as e:
             logging.error(f"[get_all_pages_in_space] Error: {e}", exc_info=True)
-            return []
+            return None
     return pages_data
 
-def get_direct_children(session, parent_page_id, base_url, space_key_for_logging="N/A"):
+def get_direct_children(session, parent_page_id, base_url, space_key_for_logging="N/A", limit=DEFAULT_REQUEST_LIMIT):
+    """Devuelve los hijos directos de la página, o None si no se pudieron obtener (un 404 equivale a no tener hijos)."""
     children_data = []
     api_base_for_children = f"{base_url.rstrip('/')}/rest/api/content/{parent_page_id}/child/page"
     current_api_url = api_base_for_children
-    current_api_params = {'start': 0, 'limit': DEFAULT_REQUEST_LIMIT, 'expand': 'title'}
+    current_api_params = {'start': 0, 'limit': limit, 'expand': 'version'}
     headers = {'Accept': 'application/json'}
     logging.info(f"Obteniendo hijos directos para la página ID: {parent_page_id}")
     is_first_request = True
@@ -284,86 +828,454 @@ def get_direct_children(session, parent_page_id, base_url, space_key_for_logging
             current_children_results = data.get('results', [])
             if not current_children_results: break
             for child_item in current_children_results:
-                children_data.append({'id': child_item.get('id'), 'title': child_item.get('title', 'N/A')})
+                children_data.append({'id': child_item.get('id'), 'title': child_item.get('title', 'N/A'), **page_version_info(child_item)})
             
             next_url_from_api = data.get('_links', {}).get('next')
             if next_url_from_api:
-                if next_url_from_api.startswith(base_url):
-                    current_api_url = next_url_from_api
-                elif next_url_from_api.startswith('/wiki/'):
-                    parsed_main_url = urllib3.util.parse_url(base_url)
-                    domain_root = f"{parsed_main_url.scheme}://{parsed_main_url.host}"
-                    if parsed_main_url.port:
-                         domain_root += f":{parsed_main_url.port}"
-                    current_api_url = f"{domain_root}{next_url_from_api}"
-                elif next_url_from_api.startswith('/rest/api/'):
-                     current_api_url = f"{base_url.rstrip('/')}{next_url_from_api}"
-                elif next_url_from_api.startswith('http'):
-                    current_api_url = next_url_from_api
-                else:
-                    logging.warning(f"Formato de URL 'next' no reconocido completamente: {next_url_from_api}, intentando unir con base_url.")
-                    current_api_url = f"{base_url.rstrip('/')}{next_url_from_api if next_url_from_api.startswith('/') else '/' + next_url_from_api}"
+                current_api_url = resolve_next_url(base_url, next_url_from_api)
                 current_api_params = None
             else: break
         except requests.exceptions.HTTPError as http_err:
             if http_err.response.status_code == 404: # type: ignore
                 logging.info(f"No se encontraron hijos (404) para el padre {parent_page_id}.")
                 break 
-            else: logging.error(f"[Direct Children] Error HTTP para padre {parent_page_id}: {http_err}", exc_info=True)
-            return []
+            logging.error(f"[Direct Children] Error HTTP para padre {parent_page_id}: {http_err}", exc_info=True)
+            return None
         except Exception as e:
             logging.error(f"[Direct Children] Error para padre {parent_page_id}: {e}", exc_info=True)
-            return []
+            return None
     return children_data
 
-def display_direct_children_recursively(session, page_id, page_title, indent_level, base_url, space_key, 
-                                        visited_ids_for_recursion_control, all_displayed_pages_summary):
-    indent = "  " * indent_level
-    print(f"{indent}- {page_title} (ID: {page_id})")
-    if page_id not in all_displayed_pages_summary:
-        all_displayed_pages_summary[page_id] = page_title 
-    
-    if page_id in visited_ids_for_recursion_control:
-        logging.warning(f"Los hijos de la página ID {page_id} ('{page_title}') ya fueron procesados. Saltando.")
-        return
-    visited_ids_for_recursion_control.add(page_id)
-    
-    direct_children = get_direct_children(session, page_id, base_url, space_key_for_logging=space_key)
-    for child in direct_children:
-        display_direct_children_recursively(
-            session, child['id'], child['title'], indent_level + 1, 
-            base_url, space_key, 
-            visited_ids_for_recursion_control, all_displayed_pages_summary
-        )
+def get_descendants_via_cql(session, base_url, cql, limit=CRAWL_REQUEST_LIMIT):
+    """
+    Ejecuta una búsqueda CQL (p. ej. `ancestor=123 and type=page`) con `expand=ancestors,version`
+    y devuelve {id_padre: [hijos]} reconstruido a partir del último ancestro de cada resultado.
+    Con una sola consulta paginada se obtiene un subárbol (o un espacio) completo, aunque el orden
+    entre hermanos es el de la búsqueda y no necesariamente el de la jerarquía de Confluence.
+    """
+    children_by_parent = {}
+    api_url = f"{base_url.rstrip('/')}/rest/api/content/search"
+    current_api_url = api_url
+    current_api_params = {'cql': cql, 'limit': limit, 'expand': 'ancestors,version'}
+    headers = {'Accept': 'application/json'}
+    logging.info(f"Obteniendo descendientes con CQL: {cql}")
+    while current_api_url:
+        try:
+            response = session.get(current_api_url, params=current_api_params, headers=headers, timeout=DEFAULT_REQUEST_TIMEOUT, verify=False)
+            response.raise_for_status()
+            data = response.json()
+        except Exception as e:
+            logging.error(f"[CQL] Error al buscar descendientes con '{cql}': {e}", exc_info=True)
+            return None
+        results = data.get('results', [])
+        if not results: break
+        for item in results:
+            ancestors = item.get('ancestors') or []
+            if not ancestors:
+                continue
+            parent_id = ancestors[-1].get('id')
+            children_by_parent.setdefault(parent_id, []).append(
+                {'id': item.get('id'), 'title': item.get('title', 'N/A'), **page_version_info(item)}
+            )
+        next_url_from_api = data.get('_links', {}).get('next')
+        if not next_url_from_api: break
+        current_api_url = resolve_next_url(base_url, next_url_from_api)
+        current_api_params = None
+    return children_by_parent
 
-def main():
-    print("Listador de Páginas de Confluence - Exportación Recursiva a PDF (Descarga Directa)")
-    print("---------------------------------------------------------------------------------")
-    
-    default_output_directory = "confluence_exported_pdfs_directos"
-    output_directory_prompt = input(f"Introduce el nombre para el directorio de salida de los PDFs (default: {default_output_directory}): ").strip()
-    output_directory = output_directory_prompt if output_directory_prompt else default_output_directory
-    
-    if not os.path.exists(output_directory):
+def iter_page_bodies(session, base_url, page_ids, representation="storage", batch_size=BODY_BATCH_SIZE):
+    """
+    Pide el contenido de las páginas en bloque: una búsqueda CQL `id in (...)` con
+    `expand=body.<representation>,version` por cada `batch_size` páginas, en lugar de una petición
+    (o una exportación a PDF) por página. Produce (id, página) por cada ID pedido, en el mismo orden;
+    la página es None si su lote falló o no se encontró.
+    """
+    api_url = f"{base_url.rstrip('/')}/rest/api/content/search"
+    headers = {'Accept': 'application/json'}
+    page_ids = list(page_ids)
+    for start in range(0, len(page_ids), batch_size):
+        batch = page_ids[start:start + batch_size]
+        found = {}
+        current_api_url = api_url
+        current_api_params = {'cql': f"id in ({','.join(str(page_id) for page_id in batch)})", 'limit': len(batch),
+                              'expand': f'body.{representation},version'}
         try:
-            os.makedirs(output_directory)
-            print(f"Directorio de salida creado: {output_directory}")
-        except OSError as e:
-            print(f"Error al crear el directorio de salida '{output_directory}': {e}")
-            return
-    print(f"Los PDFs se guardarán en el directorio: {output_directory}")
+            with metricas.etapa("contenido_en_bloque", len(batch), "páginas"):
+                while current_api_url:
+                    response = session.get(current_api_url, params=current_api_params, headers=headers, timeout=DEFAULT_REQUEST_TIMEOUT, verify=False)
+                    response.raise_for_status()
+                    data = response.json()
+                    for item in data.get('results', []):
+                        found[str(item.get('id'))] = item
+                    next_url_from_api = data.get('_links', {}).get('next')
+                    current_api_url = resolve_next_url(base_url, next_url_from_api) if next_url_from_api and data.get('results') else None
+                    current_api_params = None
+        except Exception as e:
+            logging.error(f"[Contenido] Error al obtener el contenido de {len(batch)} páginas (desde la ID {batch[0]}): {e}", exc_info=True)
+        for page_id in batch:
+            yield page_id, found.get(str(page_id))
+
+def page_to_markdown(page_item, representation="storage"):
+    """Markdown de una página devuelta por iter_page_bodies: su título como '#' seguido del contenido convertido."""
+    body = ((page_item.get('body') or {}).get(representation) or {}).get('value') or ''
+    markdown = storage_to_markdown(body, heading_offset=1)
+    return f"# {page_item.get('title', 'N/A')}\n\n{markdown}".rstrip() + "\n"
+
+def write_text_file(path, text):
+    """
+    Escribe `text` en `path` de forma atómica (archivo temporal y renombrado). Si el archivo ya tiene
+    exactamente ese contenido no se reescribe. Devuelve True si el archivo no cambió.
+    """
+    data = text.encode('utf-8')
+    if os.path.exists(path) and os.path.getsize(path) == len(data):
+        with open(path, 'rb') as f:
+            if f.read() == data:
+                return True
+    tmp_path = f"{path}{PARTIAL_DOWNLOAD_SUFFIX}"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return False
+
+def crawl_page_tree(session, root_pages, base_url, space_key, max_workers=DEFAULT_CRAWL_WORKERS, crawl_mode="bfs",
+                    parent_page_id=None, failed_parents=None, resume_from=None, on_level_complete=None):
+    """
+    Recorre el árbol de páginas nivel a nivel y devuelve {id_página: [hijos directos]}.
+    En modo 'bfs' los hijos de todas las páginas de un nivel se piden en paralelo con un pool
+    de `max_workers` hilos y el máximo tamaño de página (CRAWL_REQUEST_LIMIT). En modo 'cql'
+    se intenta obtener todo el subárbol (o todo el espacio) con una única búsqueda paginada,
+    y se recurre al modo 'bfs' si la búsqueda falla.
+    `failed_parents`, `resume_from` y `on_level_complete` se pasan a iter_children_bfs.
+    """
+    if crawl_mode == "cql":
+        cql = f"ancestor={parent_page_id} and type=page" if parent_page_id else f'space="{space_key}" and type=page'
+        children_by_parent = get_descendants_via_cql(session, base_url, cql)
+        if children_by_parent is not None:
+            return children_by_parent
+        logging.warning("La búsqueda CQL falló. Recorriendo el árbol en modo 'bfs'.")
+
+    children_by_parent = dict(resume_from[0]) if resume_from else {}
+    children_by_parent.update(iter_children_bfs(session, root_pages, base_url, space_key, max_workers,
+                                                failed_parents, resume_from, on_level_complete))
+    return children_by_parent
+
+def iter_children_bfs(session, root_pages, base_url, space_key, max_workers=DEFAULT_CRAWL_WORKERS,
+                      failed_parents=None, resume_from=None, on_level_complete=None):
+    """
+    Generador del recorrido BFS: pide en paralelo los hijos de todas las páginas de cada nivel
+    y produce (id_padre, hijos) en cuanto llega cada respuesta, sin esperar al árbol completo.
+    Si no se pueden obtener los hijos de una página se produce con una lista vacía y su ID se añade
+    al conjunto `failed_parents` (si se indica), para que el llamante sepa que el árbol está incompleto.
+    `resume_from=(hijos_por_padre, frontera)` continúa un recorrido interrumpido sin repetir las páginas
+    ya expandidas, y `on_level_complete(hijos_por_padre, siguiente_frontera)` se llama al terminar cada nivel.
+    """
+    children_by_parent = dict(resume_from[0]) if resume_from else {}
+    frontier = list(dict.fromkeys(resume_from[1] if resume_from else (page['id'] for page in root_pages)))
+    level = 0
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="crawl") as executor:
+        while frontier:
+            logging.info(f"Recorrido BFS: nivel {level}, {len(frontier)} páginas por expandir.")
+            future_to_parent = {
+                executor.submit(get_direct_children, session, parent_id, base_url, space_key, CRAWL_REQUEST_LIMIT): parent_id
+                for parent_id in frontier
+            }
+            for future in as_completed(future_to_parent):
+                parent_id = future_to_parent[future]
+                try:
+                    children = future.result()
+                except Exception as e:
+                    logging.error(f"[Crawler] Error al obtener hijos de {parent_id}: {e}", exc_info=True)
+                    children = None
+                if children is None:
+                    metricas.contar("errores_listado_hijos")
+                    if failed_parents is not None:
+                        failed_parents.add(parent_id)
+                    children = []
+                children_by_parent[parent_id] = children
+                yield parent_id, children
+            next_frontier = []
+            queued_ids = set()
+            for parent_id in frontier:
+                for child in children_by_parent[parent_id]:
+                    if child['id'] not in children_by_parent and child['id'] not in queued_ids:
+                        queued_ids.add(child['id'])
+                        next_frontier.append(child['id'])
+            frontier = next_frontier
+            level += 1
+            if on_level_complete is not None:
+                on_level_complete(children_by_parent, frontier)
+
+def display_page_tree(root_pages, children_by_parent, all_displayed_pages_summary, page_versions=None):
+    """
+    Imprime la jerarquía en preorden (igual que el antiguo recorrido recursivo) usando una pila
+    explícita, sin límite de profundidad de recursión, y rellena `all_displayed_pages_summary`
+    (id -> título) en el mismo orden. Los hijos de una página ya expandida no se repiten.
+    """
+    visited_ids = set()
+    for root in root_pages:
+        stack = [(root, 0)]
+        while stack:
+            page, indent_level = stack.pop()
+            page_id, page_title = page['id'], page['title']
+            print(f"{'  ' * indent_level}- {page_title} (ID: {page_id})")
+            if page_id not in all_displayed_pages_summary:
+                all_displayed_pages_summary[page_id] = page_title
+            if page_versions is not None and page_id not in page_versions:
+                page_versions[page_id] = page_version_info_from_summary(page)
+
+            if page_id in visited_ids:
+                logging.warning(f"Los hijos de la página ID {page_id} ('{page_title}') ya fueron procesados. Saltando.")
+                continue
+            visited_ids.add(page_id)
+            for child in reversed(children_by_parent.get(page_id, [])):
+                stack.append((child, indent_level + 1))
+
+def page_version_info_from_summary(page_summary):
+    return {'version': page_summary.get('version'), 'lastModified': page_summary.get('lastModified')}
+
+def compute_file_digest(path, algorithm='sha256'):
+    digest = hashlib.new(algorithm)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def compute_file_sha256(path):
+    return compute_file_digest(path, 'sha256')
+
+def load_export_manifest(output_dir):
+    """
+    Carga el manifiesto de la sincronización incremental (ID de página -> versión,
+    lastModified, ruta del PDF y hash de contenido). Devuelve un manifiesto vacío si no existe.
+    """
+    manifest_path = os.path.join(output_dir, EXPORT_MANIFEST_FILENAME)
+    if not os.path.exists(manifest_path):
+        return {'scope': None, 'pages': {}}
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        manifest.setdefault('pages', {})
+        return manifest
+    except (OSError, json.JSONDecodeError) as e:
+        logging.warning(f"No se pudo leer el manifiesto '{manifest_path}' ({e}). Se exportarán todas las páginas.")
+        return {'scope': None, 'pages': {}}
+
+def save_export_manifest(output_dir, manifest):
+    manifest_path = os.path.join(output_dir, EXPORT_MANIFEST_FILENAME)
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+def record_exported_page(manifest, page_id, page_title, pdf_path, version_info, export_format="pdf"):
+    manifest['pages'][str(page_id)] = {
+        'title': page_title,
+        'format': export_format,
+        'version': version_info.get('version'),
+        'lastModified': version_info.get('lastModified'),
+        'path': pdf_path,
+        'sha256': compute_file_sha256(pdf_path),
+        'exportedAt': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+    }
+
+def new_checkpoint(scope):
+    return {
+        'scope': scope,
+        'startedAt': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'startedAtEpoch': time.time(),
+        'crawl': {'complete': False, 'roots': None, 'listingMessage': "", 'childrenByParent': {}, 'frontier': None, 'failedParents': []},
+        'export': {'done': {}, 'failed': {}},
+    }
+
+def load_checkpoint(output_dir, scope):
+    """
+    Carga el checkpoint de una ejecución anterior que no terminó (interrumpida o con fallos).
+    Devuelve None si no existe, no se puede leer, pertenece a otro ámbito (espacio/padre) o tiene
+    más de CHECKPOINT_MAX_AGE_HOURS horas.
+    """
+    checkpoint_path = os.path.join(output_dir, CHECKPOINT_FILENAME)
+    if not os.path.exists(checkpoint_path):
+        return None
+    try:
+        with open(checkpoint_path, 'r', encoding='utf-8') as f:
+            checkpoint = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        logging.warning(f"No se pudo leer el checkpoint '{checkpoint_path}' ({e}). Se empezará desde cero.")
+        return None
+    if checkpoint.get('scope') != scope:
+        logging.warning(f"El checkpoint pertenece a otro ámbito ('{checkpoint.get('scope')}' != '{scope}'). Se empezará desde cero.")
+        return None
+    age_hours = (time.time() - checkpoint.get('startedAtEpoch', 0)) / 3600
+    if age_hours > CHECKPOINT_MAX_AGE_HOURS:
+        logging.warning(f"El checkpoint se creó hace más de {CHECKPOINT_MAX_AGE_HOURS} horas ({checkpoint.get('startedAt')}). Se empezará desde cero.")
+        return None
+    return checkpoint
+
+def save_checkpoint(output_dir, checkpoint):
+    checkpoint_path = os.path.join(output_dir, CHECKPOINT_FILENAME)
+    tmp_path = f"{checkpoint_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f, ensure_ascii=False)
+    os.replace(tmp_path, checkpoint_path)
+
+def delete_checkpoint(output_dir):
+    checkpoint_path = os.path.join(output_dir, CHECKPOINT_FILENAME)
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+def record_crawl_progress(checkpoint, children_by_parent, frontier, failed_parents):
+    """
+    Guarda en el checkpoint el árbol recorrido hasta ahora. Las páginas cuyos hijos no se pudieron
+    obtener se vuelven a poner en la frontera para pedirlas de nuevo al reanudar.
+    """
+    crawl = checkpoint['crawl']
+    crawl['childrenByParent'] = {page_id: children for page_id, children in children_by_parent.items() if page_id not in failed_parents}
+    crawl['frontier'] = sorted(failed_parents) + [page_id for page_id in frontier if page_id not in failed_parents]
+    crawl['failedParents'] = sorted(failed_parents)
+
+def plan_incremental_export(all_pages_summary, page_versions, manifest, scope, export_format="pdf"):
+    """
+    Compara las páginas encontradas con el manifiesto y devuelve una tupla
+    (paginas_a_exportar, paginas_sin_cambios, paginas_eliminadas). Una página se vuelve a exportar si
+    es nueva, si su número de versión cambió, si se exportó en otro formato o si su archivo ya no está en disco.
+    Las páginas del manifiesto que ya no existen solo se consideran eliminadas si el manifiesto es del mismo
+    ámbito (espacio/padre).
+    """
+    manifest_pages = manifest.get('pages', {})
+    pages_to_export = {}
+    unchanged_pages = {}
+    for page_id, page_title in all_pages_summary.items():
+        entry = manifest_pages.get(str(page_id))
+        current_version = (page_versions.get(page_id) or {}).get('version')
+        if (entry is None or current_version is None or entry.get('version') != current_version
+                or entry.get('format', 'pdf') != export_format or not entry.get('path') or not os.path.exists(entry['path'])):
+            pages_to_export[page_id] = page_title
+        else:
+            unchanged_pages[page_id] = page_title
+
+    deleted_pages = {}
+    if manifest.get('scope') in (None, scope):
+        current_ids = {str(page_id) for page_id in all_pages_summary}
+        deleted_pages = {page_id: entry for page_id, entry in manifest_pages.items() if page_id not in current_ids}
+    else:
+        logging.warning(f"El manifiesto pertenece a otro ámbito ('{manifest.get('scope')}' != '{scope}'). No se detectarán páginas eliminadas.")
+    return pages_to_export, unchanged_pages, deleted_pages
 
+def export_pages_concurrently(session, pages_to_export, base_url, output_dir, max_in_flight=DEFAULT_EXPORT_CONCURRENCY,
+                              on_page_exported=None, on_page_failed=None, pdf_filenames=None):
+    """
+    Exporta las páginas a PDF con hasta `max_in_flight` tareas de exportación en curso a la vez.
+    Cada tarea inicia su exportación en Confluence, hace polling de su progreso y guarda el PDF
+    en disco en cuanto termina, así que los PDFs se escriben según van completándose.
+    `on_page_exported(page_id, page_title, pdf_path)` se llama desde el hilo principal por cada PDF guardado
+    y `on_page_failed(page_id, page_title)` por cada página que no se pudo exportar.
+    `pdf_filenames` ({id: nombre}) fija el nombre de cada PDF; si no se indica, se asignan con ExportFilenameAllocator.
+    Devuelve una tupla (descargas_exitosas, descargas_fallidas).
+    """
+    successful_downloads = 0
+    failed_downloads = 0
+    total_pages = len(pages_to_export)
+    if pdf_filenames is None:
+        allocator = ExportFilenameAllocator()
+        pdf_filenames = {page_id: allocator.filename_for(page_id, page_title) for page_id, page_title in pages_to_export.items()}
+
+    with ThreadPoolExecutor(max_workers=max(1, max_in_flight), thread_name_prefix="pdf-export") as executor:
+        future_to_page = {
+            executor.submit(download_page_as_pdf, session, page_id, page_title, base_url, output_dir,
+                            pdf_filenames.get(page_id)): (page_id, page_title)
+            for page_id, page_title in pages_to_export.items()
+        }
+        for completed, future in enumerate(as_completed(future_to_page), start=1):
+            page_id, page_title = future_to_page[future]
+            try:
+                downloaded = future.result()
+            except Exception as e:
+                logging.error(f"Error inesperado en la exportación concurrente de '{page_title}' (ID: {page_id}): {e}", exc_info=True)
+                downloaded = False
+
+            metricas.contar("paginas_exportadas" if downloaded else "paginas_fallidas")
+            if downloaded:
+                successful_downloads += 1
+                if on_page_exported is not None:
+                    on_page_exported(page_id, page_title, downloaded)
+            else:
+                failed_downloads += 1
+                if on_page_failed is not None:
+                    on_page_failed(page_id, page_title)
+            print(f"  [{completed}/{total_pages}] {'OK' if downloaded else 'ERROR'}: {page_title} (ID: {page_id})")
+
+    return successful_downloads, failed_downloads
+
+def export_pages_as_markdown(session, pages_to_export, base_url, output_dir, max_in_flight=DEFAULT_EXPORT_CONCURRENCY,
+                             on_page_exported=None, on_page_failed=None, filenames=None, representation="storage"):
+    """
+    Exporta las páginas como markdown sin que Confluence renderice ningún PDF: pide su contenido en bloque
+    (iter_page_bodies) con hasta `max_in_flight` lotes en paralelo, lo convierte con storage_to_markdown y
+    guarda un '.md' por página. Los callbacks y `filenames` funcionan como en export_pages_concurrently.
+    Devuelve una tupla (exportadas, fallidas).
+    """
+    if filenames is None:
+        allocator = ExportFilenameAllocator(extension=EXPORT_FILE_EXTENSIONS["markdown"])
+        filenames = {page_id: allocator.filename_for(page_id, page_title) for page_id, page_title in pages_to_export.items()}
+
+    def export_batch(batch):
+        results = []
+        for page_id, page_item in iter_page_bodies(session, base_url, batch, representation, len(batch)):
+            if page_item is None:
+                results.append((page_id, False))
+                continue
+            markdown_path = os.path.join(output_dir, filenames.get(page_id) or f"{sanitize_filename(pages_to_export[page_id])}.md")
+            try:
+                with metricas.etapa("conversion_markdown", 1, "páginas"):
+                    unchanged = write_text_file(markdown_path, page_to_markdown(page_item, representation))
+                if unchanged:
+                    metricas.contar("archivos_sin_cambios")
+                results.append((page_id, markdown_path))
+            except Exception as e:
+                logging.error(f"Error al convertir o guardar el markdown de '{pages_to_export[page_id]}' (ID: {page_id}): {e}", exc_info=True)
+                results.append((page_id, False))
+        return results
+
+    successful_exports = 0
+    failed_exports = 0
+    page_ids = list(pages_to_export)
+    batches = [page_ids[start:start + BODY_BATCH_SIZE] for start in range(0, len(page_ids), BODY_BATCH_SIZE)]
+    with ThreadPoolExecutor(max_workers=max(1, max_in_flight), thread_name_prefix="markdown-export") as executor:
+        for future in as_completed([executor.submit(export_batch, batch) for batch in batches]):
+            for page_id, markdown_path in future.result():
+                page_title = pages_to_export[page_id]
+                metricas.contar("paginas_exportadas" if markdown_path else "paginas_fallidas")
+                if markdown_path:
+                    successful_exports += 1
+                    if on_page_exported is not None:
+                        on_page_exported(page_id, page_title, markdown_path)
+                else:
+                    failed_exports += 1
+                    if on_page_failed is not None:
+                        on_page_failed(page_id, page_title)
+                print(f"  [{successful_exports + failed_exports}/{len(page_ids)}] {'OK' if markdown_path else 'ERROR'}: {page_title} (ID: {page_id})")
+
+    return successful_exports, failed_exports
+
+def load_confluence_config(space_key=None, parent_page_id=None):
+    """
+    Lee la configuración de Confluence de las variables de entorno (archivo .env).
+    Devuelve un diccionario con base_url, user, token, space_key y parent_page_id, o None si falta alguna.
+    `space_key` y `parent_page_id` sustituyen a CONFLUENCE_SPACE_KEY y CONFLUENCE_PARENT_PAGE_ID si se indican
+    (p. ej. para exportar varios espacios con las mismas credenciales); con `space_key` y sin `parent_page_id`
+    se exporta el espacio completo.
+    """
     load_dotenv()
     confluence_url_env = os.getenv("CONFLUENCE_URL")
     email_or_username = os.getenv("CONFLUENCE_USER")
     api_token_or_password = os.getenv("CONFLUENCE_TOKEN_OR_PASS") 
-    space_key_env = os.getenv("CONFLUENCE_SPACE_KEY")
-    parent_page_id_env = os.getenv("CONFLUENCE_PARENT_PAGE_ID")
+    space_key_env = space_key or os.getenv("CONFLUENCE_SPACE_KEY")
+    parent_page_id_env = str(parent_page_id) if parent_page_id else (None if space_key else os.getenv("CONFLUENCE_PARENT_PAGE_ID"))
 
     if not all([confluence_url_env, email_or_username, api_token_or_password, space_key_env]):
         print("Error: Faltan variables de entorno requeridas (CONFLUENCE_URL, CONFLUENCE_USER, CONFLUENCE_TOKEN_OR_PASS, CONFLUENCE_SPACE_KEY).")
         print("Asegúrate de que tu archivo .env está configurado correctamente.")
-        return
+        return None
     
     cleaned_confluence_url = confluence_url_env.strip()
     if cleaned_confluence_url.endswith('/'):
@@ -374,64 +1286,312 @@ def main():
     
     logging.info(f"URL base de Confluence procesada para API/Exportación: {cleaned_confluence_url}")
 
-    space_key = space_key_env.upper()
+    return {
+        'base_url': cleaned_confluence_url,
+        'user': email_or_username,
+        'token': api_token_or_password,
+        'space_key': space_key_env.upper(),
+        'parent_page_id': parent_page_id_env.strip() if parent_page_id_env and parent_page_id_env.strip() else None,
+    }
+
+def create_confluence_session(confluence_config, max_requests_per_host=DEFAULT_MAX_REQUESTS_PER_HOST, pool_maxsize=DEFAULT_EXPORT_CONCURRENCY,
+                              max_requests_per_second=DEFAULT_MAX_REQUESTS_PER_SECOND, max_retries=HTTP_MAX_RETRIES):
+    session = HostLimitedSession(max_requests_per_host=max_requests_per_host, pool_maxsize=pool_maxsize,
+                                 max_requests_per_second=max_requests_per_second, max_retries=max_retries)
+    session.auth = HTTPBasicAuth(confluence_config['user'], confluence_config['token'])
+    return session
+
+def get_root_pages(session, confluence_config):
+    """
+    Devuelve una tupla (páginas_raíz, mensaje_de_contexto): la página padre configurada o,
+    si no hay, todas las páginas del espacio. Las páginas raíz son None si no se pudieron obtener.
+    """
+    base_url = confluence_config['base_url']
+    space_key = confluence_config['space_key']
+    parent_page_id = confluence_config['parent_page_id']
+    if parent_page_id:
+        print(f"\nConfiguración cargada. ID de Página Padre Objetivo: {parent_page_id}")
+        root_page_details = get_page_details_by_id(session, parent_page_id, base_url)
+        if not root_page_details:
+            print(f"No se pudieron obtener los detalles para el ID de página padre inicial '{parent_page_id}'. Saliendo.")
+            return None, ""
+        return [root_page_details], f"\n--- Listado Jerárquico de Páginas (Comenzando desde '{root_page_details['title']}' - ID: {root_page_details['id']}) ---"
+
+    print("\nCONFLUENCE_PARENT_PAGE_ID no establecido. Procesando todas las páginas de nivel superior en el espacio.")
+    top_level_pages = get_all_pages_in_space(session, base_url, space_key, limit=CRAWL_REQUEST_LIMIT)
+    if top_level_pages is None:
+        print(f"Error al obtener las páginas del espacio '{space_key}'. Revisa el archivo de log '{LOG_FILENAME}'. Saliendo.")
+        return None, ""
+    if not top_level_pages:
+        print(f"No se encontraron páginas de nivel superior en el espacio '{space_key}'.")
+        return None, ""
+    return top_level_pages, f"\n--- Listado Jerárquico de Páginas (Todas las páginas en el Espacio: {space_key}) ---"
+
+DEFAULT_OUTPUT_DIRECTORY = "confluence_exported_pdfs_directos"
+DEFAULT_MARKDOWN_OUTPUT_DIRECTORY = "confluence_exported_markdown" # Con --format markdown
+
+def parse_args(argv=None):
+    """
+    Opciones de línea de comandos. Las que no se indican toman su valor de las variables de entorno
+    CONFLUENCE_* (o de los valores por defecto).
+    """
+    load_dotenv() # Para que los valores por defecto tengan en cuenta el archivo .env
+    parser = argparse.ArgumentParser(description="Exporta a PDF las páginas de un espacio (o rama) de Confluence.")
+    parser.add_argument("--output-dir", help=f"Directorio de salida (si no se indica, se pregunta; por defecto: {DEFAULT_OUTPUT_DIRECTORY}, "
+                                             f"o {DEFAULT_MARKDOWN_OUTPUT_DIRECTORY} con --format markdown)")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default=(os.getenv("CONFLUENCE_EXPORT_FORMAT") or "pdf").strip().lower(),
+                        help="'pdf' (Confluence renderiza cada página; para archivo) o 'markdown' (contenido pedido en bloque "
+                             "y convertido a markdown, sin renderizar PDFs; para indexar)")
+    parser.add_argument("--body-format", choices=BODY_REPRESENTATIONS, default="storage",
+                        help="Con --format markdown: convertir body.storage (por defecto) o body.view (HTML con las macros ya renderizadas)")
+    parser.add_argument("--export-concurrency", type=int, default=get_int_env("CONFLUENCE_EXPORT_CONCURRENCY", DEFAULT_EXPORT_CONCURRENCY),
+                        help="Exportaciones a PDF simultáneas")
+    parser.add_argument("--max-requests-per-host", type=int, default=get_int_env("CONFLUENCE_MAX_REQUESTS_PER_HOST", DEFAULT_MAX_REQUESTS_PER_HOST),
+                        help="Peticiones HTTP simultáneas como máximo contra el wiki")
+    parser.add_argument("--max-requests-per-second", type=float,
+                        default=get_float_env("CONFLUENCE_MAX_REQUESTS_PER_SECOND", DEFAULT_MAX_REQUESTS_PER_SECOND),
+                        help=f"Ritmo medio máximo de peticiones por host, 0 = sin límite (por defecto: {DEFAULT_MAX_REQUESTS_PER_SECOND})")
+    parser.add_argument("--max-retries", type=int, default=get_int_env("CONFLUENCE_MAX_RETRIES", HTTP_MAX_RETRIES, minimum=0),
+                        help="Reintentos de cada petición ante errores 5xx, 429 y timeouts (0 = sin reintentos)")
+    parser.add_argument("--crawl-workers", type=int, default=get_int_env("CONFLUENCE_CRAWL_WORKERS", DEFAULT_CRAWL_WORKERS),
+                        help="Hilos para recorrer el árbol de páginas")
+    parser.add_argument("--crawl-mode", choices=["bfs", "cql"], default=(os.getenv("CONFLUENCE_CRAWL_MODE") or "bfs").strip().lower(),
+                        help="Recorrido del árbol: BFS por niveles o una búsqueda CQL de descendientes")
+    parser.add_argument("--incremental", action="store_true", default=get_bool_env("CONFLUENCE_INCREMENTAL_SYNC"),
+                        help="Exportar solo las páginas nuevas o modificadas desde la última ejecución")
+    parser.add_argument("--prune-deleted", action="store_true", default=get_bool_env("CONFLUENCE_PRUNE_DELETED_PDFS"),
+                        help="Con --incremental, eliminar los PDFs de páginas borradas en Confluence")
+    parser.add_argument("--restart", action="store_true",
+                        help=f"Ignorar el checkpoint '{CHECKPOINT_FILENAME}' de una ejecución anterior y empezar desde cero")
+    parser.add_argument("--log-level", choices=LOG_LEVELS, type=str.upper,
+                        default=(os.getenv("CONFLUENCE_LOG_LEVEL") or DEFAULT_LOG_LEVEL).strip().upper(),
+                        help=f"Nivel del archivo de log '{LOG_FILENAME}' (por defecto: {DEFAULT_LOG_LEVEL})")
+    instrumentation.anadir_argumentos(parser)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_logging(log_level=args.log_level)
+    instrumentation.configurar_desde_args(args)
+    export_format = args.format
+    export_label = "PDFs" if export_format == "pdf" else "archivos markdown"
+    print(f"Listador de Páginas de Confluence - Exportación Recursiva a {'PDF (Descarga Directa)' if export_format == 'pdf' else 'Markdown'}")
+    print("---------------------------------------------------------------------------------")
+    
+    output_directory = args.output_dir
+    if not output_directory:
+        default_output_directory = DEFAULT_OUTPUT_DIRECTORY if export_format == "pdf" else DEFAULT_MARKDOWN_OUTPUT_DIRECTORY
+        output_directory_prompt = input(f"Introduce el nombre para el directorio de salida de los {export_label} (default: {default_output_directory}): ").strip()
+        output_directory = output_directory_prompt if output_directory_prompt else default_output_directory
+    
+    if not os.path.exists(output_directory):
+        try:
+            os.makedirs(output_directory)
+            print(f"Directorio de salida creado: {output_directory}")
+        except OSError as e:
+            print(f"Error al crear el directorio de salida '{output_directory}': {e}")
+            return
+    print(f"Los {export_label} se guardarán en el directorio: {output_directory}")
+
+    confluence_config = load_confluence_config()
+    if confluence_config is None:
+        return
+    cleaned_confluence_url = confluence_config['base_url']
+    space_key = confluence_config['space_key']
+    parent_page_id_env = confluence_config['parent_page_id']
+    export_concurrency = args.export_concurrency
+    max_requests_per_host = args.max_requests_per_host
+    crawl_workers = args.crawl_workers
+    crawl_mode = args.crawl_mode
+    incremental_sync = args.incremental
+    prune_deleted_pdfs = args.prune_deleted
+    export_scope = f"{space_key}:{parent_page_id_env or '*'}" + (f":{export_format}" if export_format != "pdf" else "")
     
-    session = requests.Session()
-    session.auth = HTTPBasicAuth(email_or_username, api_token_or_password)
+    session = create_confluence_session(confluence_config, max_requests_per_host, export_concurrency,
+                                        args.max_requests_per_second, args.max_retries)
     
     all_displayed_pages_details = {} 
-    processed_page_ids_for_recursion_control = set() 
-    listing_context_message = ""
-    root_pages_for_hierarchy = []
+    all_displayed_pages_versions = {}
 
-    if parent_page_id_env and parent_page_id_env.strip() != "":
-        print(f"\nConfiguración cargada. ID de Página Padre Objetivo: {parent_page_id_env}")
-        root_page_details = get_page_details_by_id(session, parent_page_id_env, cleaned_confluence_url)
-        if not root_page_details:
-            print(f"No se pudieron obtener los detalles para el ID de página padre inicial '{parent_page_id_env}'. Saliendo.")
-            return
-        root_pages_for_hierarchy = [root_page_details]
-        listing_context_message = f"\n--- Listado Jerárquico de Páginas (Comenzando desde '{root_page_details['title']}' - ID: {root_page_details['id']}) ---"
+    checkpoint = None if args.restart else load_checkpoint(output_directory, export_scope)
+    if checkpoint is not None:
+        print(f"\nReanudando la ejecución iniciada el {checkpoint.get('startedAt')} (checkpoint '{CHECKPOINT_FILENAME}'): "
+              f"{len(checkpoint['export']['done'])} páginas ya exportadas, {len(checkpoint['export']['failed'])} fallidas. "
+              f"Usa --restart para empezar desde cero.")
+        if checkpoint['crawl']['complete']:
+            # El árbol guardado puede estar desfasado (páginas nuevas o movidas): se vuelve a recorrer.
+            # Las páginas ya exportadas solo se omiten si su versión no cambió (ver más abajo).
+            checkpoint['crawl'] = new_checkpoint(export_scope)['crawl']
+    else:
+        checkpoint = new_checkpoint(export_scope)
+    crawl_state = checkpoint['crawl']
+
+    if crawl_state['roots']:
+        root_pages_for_hierarchy, listing_context_message = crawl_state['roots'], crawl_state['listingMessage']
     else:
-        print("\nCONFLUENCE_PARENT_PAGE_ID no establecido. Procesando todas las páginas de nivel superior en el espacio.")
-        top_level_pages = get_all_pages_in_space(session, cleaned_confluence_url, space_key)
-        if not top_level_pages:
-            print(f"No se encontraron páginas de nivel superior en el espacio '{space_key}'.")
+        root_pages_for_hierarchy, listing_context_message = get_root_pages(session, confluence_config)
+        if not root_pages_for_hierarchy:
             return
-        root_pages_for_hierarchy = top_level_pages
-        listing_context_message = f"\n--- Listado Jerárquico de Páginas (Todas las páginas en el Espacio: {space_key}) ---"
+        crawl_state['roots'], crawl_state['listingMessage'] = root_pages_for_hierarchy, listing_context_message
+        save_checkpoint(output_directory, checkpoint)
     
+    crawl_failed_parents = set()
+    def on_level_complete(children_so_far, frontier):
+        record_crawl_progress(checkpoint, children_so_far, frontier, crawl_failed_parents)
+        save_checkpoint(output_directory, checkpoint)
+
+    resume_from = (crawl_state['childrenByParent'], crawl_state['frontier']) if crawl_state['frontier'] is not None else None
+    if resume_from:
+        print(f"Continuando el recorrido del árbol: {len(resume_from[0])} páginas ya expandidas, {len(resume_from[1])} pendientes.")
+    crawl_started_at = time.perf_counter()
+    children_by_parent = crawl_page_tree(
+        session, root_pages_for_hierarchy, cleaned_confluence_url, space_key,
+        max_workers=crawl_workers, crawl_mode="bfs" if resume_from else crawl_mode,
+        parent_page_id=root_pages_for_hierarchy[0]['id'] if parent_page_id_env else None,
+        failed_parents=crawl_failed_parents, resume_from=resume_from, on_level_complete=on_level_complete
+    )
+    metricas.registrar_etapa("recorrido_arbol", time.perf_counter() - crawl_started_at,
+                             len(root_pages_for_hierarchy) + sum(len(children) for children in children_by_parent.values()), "páginas")
+    record_crawl_progress(checkpoint, children_by_parent, [], crawl_failed_parents)
+    crawl_state['complete'] = not crawl_failed_parents
+    save_checkpoint(output_directory, checkpoint)
     print(listing_context_message)
+    display_page_tree(root_pages_for_hierarchy, children_by_parent, all_displayed_pages_details, all_displayed_pages_versions)
+    
+    manifest = load_export_manifest(output_directory)
+    foreign_manifest_pages = {}
+    if manifest.get('scope') not in (None, export_scope):
+        # Las entradas de otro ámbito (espacio, padre o formato) no se reetiquetan: en este ámbito parecerían
+        # páginas eliminadas y --prune-deleted borraría sus archivos. Se empieza un manifiesto nuevo y sus
+        # nombres de archivo solo se reservan para no sobrescribir esos archivos.
+        print(f"\nAdvertencia: el manifiesto de '{output_directory}' es de otro ámbito ('{manifest.get('scope')}' != '{export_scope}'). "
+              f"Se empieza uno nuevo para este ámbito; los archivos existentes no se tocan.")
+        foreign_manifest_pages = manifest.get('pages', {})
+        manifest = {'scope': export_scope, 'pages': {}}
+    pages_to_export = all_displayed_pages_details
+    if incremental_sync:
+        print("\n--- Sincronización Incremental ---")
+        pages_to_export, unchanged_pages, deleted_pages = plan_incremental_export(
+            all_displayed_pages_details, all_displayed_pages_versions, manifest, export_scope, export_format
+        )
+        print(f"  Páginas nuevas o modificadas: {len(pages_to_export)}")
+        print(f"  Páginas sin cambios (se omiten): {len(unchanged_pages)}")
+        if crawl_failed_parents and deleted_pages:
+            # Las páginas bajo una página cuyos hijos no se pudieron obtener parecerían eliminadas
+            print(f"  No se detectan páginas eliminadas ni se borran archivos: no se pudieron obtener los hijos de "
+                  f"{len(crawl_failed_parents)} páginas, así que el árbol está incompleto.")
+            deleted_pages = {}
+        else:
+            print(f"  Páginas eliminadas en Confluence: {len(deleted_pages)}")
+        for page_id, entry in deleted_pages.items():
+            print(f"    - {entry.get('title', 'N/A')} (ID: {page_id}) -> {entry.get('path')}")
+            if prune_deleted_pdfs:
+                if entry.get('path') and os.path.exists(entry['path']):
+                    try:
+                        os.remove(entry['path'])
+                        print(f"      PDF eliminado: {entry['path']}")
+                    except OSError as e:
+                        print(f"      Error al eliminar el PDF '{entry['path']}': {e}")
+                        continue
+                manifest['pages'].pop(page_id, None)
+        if deleted_pages and not prune_deleted_pdfs:
+            print("  Usa --prune-deleted (o CONFLUENCE_PRUNE_DELETED_PDFS=true) para eliminar sus PDFs automáticamente.")
+    manifest['scope'] = export_scope
+    # Nombres de archivo únicos para todas las páginas mostradas (no solo las que se exportan ahora),
+    # manteniendo los de ejecuciones anteriores, para que dos títulos iguales no se sobrescriban
+    filename_allocator = ExportFilenameAllocator(
+        {page_id: os.path.basename(entry['path']) for page_id, entry in {**foreign_manifest_pages, **manifest['pages']}.items()
+         if entry.get('path') and entry.get('format', 'pdf') == export_format},
+        EXPORT_FILE_EXTENSIONS[export_format]
+    )
+    export_filenames = {page_id: filename_allocator.filename_for(page_id, page_title)
+                        for page_id, page_title in all_displayed_pages_details.items()}
+
+    export_state = checkpoint['export']
+    # Solo se omiten las páginas exportadas en la ejecución interrumpida que no han cambiado desde entonces
+    current_versions = {str(page_id): (versions or {}).get('version') for page_id, versions in all_displayed_pages_versions.items()}
+    already_exported = {page_id for page_id, done in export_state['done'].items()
+                        if isinstance(done, dict) and os.path.exists(done['path'])
+                        and done.get('version') is not None and done.get('version') == current_versions.get(page_id)}
+    # Las páginas fallidas que ya no están en el árbol (borradas o movidas fuera) no se reintentan
+    for page_id in [page_id for page_id in export_state['failed'] if page_id not in current_versions]:
+        export_state['failed'].pop(page_id)
+    if already_exported:
+        pages_to_export = {page_id: page_title for page_id, page_title in pages_to_export.items() if str(page_id) not in already_exported}
+        print(f"  Páginas ya exportadas en la ejecución interrumpida (se omiten): {len(already_exported)}")
+
+    exported_since_save = 0
+    changes_since_checkpoint = 0
+    def on_export_progress():
+        nonlocal changes_since_checkpoint
+        changes_since_checkpoint += 1
+        if changes_since_checkpoint >= CHECKPOINT_SAVE_EVERY:
+            save_checkpoint(output_directory, checkpoint)
+            changes_since_checkpoint = 0
+
+    def on_page_exported(page_id, page_title, pdf_path):
+        nonlocal exported_since_save
+        record_exported_page(manifest, page_id, page_title, pdf_path, all_displayed_pages_versions.get(page_id, {}), export_format)
+        exported_since_save += 1
+        if exported_since_save >= MANIFEST_SAVE_EVERY:
+            save_export_manifest(output_directory, manifest)
+            exported_since_save = 0
+        export_state['done'][str(page_id)] = {'path': pdf_path, 'version': (all_displayed_pages_versions.get(page_id) or {}).get('version')}
+        export_state['failed'].pop(str(page_id), None)
+        on_export_progress()
+
+    def on_page_failed(page_id, page_title):
+        previous = export_state['failed'].get(str(page_id)) or {}
+        export_state['failed'][str(page_id)] = {'title': page_title, 'attempts': previous.get('attempts', 0) + 1}
+        on_export_progress()
 
-    for page_summary in root_pages_for_hierarchy:
-        display_direct_children_recursively(
-            session, page_summary['id'], page_summary['title'], 0, 
-            cleaned_confluence_url, space_key, 
-            processed_page_ids_for_recursion_control, all_displayed_pages_details
+    print("\n--- Descarga de PDF Directa desde Confluence ---" if export_format == "pdf" else "\n--- Exportación del Contenido a Markdown ---")
+    if not pages_to_export:
+        print("No se identificaron páginas para exportar.")
+    elif export_format == "markdown":
+        print(f"Exportando {len(pages_to_export)} páginas únicas identificadas en lotes de {BODY_BATCH_SIZE} "
+              f"({export_concurrency} lotes simultáneos, body.{args.body_format})...")
+        successful_downloads, failed_downloads = export_pages_as_markdown(
+            session, pages_to_export, cleaned_confluence_url, output_directory, export_concurrency,
+            on_page_exported=on_page_exported, on_page_failed=on_page_failed, filenames=export_filenames,
+            representation=args.body_format
         )
-    
-    print("\n--- Descarga de PDF Directa desde Confluence ---")
-    if not all_displayed_pages_details:
-        print("No se identificaron páginas para la descarga de PDF.")
     else:
-        print(f"Descargando PDFs desde {len(all_displayed_pages_details)} páginas únicas identificadas...")
+        print(f"Descargando PDFs desde {len(pages_to_export)} páginas únicas identificadas "
+              f"({export_concurrency} exportaciones simultáneas, máx. {max_requests_per_host} peticiones por host)...")
         
-        successful_downloads = 0
-        failed_downloads = 0
-
-        for i, (page_id, page_title) in enumerate(all_displayed_pages_details.items()):
-            print(f"  Procesando PDF para: {page_title} (ID: {page_id}) ({i+1}/{len(all_displayed_pages_details)})")
-            
-            if download_page_as_pdf(session, page_id, page_title, cleaned_confluence_url, output_directory):
-                successful_downloads += 1
-            else:
-                failed_downloads += 1
-        
-        print(f"\nDescarga de PDFs completada.")
+        successful_downloads, failed_downloads = export_pages_concurrently(
+            session, pages_to_export, cleaned_confluence_url, output_directory, export_concurrency,
+            on_page_exported=on_page_exported, on_page_failed=on_page_failed, pdf_filenames=export_filenames
+        )
+    if pages_to_export:
+        print(f"\nExportación de {export_label} completada.")
         print(f"  Descargas exitosas: {successful_downloads}")
         print(f"  Descargas fallidas: {failed_downloads}")
         if failed_downloads > 0:
             print(f"  Revisa el archivo de log '{LOG_FILENAME}' para detalles sobre las fallas.")
+    save_export_manifest(output_directory, manifest)
+
+    if crawl_failed_parents:
+        print(f"\nAtención: no se pudieron obtener los hijos de {len(crawl_failed_parents)} páginas; el árbol puede estar incompleto.")
+    # Las páginas que fallan en CHECKPOINT_MAX_PAGE_ATTEMPTS ejecuciones dejan de mantener vivo el checkpoint
+    abandoned_pages = {page_id: entry for page_id, entry in export_state['failed'].items()
+                       if entry['attempts'] >= CHECKPOINT_MAX_PAGE_ATTEMPTS}
+    if abandoned_pages:
+        print(f"\nAtención: {len(abandoned_pages)} páginas han fallado en {CHECKPOINT_MAX_PAGE_ATTEMPTS} ejecuciones y no se reintentarán "
+              f"desde el checkpoint (se volverán a intentar en la próxima exportación completa o incremental):")
+        for page_id, entry in abandoned_pages.items():
+            print(f"    - {entry['title']} (ID: {page_id}, intentos: {entry['attempts']})")
+            export_state['failed'].pop(page_id)
+    if export_state['failed'] or not crawl_state['complete']:
+        save_checkpoint(output_directory, checkpoint)
+        print(f"Checkpoint guardado en '{os.path.join(output_directory, CHECKPOINT_FILENAME)}': vuelve a ejecutar el script "
+              f"para reintentar solo las {len(export_state['failed'])} páginas fallidas"
+              f"{' y las ramas del árbol que faltan' if not crawl_state['complete'] else ''}.")
+        for page_id, entry in export_state['failed'].items():
+            print(f"    - {entry['title']} (ID: {page_id}, intentos: {entry['attempts']})")
+    else:
+        delete_checkpoint(output_directory)
 
     print("\n--- Resumen de Todas las Páginas Mostradas (también procesadas para PDF) ---")
     if all_displayed_pages_details:
@@ -440,6 +1600,7 @@ def main():
             print(f"  {i+1}. Título: {page_title} (ID: {page_id})")
     else:
         print("No se mostraron/procesaron páginas.")
+    instrumentation.mostrar_resumen()
     print("\n--- Fin del Script ---")
 
 if __name__ == "__main__":
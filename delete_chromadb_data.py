@@ -1,11 +1,25 @@
-import chromadb
-from chromadb.config import Settings # Importar Settings
+import argparse # Para la interfaz de línea de comandos
+import json # Para actualizar el índice de ingesta
 import os
 import shutil # Para borrar la carpeta si es necesario después del reset
+import sqlite3 # Para compactar la base de datos tras un borrado selectivo
+
+from export_chromadb_data import iterar_lotes # Lectura de la colección por lotes con limit/offset
+from add_documents_to_chromadb import id_documento_de, indice_es_de, rutas_de_indices # ID de archivo de un fragmento e índices de cada colección
+from query_cache import registrar_en_diario # Diario de ingesta para invalidar cachés de consultas
+from bm25_index import IndiceBM25, borrar_archivo_indice # Índice BM25 que acompaña a la colección
 
 # --- CONFIGURACIÓN ---
 # Ruta a la carpeta de tu base de datos ChromaDB persistente
 CHROMA_DB_PATH = "./my_chroma_db" 
+# El índice de ingesta y el índice BM25 de cada colección y base de datos (rutas_de_indices de add_documents_to_chromadb.py)
+# se actualizan o borran junto con ella
+# Colección por defecto para el borrado selectivo
+COLLECTION_NAME = "shared"
+# IDs por llamada a collection.get al buscar qué borrar y por llamada a collection.delete
+DELETE_BATCH_SIZE = 1000
+# Archivo SQLite de ChromaDB dentro de CHROMA_DB_PATH (se compacta con VACUUM si se pide)
+CHROMA_SQLITE_FILENAME = "chroma.sqlite3"
 
 def borrar_toda_la_base_de_datos(db_path):
     """
@@ -15,6 +29,7 @@ def borrar_toda_la_base_de_datos(db_path):
     print("--- ¡ADVERTENCIA! ---")
     print(f"Estás a punto de borrar TODAS LAS COLECCIONES Y DATOS de la base de datos ChromaDB ubicada en: '{db_path}'.")
     print("Esta acción es IRREVERSIBLE.")
+    print("Para poder recuperarla sin volver a calcular los embeddings, crea antes una instantánea: python snapshot_chromadb.py snapshot")
     
     confirmacion_texto = input(f"¿Estás seguro de que quieres continuar? (s/N): ")
     
@@ -26,6 +41,9 @@ def borrar_toda_la_base_de_datos(db_path):
         print(f"La carpeta de la base de datos '{db_path}' no existe. No hay nada que borrar.")
         return
 
+    # Importación diferida: chromadb solo se carga si de verdad hay que borrar algo
+    import chromadb
+    from chromadb.config import Settings # Importar Settings
     try:
         print(f"\nConectando a la base de datos ChromaDB en: {db_path}...")
         # Modificación: Inicializar el cliente con la configuración para permitir el reseteo
@@ -34,10 +52,19 @@ def borrar_toda_la_base_de_datos(db_path):
             settings=Settings(allow_reset=True) # Habilitar la función reset
         )
         print("Cliente de ChromaDB (persistente) inicializado con la opción de reseteo habilitada.")
+        # Los índices de todas las colecciones (y los de la colección por defecto aunque no exista) quedan obsoletos
+        rutas_indices = {rutas_de_indices(COLLECTION_NAME, db_path)}
+        rutas_indices.update(rutas_de_indices(coll_obj.name, db_path) for coll_obj in client.list_collections())
         
         print("Reseteando la base de datos (eliminando todas las colecciones y datos)...")
         client.reset() # ¡Esta es la operación que borra todo!
+        registrar_en_diario("reset", None)
         print("¡Base de datos reseteada exitosamente! Todas las colecciones han sido eliminadas.")
+        for ruta_indice, ruta_bm25 in sorted(rutas_indices):
+            borrar_archivo_indice(ruta_bm25)
+            if os.path.exists(ruta_indice):
+                os.remove(ruta_indice)
+                print(f"Índice de ingesta '{ruta_indice}' eliminado (los archivos se volverán a añadir en la próxima carga).")
 
         confirmacion_carpeta = input(f"La base de datos ha sido reseteada. ¿Deseas también eliminar la carpeta física '{db_path}' del sistema de archivos? (s/N): ")
         if confirmacion_carpeta.lower() == 's':
@@ -60,5 +87,219 @@ def borrar_toda_la_base_de_datos(db_path):
     except Exception as e:
         print(f"Ocurrió un error durante el proceso de borrado: {e}")
 
+def filtro_de_metadatos(source_file=None, file_type=None):
+    """
+    Construye el filtro `where` de ChromaDB para los metadatos indicados (None si no hay ninguno).
+    """
+    condiciones = [{clave: valor} for clave, valor in (("source_file", source_file), ("file_type", file_type)) if valor]
+    if not condiciones:
+        return None
+    return condiciones[0] if len(condiciones) == 1 else {"$and": condiciones}
+
+def es_huerfano(id_fragmento, metadatos):
+    """
+    True si el fragmento viene de un archivo ('file::<ruta>') que ya no existe en disco.
+    """
+    id_documento = (metadatos or {}).get("document_id") or id_documento_de(id_fragmento)
+    return id_documento.startswith("file::") and not os.path.isfile(id_documento[len("file::"):])
+
+def buscar_ids_a_borrar(collection, where=None, prefijo_id=None, solo_huerfanos=False, tamano_lote=DELETE_BATCH_SIZE):
+    """
+    Devuelve los IDs que cumplen todos los criterios: filtro de metadatos `where`, prefijo de ID y,
+    si se pide, pertenecer a archivos que ya no existen. Primero se recorren todos los lotes y
+    luego se borra, para que los offsets no se desplacen mientras se pagina.
+    """
+    include = ['metadatas'] if solo_huerfanos else []
+    ids = []
+    for data in iterar_lotes(collection, include, tamano_lote, where=where):
+        metadatos = data.get('metadatas') or [None] * len(data['ids'])
+        for id_fragmento, metadatos_fragmento in zip(data['ids'], metadatos):
+            if prefijo_id and not id_fragmento.startswith(prefijo_id):
+                continue
+            if solo_huerfanos and not es_huerfano(id_fragmento, metadatos_fragmento):
+                continue
+            ids.append(id_fragmento)
+    return ids
+
+def actualizar_indice_ingesta(collection_name, ids_borrados, ruta_indice=None, db_path=CHROMA_DB_PATH):
+    """
+    Quita del índice de add_documents_to_chromadb.py los IDs borrados. Los archivos que se quedan sin
+    fragmentos salen del índice, así que si siguen en la carpeta se volverán a añadir en la próxima carga.
+    Devuelve las rutas que salieron del índice.
+    """
+    ruta_indice = ruta_indice or rutas_de_indices(collection_name, db_path)[0]
+    try:
+        with open(ruta_indice, 'r', encoding='utf-8') as f:
+            indice = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return []
+    if not indice_es_de(indice, collection_name, db_path):
+        return []
+    ids_borrados = set(ids_borrados)
+    rutas_quitadas = []
+    for ruta_archivo, entrada in list(indice.get("files", {}).items()):
+        ids_restantes = [id_fragmento for id_fragmento in entrada.get("ids", []) if id_fragmento not in ids_borrados]
+        if len(ids_restantes) == len(entrada.get("ids", [])):
+            continue
+        if ids_restantes:
+            entrada["ids"] = ids_restantes
+        else:
+            del indice["files"][ruta_archivo]
+            rutas_quitadas.append(ruta_archivo)
+    ruta_temporal = f"{ruta_indice}.tmp"
+    with open(ruta_temporal, 'w', encoding='utf-8') as f:
+        json.dump(indice, f, ensure_ascii=False)
+    os.replace(ruta_temporal, ruta_indice)
+    return rutas_quitadas
+
+def compactar_base_de_datos(db_path):
+    """
+    Ejecuta VACUUM sobre el archivo SQLite de ChromaDB para devolver al disco el espacio de los
+    registros borrados. El índice HNSW no se reduce (ChromaDB marca los vectores borrados).
+    """
+    ruta_sqlite = os.path.join(db_path, CHROMA_SQLITE_FILENAME)
+    if not os.path.exists(ruta_sqlite):
+        print(f"No se encontró '{ruta_sqlite}'; no hay nada que compactar.")
+        return
+    tamano_antes = os.path.getsize(ruta_sqlite)
+    print(f"Compactando '{ruta_sqlite}' ({tamano_antes / 1024 ** 2:.1f} MB)...")
+    conexion = sqlite3.connect(ruta_sqlite)
+    try:
+        conexion.execute("VACUUM")
+    finally:
+        conexion.close()
+    tamano_despues = os.path.getsize(ruta_sqlite)
+    print(f"Compactación completada: {tamano_despues / 1024 ** 2:.1f} MB ({(tamano_antes - tamano_despues) / 1024 ** 2:.1f} MB liberados).")
+
+def borrar_coleccion(db_path, collection_name, dry_run=False, confirmar=True):
+    """
+    Elimina una colección completa (el resto de colecciones no se tocan).
+    """
+    import chromadb # Importación diferida
+    client = chromadb.PersistentClient(path=db_path)
+    try:
+        collection = client.get_collection(name=collection_name)
+    except Exception as e:
+        print(f"Error al obtener la colección '{collection_name}': {e}")
+        return False
+    print(f"La colección '{collection_name}' tiene {collection.count()} fragmentos.")
+    if dry_run:
+        print("[Dry run] No se ha borrado nada.")
+        return False
+    if confirmar and input(f"¿Borrar la colección '{collection_name}' completa? (s/N): ").lower() != 's':
+        print("Operación de borrado cancelada por el usuario.")
+        return False
+    client.delete_collection(name=collection_name)
+    registrar_en_diario("reset", collection_name)
+    print(f"Colección '{collection_name}' eliminada.")
+    borrar_indices_de_coleccion(collection_name, db_path)
+    return True
+
+def borrar_indices_de_coleccion(collection_name, db_path=CHROMA_DB_PATH):
+    """
+    Borra el índice BM25 y el índice de ingesta de la colección de `db_path`, si de verdad son suyos.
+    """
+    ruta_indice, ruta_bm25 = rutas_de_indices(collection_name, db_path)
+    if os.path.exists(ruta_bm25):
+        indice_bm25 = IndiceBM25(ruta_bm25)
+        es_de_la_coleccion = indice_bm25.coleccion() == collection_name
+        indice_bm25.cerrar()
+        if es_de_la_coleccion:
+            borrar_archivo_indice(ruta_bm25)
+            print(f"Índice BM25 '{ruta_bm25}' eliminado.")
+    try:
+        with open(ruta_indice, 'r', encoding='utf-8') as f:
+            indice_de_la_coleccion = indice_es_de(json.load(f), collection_name, db_path)
+    except (OSError, json.JSONDecodeError):
+        indice_de_la_coleccion = False
+    if indice_de_la_coleccion:
+        os.remove(ruta_indice)
+        print(f"Índice de ingesta '{ruta_indice}' eliminado.")
+
+def borrar_seleccion(db_path, collection_name, where=None, prefijo_id=None, solo_huerfanos=False, dry_run=False,
+                     confirmar=True, tamano_lote=DELETE_BATCH_SIZE):
+    """
+    Borra de una colección los fragmentos que cumplen los criterios, en llamadas a collection.delete
+    de como mucho `tamano_lote` IDs, y actualiza el índice de ingesta. Devuelve True si se borró algo.
+    """
+    import chromadb # Importación diferida
+    client = chromadb.PersistentClient(path=db_path)
+    try:
+        collection = client.get_collection(name=collection_name)
+    except Exception as e:
+        print(f"Error al obtener la colección '{collection_name}': {e}")
+        return False
+
+    print(f"Buscando fragmentos a borrar en la colección '{collection_name}' ({collection.count()} fragmentos)...")
+    ids = buscar_ids_a_borrar(collection, where, prefijo_id, solo_huerfanos, tamano_lote)
+    documentos = sorted({id_documento_de(id_fragmento) for id_fragmento in ids})
+    print(f"{len(ids)} fragmentos de {len(documentos)} documentos cumplen los criterios.")
+    for id_documento in documentos[:20]:
+        print(f"  - {id_documento}")
+    if len(documentos) > 20:
+        print(f"  ... y {len(documentos) - 20} documentos más.")
+    if not ids:
+        return False
+    if dry_run:
+        print("[Dry run] No se ha borrado nada.")
+        return False
+    if confirmar and input(f"¿Borrar estos {len(ids)} fragmentos? (s/N): ").lower() != 's':
+        print("Operación de borrado cancelada por el usuario.")
+        return False
+
+    borrados = []
+    for inicio in range(0, len(ids), tamano_lote):
+        lote = ids[inicio:inicio + tamano_lote]
+        try:
+            collection.delete(ids=lote)
+        except Exception as e:
+            print(f"Error al borrar un lote de {len(lote)} fragmentos: {e}")
+            continue
+        borrados.extend(lote)
+        print(f"    Progreso: {len(borrados)}/{len(ids)} fragmentos borrados")
+    registrar_en_diario("delete", collection_name, {id_documento_de(id_fragmento) for id_fragmento in borrados})
+    ruta_bm25 = rutas_de_indices(collection_name, db_path)[1]
+    if os.path.exists(ruta_bm25):
+        indice_bm25 = IndiceBM25(ruta_bm25)
+        if indice_bm25.coleccion() == collection_name:
+            indice_bm25.borrar(borrados)
+        indice_bm25.cerrar()
+    rutas_quitadas = actualizar_indice_ingesta(collection_name, borrados, db_path=db_path)
+    print(f"{len(borrados)} fragmentos borrados. Quedan {collection.count()} en la colección '{collection_name}'.")
+    if rutas_quitadas:
+        print(f"{len(rutas_quitadas)} archivos salieron del índice de ingesta; si siguen en la carpeta de documentos se volverán a añadir en la próxima carga.")
+    return bool(borrados)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Borra datos de una base de datos ChromaDB: todo (por defecto), una colección o los fragmentos que cumplan unos criterios."
+    )
+    parser.add_argument("--db", default=CHROMA_DB_PATH, help=f"Ruta de la base de datos ChromaDB (por defecto: {CHROMA_DB_PATH})")
+    parser.add_argument("--coleccion", default=COLLECTION_NAME, help=f"Colección para el borrado selectivo (por defecto: {COLLECTION_NAME})")
+    parser.add_argument("--borrar-coleccion", action="store_true", help="Borrar la colección indicada completa")
+    parser.add_argument("--source-file", help="Borrar los fragmentos con este metadato source_file")
+    parser.add_argument("--file-type", help="Borrar los fragmentos con este metadato file_type (p. ej. pdf o txt)")
+    parser.add_argument("--prefijo-id", help="Borrar los fragmentos cuyo ID empieza por este prefijo (p. ej. 'file::shared/Espacio_')")
+    parser.add_argument("--huerfanos", action="store_true", help="Borrar los fragmentos de archivos que ya no existen en disco")
+    parser.add_argument("--dry-run", action="store_true", help="Solo contar lo que se borraría")
+    parser.add_argument("--compactar", action="store_true", help="Compactar el archivo SQLite de ChromaDB después de borrar")
+    parser.add_argument("--si", action="store_true", help="No pedir confirmación")
+    parser.add_argument("--tamano-lote", type=int, default=DELETE_BATCH_SIZE, help="IDs por llamada a collection.get/delete")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    where = filtro_de_metadatos(args.source_file, args.file_type)
+    if args.borrar_coleccion:
+        borrado = borrar_coleccion(args.db, args.coleccion, args.dry_run, not args.si)
+    elif where or args.prefijo_id or args.huerfanos:
+        borrado = borrar_seleccion(args.db, args.coleccion, where, args.prefijo_id, args.huerfanos, args.dry_run,
+                                   not args.si, max(1, args.tamano_lote))
+    else:
+        borrar_toda_la_base_de_datos(args.db) # Sin criterios: comportamiento de siempre
+        return
+    if borrado and args.compactar:
+        compactar_base_de_datos(args.db)
+
 if __name__ == "__main__":
-    borrar_toda_la_base_de_datos(CHROMA_DB_PATH)
+    main()
@@ -0,0 +1,167 @@
+import hashlib # Para las claves de la caché de embeddings
+import os
+import re
+import time
+
+import numpy as np
+
+# --- CONFIGURACIÓN ---
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+# Textos por llamada al modelo
+EMBEDDING_BATCH_SIZE = 64
+# Hilos intra-op de torch (None = valor por defecto de torch)
+TORCH_THREADS = None
+# "torch": sentence-transformers en GPU si hay, si no en CPU
+# "torch-quantized": sentence-transformers en CPU con las capas lineales cuantizadas a int8
+# "onnx": all-MiniLM-L6-v2 con onnxruntime (el modelo ONNX que incluye chromadb); sus vectores
+#         salen normalizados, así que no conviene mezclarlo con "torch" en una misma colección
+EMBEDDING_BACKEND = "torch"
+# Caché de embeddings en disco: hash(texto + modelo + backend) -> vector float32
+EMBEDDING_CACHE_DIR = "./cache_embeddings"
+
+def nombre_seguro(texto):
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', texto)
+
+class CacheEmbeddings:
+    """
+    Caché de embeddings direccionada por contenido: cada vector se guarda como float32 crudo
+    en un archivo cuyo nombre es el hash del texto, así que un fragmento idéntico (repetido en
+    varias páginas o reingerido) no vuelve a pasar por el modelo.
+    """
+    def __init__(self, directorio=EMBEDDING_CACHE_DIR, espacio=EMBEDDING_MODEL_NAME):
+        self.directorio = os.path.join(directorio, nombre_seguro(espacio))
+        self.aciertos = 0
+        self.fallos = 0
+
+    def clave(self, texto):
+        return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+    def _ruta(self, clave):
+        return os.path.join(self.directorio, clave[:2], f"{clave}.f32")
+
+    def obtener(self, clave):
+        try:
+            vector = np.fromfile(self._ruta(clave), dtype=np.float32)
+        except (OSError, ValueError):
+            self.fallos += 1
+            return None
+        if vector.size == 0:
+            self.fallos += 1
+            return None
+        self.aciertos += 1
+        return vector
+
+    def guardar(self, clave, vector):
+        ruta = self._ruta(clave)
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        ruta_temporal = f"{ruta}.{os.getpid()}.tmp"
+        np.asarray(vector, dtype=np.float32).tofile(ruta_temporal)
+        os.replace(ruta_temporal, ruta)
+
+    def resumen(self):
+        consultas = self.aciertos + self.fallos
+        ratio = (self.aciertos / consultas * 100) if consultas else 0.0
+        return f"{self.aciertos} aciertos, {self.fallos} fallos ({ratio:.1f}% de aciertos)"
+
+class EtapaEmbeddings:
+    """
+    Calcula embeddings en lotes de tamaño configurable, con el número de hilos de torch y el
+    backend elegidos, y reutiliza los vectores ya calculados a través de la caché en disco.
+    También sirve como función de embedding de la colección de ChromaDB (método __call__),
+    así el modelo se carga una sola vez para la ingesta y para las consultas.
+    """
+    def __init__(self, model_name=EMBEDDING_MODEL_NAME, backend=EMBEDDING_BACKEND, batch_size=EMBEDDING_BATCH_SIZE,
+                 torch_threads=TORCH_THREADS, cache=None, usar_cache=True):
+        self.model_name = model_name
+        self.backend = backend
+        self.batch_size = max(1, batch_size)
+        self.torch_threads = torch_threads
+        if cache is None and usar_cache:
+            cache = CacheEmbeddings(EMBEDDING_CACHE_DIR, f"{model_name}-{backend}")
+        self.cache = cache
+        self.textos_calculados = 0
+        self.segundos_de_modelo = 0.0
+        self._modelo = None
+        self._onnx = None
+        self.dispositivo = None
+
+    def cargar(self):
+        """Carga el modelo (solo la primera vez)."""
+        if self._modelo is not None or self._onnx is not None:
+            return
+        if self.backend == "onnx":
+            from chromadb.utils.embedding_functions import ONNXMiniLM_L6_V2
+            if self.model_name != "all-MiniLM-L6-v2":
+                raise ValueError(f"El backend 'onnx' solo está disponible para 'all-MiniLM-L6-v2', no para '{self.model_name}'.")
+            self._onnx = ONNXMiniLM_L6_V2()
+            self.dispositivo = "cpu (onnxruntime)"
+            return
+
+        import torch
+        from sentence_transformers import SentenceTransformer
+        if self.torch_threads:
+            torch.set_num_threads(self.torch_threads)
+        if self.backend == "torch-quantized":
+            self.dispositivo = "cpu"
+        elif torch.cuda.is_available():
+            self.dispositivo = "cuda"
+        elif getattr(torch.backends, "mps", None) is not None and torch.backends.mps.is_available():
+            self.dispositivo = "mps"
+        else:
+            self.dispositivo = "cpu"
+        modelo = SentenceTransformer(self.model_name, device=self.dispositivo)
+        if self.backend == "torch-quantized":
+            modelo = torch.quantization.quantize_dynamic(modelo, {torch.nn.Linear}, dtype=torch.qint8)
+        self._modelo = modelo
+
+    def _calcular(self, textos):
+        self.cargar()
+        inicio = time.monotonic()
+        if self._onnx is not None:
+            vectores = np.asarray(self._onnx(textos), dtype=np.float32)
+        else:
+            # Sin normalizar, igual que SentenceTransformerEmbeddingFunction de chromadb
+            vectores = self._modelo.encode(textos, batch_size=self.batch_size, convert_to_numpy=True,
+                                           normalize_embeddings=False, show_progress_bar=False).astype(np.float32)
+        self.segundos_de_modelo += time.monotonic() - inicio
+        self.textos_calculados += len(textos)
+        return vectores
+
+    def codificar(self, textos):
+        """
+        Devuelve una lista de vectores (listas de float) para `textos`. Los textos repetidos
+        dentro del lote o ya presentes en la caché no se pasan por el modelo.
+        """
+        resultado = [None] * len(textos)
+        pendientes = {} # clave -> (texto, posiciones)
+        for posicion, texto in enumerate(textos):
+            clave = self.cache.clave(texto) if self.cache is not None else hashlib.sha256(texto.encode('utf-8')).hexdigest()
+            if clave in pendientes:
+                pendientes[clave][1].append(posicion)
+                continue
+            vector = self.cache.obtener(clave) if self.cache is not None else None
+            if vector is not None:
+                resultado[posicion] = vector
+            else:
+                pendientes[clave] = (texto, [posicion])
+
+        claves = list(pendientes)
+        for inicio in range(0, len(claves), self.batch_size):
+            claves_lote = claves[inicio:inicio + self.batch_size]
+            vectores = self._calcular([pendientes[clave][0] for clave in claves_lote])
+            for clave, vector in zip(claves_lote, vectores):
+                if self.cache is not None:
+                    self.cache.guardar(clave, vector)
+                for posicion in pendientes[clave][1]:
+                    resultado[posicion] = vector
+        return [vector.tolist() for vector in resultado]
+
+    def __call__(self, input):
+        return self.codificar(list(input))
+
+    def resumen(self):
+        ritmo = self.textos_calculados / self.segundos_de_modelo if self.segundos_de_modelo else 0.0
+        texto = f"{self.textos_calculados} textos calculados por el modelo en {self.segundos_de_modelo:.1f}s ({ritmo:.1f} textos/s)"
+        if self.cache is not None:
+            texto += f"; caché: {self.cache.resumen()}"
+        return texto
@@ -1,19 +1,132 @@
-import chromadb
+import argparse # Para la interfaz de línea de comandos
+import json # Para el formato JSONL
 import os
+import time # Para medir el rendimiento de la exportación
 
 # --- CONFIGURACIÓN ---
 # Ruta a la carpeta de tu base de datos ChromaDB persistente
-CHROMA_DB_PATH = "./my_chroma_db" 
+CHROMA_DB_PATH = "./my_chroma_db"
 # Nombre de la colección de la cual quieres exportar los documentos
 COLLECTION_NAME = "shared" # Asegúrate que este sea el nombre de tu colección
 # Nombre del archivo de texto de salida
 OUTPUT_TEXT_FILE = "shared.txt"
+# Formatos de salida: "txt" (formato legible de siempre), "jsonl" (un registro JSON por línea)
+# o "parquet" (requiere pyarrow, que no está en requirements.txt)
+OUTPUT_FORMATS = ("txt", "jsonl", "parquet")
+# Registros pedidos a la colección por llamada a collection.get (limit/offset); acota la memoria usada
+EXPORT_BATCH_SIZE = 1000
 
-def exportar_coleccion_a_texto(db_path, collection_name, output_file):
+def iterar_lotes(collection, include, tamano_lote=EXPORT_BATCH_SIZE, where=None):
     """
-    Exporta los documentos de una colección de ChromaDB a un archivo de texto.
+    Recorre la colección (o los registros que cumplen `where`) en lotes de `tamano_lote` registros
+    con limit/offset y produce el resultado de cada collection.get. Solo un lote está en memoria a la vez.
+    La colección no debería modificarse durante la exportación, o se podrían saltar o repetir registros.
+    """
+    offset = 0
+    while True:
+        data = collection.get(include=include, limit=tamano_lote, offset=offset, where=where)
+        if not data['ids']:
+            return
+        yield data
+        offset += len(data['ids'])
+        if len(data['ids']) < tamano_lote:
+            return
+
+def registros_de_lote(data):
+    """
+    Convierte el resultado de collection.get en tuplas (id, documento, metadatos, embedding).
+    """
+    documentos = data.get('documents') or []
+    metadatos = data.get('metadatas') or []
+    embeddings = data.get('embeddings')
+    for i, doc_id in enumerate(data['ids']):
+        document_text = documentos[i] if i < len(documentos) else None
+        metadata = metadatos[i] if i < len(metadatos) and metadatos[i] else {}
+        embedding = [float(valor) for valor in embeddings[i]] if embeddings is not None and i < len(embeddings) else None
+        yield doc_id, document_text, metadata, embedding
+
+class EscritorTexto:
+    """Formato de texto legible: un bloque '--- Inicio Documento ---' por registro."""
+    def __init__(self, ruta, incluir_embeddings=False):
+        self.f = open(ruta, 'w', encoding='utf-8')
+
+    def escribir_lote(self, data):
+        for doc_id, document_text, metadata, _ in registros_de_lote(data):
+            source_file_info = ""
+            if metadata.get('source_file'):
+                source_file_info = f"Fuente Original: {metadata.get('source_file')}"
+                if metadata.get('file_type'):
+                    source_file_info += f" (Tipo: {metadata.get('file_type')})"
+
+            self.f.write(f"--- Inicio Documento (ID: {doc_id}) ---\n")
+            if source_file_info:
+                self.f.write(f"{source_file_info}\n")
+            self.f.write("Contenido:\n")
+            self.f.write(document_text or "Contenido no disponible")
+            self.f.write("\n--- Fin Documento ---\n\n") # Doble salto de línea para separar bien los documentos
+
+    def cerrar(self):
+        self.f.close()
+
+class EscritorJsonl:
+    """Un objeto JSON por línea con id, document, metadata y, si se piden, embedding."""
+    def __init__(self, ruta, incluir_embeddings=False):
+        self.f = open(ruta, 'w', encoding='utf-8')
+        self.incluir_embeddings = incluir_embeddings
+
+    def escribir_lote(self, data):
+        for doc_id, document_text, metadata, embedding in registros_de_lote(data):
+            registro = {"id": doc_id, "document": document_text, "metadata": metadata}
+            if self.incluir_embeddings:
+                registro["embedding"] = embedding
+            self.f.write(json.dumps(registro, ensure_ascii=False))
+            self.f.write("\n")
+
+    def cerrar(self):
+        self.f.close()
+
+class EscritorParquet:
+    """
+    Archivo Parquet escrito con un row group por lote. Los metadatos se guardan como JSON
+    (sus claves varían entre documentos) y los embeddings como listas de float32.
+    """
+    def __init__(self, ruta, incluir_embeddings=False):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise RuntimeError("El formato 'parquet' requiere pyarrow (pip install pyarrow).") from e
+        self.pa = pa
+        self.incluir_embeddings = incluir_embeddings
+        campos = [("id", pa.string()), ("document", pa.string()), ("metadata", pa.string())]
+        if incluir_embeddings:
+            campos.append(("embedding", pa.list_(pa.float32())))
+        self.schema = pa.schema(campos)
+        self.writer = pq.ParquetWriter(ruta, self.schema)
+
+    def escribir_lote(self, data):
+        columnas = {"id": [], "document": [], "metadata": [], "embedding": []}
+        for doc_id, document_text, metadata, embedding in registros_de_lote(data):
+            columnas["id"].append(doc_id)
+            columnas["document"].append(document_text)
+            columnas["metadata"].append(json.dumps(metadata, ensure_ascii=False))
+            columnas["embedding"].append(embedding)
+        if not self.incluir_embeddings:
+            del columnas["embedding"]
+        self.writer.write_table(self.pa.Table.from_pydict(columnas, schema=self.schema))
+
+    def cerrar(self):
+        self.writer.close()
+
+ESCRITORES = {"txt": EscritorTexto, "jsonl": EscritorJsonl, "parquet": EscritorParquet}
+
+def exportar_coleccion(db_path, collection_name, output_file, formato="txt", incluir_embeddings=False, tamano_lote=EXPORT_BATCH_SIZE):
+    """
+    Exporta los documentos de una colección de ChromaDB a un archivo de texto, JSONL o Parquet,
+    pidiendo los registros por lotes y escribiendo cada lote según llega.
     """
     print(f"Intentando conectar a la base de datos ChromaDB en: {db_path}")
+    import chromadb # Importación diferida: `--help` no necesita cargar chromadb
     try:
         client = chromadb.PersistentClient(path=db_path)
         print("Cliente de ChromaDB (persistente) inicializado.")
@@ -26,13 +139,14 @@ def exportar_coleccion_a_texto(db_path, collection_name, output_file):
         print(f"Intentando obtener la colección: '{collection_name}'...")
         # No es necesario especificar la función de embedding al obtener una colección existente
         collection = client.get_collection(name=collection_name)
-        print(f"Colección '{collection_name}' obtenida. Número de documentos: {collection.count()}")
+        total = collection.count()
+        print(f"Colección '{collection_name}' obtenida. Número de documentos: {total}")
     except Exception as e:
         print(f"Error al obtener la colección '{collection_name}': {e}")
         print("Verifica que el nombre de la colección sea correcto y que exista.")
         return
 
-    if collection.count() == 0:
+    if total == 0 and formato == "txt":
         print(f"La colección '{collection_name}' está vacía. No hay nada que exportar.")
         # Crear un archivo vacío o con un mensaje
         with open(output_file, 'w', encoding='utf-8') as f:
@@ -40,47 +154,64 @@ def exportar_coleccion_a_texto(db_path, collection_name, output_file):
         print(f"Archivo de salida '{output_file}' creado (vacío).")
         return
 
-    print(f"\nExtrayendo documentos de la colección '{collection_name}'...")
+    include = ['documents', 'metadatas'] + (['embeddings'] if incluir_embeddings else [])
+    # Se escribe en un archivo temporal y se renombra al final para no dejar una exportación a medias
+    ruta_temporal = f"{output_file}.tmp"
+    try:
+        escritor = ESCRITORES[formato](ruta_temporal, incluir_embeddings)
+    except (RuntimeError, OSError) as e:
+        print(f"Error al crear el archivo de salida: {e}")
+        return
+
+    print(f"\nExportando {total} documentos de la colección '{collection_name}' a '{output_file}' "
+          f"(formato {formato}, lotes de {tamano_lote}{', con embeddings' if incluir_embeddings else ''})...")
+    exportados = 0
+    inicio = time.monotonic()
     try:
-        # Obtenemos IDs, documentos y metadatos. Los embeddings no suelen ser necesarios para este propósito.
-        data = collection.get(
-            include=['documents', 'metadatas']
-        )
+        for data in iterar_lotes(collection, include, tamano_lote):
+            escritor.escribir_lote(data)
+            exportados += len(data['ids'])
+            duracion = max(time.monotonic() - inicio, 1e-9)
+            print(f"    Progreso: {exportados}/{total} documentos ({exportados / duracion:.1f} documentos/s)")
     except Exception as e:
+        escritor.cerrar()
+        os.remove(ruta_temporal)
         print(f"Error al extraer datos de la colección: {e}")
         return
+    escritor.cerrar()
+    os.replace(ruta_temporal, output_file)
 
-    print(f"Formateando y escribiendo {len(data['ids'])} documentos en '{output_file}'...")
-    with open(output_file, 'w', encoding='utf-8') as f:
-        for i in range(len(data['ids'])):
-            doc_id = data['ids'][i]
-            document_text = data['documents'][i] if data.get('documents') and data['documents'][i] else "Contenido no disponible"
-            metadata = data['metadatas'][i] if data.get('metadatas') and data['metadatas'][i] else {}
-            
-            source_file_info = ""
-            if metadata.get('source_file'):
-                source_file_info = f"Fuente Original: {metadata.get('source_file')}"
-                if metadata.get('file_type'):
-                    source_file_info += f" (Tipo: {metadata.get('file_type')})"
-            
-            f.write(f"--- Inicio Documento (ID: {doc_id}) ---\n")
-            if source_file_info:
-                f.write(f"{source_file_info}\n")
-            f.write("Contenido:\n")
-            f.write(document_text)
-            f.write("\n--- Fin Documento ---\n\n") # Doble salto de línea para separar bien los documentos
+    duracion = time.monotonic() - inicio
+    print(f"\n¡Exportación completada! {exportados} documentos guardados en '{output_file}' en {duracion:.1f}s.")
 
-    print(f"\n¡Exportación completada! {len(data['ids'])} documentos guardados en '{output_file}'.")
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Exporta los documentos de una colección de ChromaDB a un archivo de texto, JSONL o Parquet.")
+    parser.add_argument("--db", default=CHROMA_DB_PATH, help=f"Ruta de la base de datos ChromaDB (por defecto: {CHROMA_DB_PATH})")
+    parser.add_argument("--coleccion", default=COLLECTION_NAME, help=f"Nombre de la colección (por defecto: {COLLECTION_NAME})")
+    parser.add_argument("--formato", choices=OUTPUT_FORMATS, default="txt", help="Formato de salida (por defecto: txt)")
+    parser.add_argument("--salida", help=f"Archivo de salida (por defecto: {OUTPUT_TEXT_FILE} con la extensión del formato)")
+    parser.add_argument("--embeddings", action="store_true", help="Incluir los embeddings (solo en jsonl y parquet)")
+    parser.add_argument("--tamano-lote", type=int, default=EXPORT_BATCH_SIZE,
+                        help=f"Registros por llamada a collection.get (por defecto: {EXPORT_BATCH_SIZE})")
+    return parser.parse_args(argv)
 
-if __name__ == "__main__":
+def main(argv=None):
+    args = parse_args(argv)
+    if args.embeddings and args.formato == "txt":
+        print("Advertencia: el formato 'txt' no incluye embeddings; usa --formato jsonl o parquet.")
+    output_file = args.salida or f"{os.path.splitext(OUTPUT_TEXT_FILE)[0]}.{args.formato}"
     # Crea la carpeta de base de datos si no existe (solo para evitar error si se corre sin datos)
     # En un escenario real, la base de datos ya debería existir y estar poblada.
-    if not os.path.exists(CHROMA_DB_PATH):
-        print(f"Advertencia: La carpeta de la base de datos '{CHROMA_DB_PATH}' no existe.")
+    if not os.path.exists(args.db):
+        print(f"Advertencia: La carpeta de la base de datos '{args.db}' no existe.")
         print("Este script espera una base de datos ChromaDB ya existente y poblada.")
         # Podrías crearla aquí si es parte de un flujo, pero para un script de exportación puro,
         # es mejor asumir que ya existe.
-        # os.makedirs(CHROMA_DB_PATH) 
+        # os.makedirs(CHROMA_DB_PATH)
         # print(f"Carpeta '{CHROMA_DB_PATH}' creada, pero probablemente esté vacía.")
 
-    exportar_coleccion_a_texto(CHROMA_DB_PATH, COLLECTION_NAME, OUTPUT_TEXT_FILE)
\ No newline at end of file
+    exportar_coleccion(args.db, args.coleccion, output_file, args.formato, args.embeddings and args.formato != "txt",
+                       max(1, args.tamano_lote))
+
+if __name__ == "__main__":
+    main()
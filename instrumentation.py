@@ -0,0 +1,175 @@
+import json
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# --- CONFIGURACIÓN ---
+# Archivo JSONL con un evento por etapa terminada y un resumen al final de la ejecución
+# (None = no se escribe). También se puede indicar con la variable de entorno METRICS_JSONL.
+METRICS_JSONL_PATH = None
+# Puerto del endpoint de Prometheus (formato de texto en /metrics); None = desactivado
+METRICS_PROMETHEUS_PORT = None
+METRICS_PROMETHEUS_HOST = "127.0.0.1"
+METRICS_PROMETHEUS_PREFIX = "users_extension"
+
+class Metricas:
+    """
+    Tiempos por etapa (segundos acumulados, llamadas y elementos procesados) y contadores
+    (peticiones, bytes, reintentos, páginas, fragmentos...). Se puede usar desde varios hilos a la vez.
+    Las etapas que se ejecutan en paralelo acumulan su tiempo por separado, así que la suma de
+    todas puede ser mayor que la duración de la ejecución.
+    """
+    def __init__(self, ruta_jsonl=None):
+        self._lock = threading.Lock()
+        self._etapas = {} # nombre -> {"segundos", "llamadas", "elementos", "unidad"}
+        self._contadores = Counter()
+        self._jsonl = None
+        self.ejecucion = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+        self.inicio = time.monotonic()
+        if ruta_jsonl:
+            self.configurar_jsonl(ruta_jsonl)
+
+    def configurar_jsonl(self, ruta_jsonl):
+        with self._lock:
+            if self._jsonl is not None:
+                self._jsonl.close()
+            self._jsonl = open(ruta_jsonl, 'a', encoding='utf-8', buffering=1) # Una línea por evento, sin esperar al final
+
+    def _emitir(self, evento):
+        if self._jsonl is not None:
+            self._jsonl.write(json.dumps({"ts": time.time(), "ejecucion": self.ejecucion, **evento}, ensure_ascii=False) + "\n")
+
+    def registrar_etapa(self, nombre, segundos, elementos=0, unidad=None, **atributos):
+        with self._lock:
+            etapa = self._etapas.setdefault(nombre, {"segundos": 0.0, "llamadas": 0, "elementos": 0, "unidad": unidad})
+            etapa["segundos"] += segundos
+            etapa["llamadas"] += 1
+            etapa["elementos"] += elementos
+            etapa["unidad"] = etapa["unidad"] or unidad
+            self._emitir({"tipo": "etapa", "etapa": nombre, "segundos": round(segundos, 6), "elementos": elementos, **atributos})
+
+    @contextmanager
+    def etapa(self, nombre, elementos=0, unidad=None, **atributos):
+        """Mide el bloque `with` como una llamada de la etapa `nombre` (también si lanza una excepción)."""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.registrar_etapa(nombre, time.perf_counter() - inicio, elementos, unidad, **atributos)
+
+    def iterar(self, nombre, iterable, unidad=None):
+        """Produce los elementos de `iterable` midiendo como etapa `nombre` la espera por cada uno."""
+        iterador = iter(iterable)
+        while True:
+            inicio = time.perf_counter()
+            try:
+                elemento = next(iterador)
+            except StopIteration:
+                return
+            self.registrar_etapa(nombre, time.perf_counter() - inicio, 1, unidad)
+            yield elemento
+
+    def contar(self, nombre, n=1):
+        with self._lock:
+            self._contadores[nombre] += n
+
+    def instantanea(self):
+        with self._lock:
+            return {
+                "duracion_s": round(time.monotonic() - self.inicio, 3),
+                "etapas": {nombre: dict(etapa) for nombre, etapa in self._etapas.items()},
+                "contadores": dict(self._contadores),
+            }
+
+    def tabla_resumen(self):
+        """Tabla de texto con el tiempo y el rendimiento de cada etapa y los contadores."""
+        datos = self.instantanea()
+        lineas = [f"{'Etapa':<22} {'Llamadas':>9} {'Tiempo (s)':>11} {'% ejecución':>12} {'Elementos':>12} {'Elementos/s':>12}"]
+        duracion = max(datos["duracion_s"], 1e-9)
+        for nombre, etapa in sorted(datos["etapas"].items(), key=lambda item: item[1]["segundos"], reverse=True):
+            rendimiento = f"{etapa['elementos'] / etapa['segundos']:>12.1f}" if etapa["segundos"] and etapa["elementos"] else f"{'-':>12}"
+            lineas.append(
+                f"{nombre:<22} {etapa['llamadas']:>9} {etapa['segundos']:>11.2f} {100 * etapa['segundos'] / duracion:>11.1f}% "
+                f"{etapa['elementos']:>12} {rendimiento} {etapa['unidad'] or ''}".rstrip()
+            )
+        if datos["contadores"]:
+            lineas.append("Contadores: " + ", ".join(f"{nombre}={valor}" for nombre, valor in sorted(datos["contadores"].items())))
+        lineas.append(f"Duración total: {datos['duracion_s']:.1f}s (las etapas en paralelo pueden sumar más del 100%)")
+        return "\n".join(lineas)
+
+    def texto_prometheus(self, prefijo=METRICS_PROMETHEUS_PREFIX):
+        """Métricas en el formato de texto de Prometheus."""
+        datos = self.instantanea()
+        lineas = [
+            f"# TYPE {prefijo}_etapa_segundos_total counter",
+            f"# TYPE {prefijo}_etapa_llamadas_total counter",
+            f"# TYPE {prefijo}_etapa_elementos_total counter",
+        ]
+        for nombre, etapa in sorted(datos["etapas"].items()):
+            lineas.append(f'{prefijo}_etapa_segundos_total{{etapa="{nombre}"}} {etapa["segundos"]:.6f}')
+            lineas.append(f'{prefijo}_etapa_llamadas_total{{etapa="{nombre}"}} {etapa["llamadas"]}')
+            lineas.append(f'{prefijo}_etapa_elementos_total{{etapa="{nombre}"}} {etapa["elementos"]}')
+        for nombre, valor in sorted(datos["contadores"].items()):
+            lineas.append(f"# TYPE {prefijo}_{nombre}_total counter")
+            lineas.append(f"{prefijo}_{nombre}_total {valor}")
+        lineas.append(f"# TYPE {prefijo}_duracion_segundos gauge")
+        lineas.append(f"{prefijo}_duracion_segundos {datos['duracion_s']}")
+        return "\n".join(lineas) + "\n"
+
+    def cerrar(self):
+        """Escribe el resumen final en el JSONL y lo cierra."""
+        datos = self.instantanea()
+        with self._lock:
+            self._emitir({"tipo": "resumen", **datos})
+            if self._jsonl is not None:
+                self._jsonl.close()
+                self._jsonl = None
+
+# Instancia compartida por create_pdf.py, add_documents_to_chromadb.py y el pipeline
+metricas = Metricas()
+
+def iniciar_servidor_prometheus(puerto, host=METRICS_PROMETHEUS_HOST, registro=None):
+    """Sirve `registro.texto_prometheus()` en http://host:puerto/metrics desde un hilo en segundo plano."""
+    registro = registro or metricas
+
+    class Manejador(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            cuerpo = registro.texto_prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(cuerpo)))
+            self.end_headers()
+            self.wfile.write(cuerpo)
+
+        def log_message(self, *args): # Sin una línea en la consola por cada scrape
+            pass
+
+    servidor = ThreadingHTTPServer((host, puerto), Manejador)
+    threading.Thread(target=servidor.serve_forever, name="metricas-prometheus", daemon=True).start()
+    print(f"Métricas de Prometheus en http://{host}:{servidor.server_address[1]}/metrics")
+    return servidor
+
+def anadir_argumentos(parser):
+    """Opciones de línea de comandos comunes a los scripts instrumentados."""
+    parser.add_argument("--metricas-jsonl", default=os.getenv("METRICS_JSONL") or METRICS_JSONL_PATH,
+                        help="Archivo JSONL donde añadir los eventos de cada etapa y el resumen de la ejecución")
+    parser.add_argument("--metricas-puerto", type=int, default=METRICS_PROMETHEUS_PORT,
+                        help="Puerto para servir las métricas en formato Prometheus en /metrics mientras dura la ejecución")
+
+def configurar_desde_args(args):
+    if args.metricas_jsonl:
+        metricas.configurar_jsonl(args.metricas_jsonl)
+    if args.metricas_puerto is not None:
+        iniciar_servidor_prometheus(args.metricas_puerto)
+
+def mostrar_resumen(titulo="Tiempo por etapa"):
+    """Imprime la tabla resumen y cierra el JSONL; se llama al final de cada script."""
+    print(f"\n--- {titulo} ---")
+    print(metricas.tabla_resumen())
+    metricas.cerrar()
@@ -0,0 +1,354 @@
+import argparse # Para la interfaz de línea de comandos
+import json # Configuración de los trabajos e informe de estado
+import logging
+import os
+import threading
+import time
+
+import create_pdf # Configuración y sesiones de Confluence
+import add_documents_to_chromadb as ingesta # Cliente, colecciones e ingesta de carpetas
+import pipeline_confluence_to_chromadb as pipeline # Recorrido -> exportación -> ChromaDB de un espacio
+from embedding_stage import nombre_seguro
+import instrumentation # Tiempos por etapa y contadores (compartidos por todos los trabajos)
+
+# --- CONFIGURACIÓN ---
+# Archivo JSON con la lista de trabajos (ver el ejemplo de parse_args). También JOBS_CONFIG.
+JOBS_CONFIG_PATH = "jobs.json"
+# Workers repartidos entre todos los trabajos en curso: exportaciones simultáneas de un espacio
+# o procesos de extracción de una carpeta. Cada trabajo recibe como mucho su 'max_workers'.
+DEFAULT_WORKER_BUDGET = 16
+DEFAULT_JOB_MAX_WORKERS = 4
+# Carpeta bajo la que se guardan las exportaciones de cada espacio (<carpeta>/<nombre del trabajo>) si el trabajo no indica otra
+SPACES_OUTPUT_ROOT = "confluence_spaces"
+# Segundos entre dos informes de estado mientras hay trabajos en curso
+STATUS_INTERVAL_SECONDS = 30
+JOB_STATES = ("pendiente", "en_curso", "completado", "con_errores", "fallido")
+
+def cargar_configuracion(ruta):
+    """
+    Lee el archivo de trabajos y devuelve (opciones_generales, trabajos) con los valores por defecto
+    aplicados. Lanza ValueError si la configuración no es válida.
+    """
+    with open(ruta, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    presupuesto = int(config.get("presupuesto_workers", DEFAULT_WORKER_BUDGET))
+    if presupuesto < 1:
+        raise ValueError("'presupuesto_workers' debe ser al menos 1.")
+    limites_por_espacio = {str(espacio).upper(): int(limite) for espacio, limite in config.get("limites_por_espacio", {}).items()}
+    for espacio, limite in limites_por_espacio.items():
+        if limite < 1:
+            # Con 0 los trabajos del espacio no podrían empezar nunca y el planificador esperaría para siempre
+            raise ValueError(f"El límite de 'limites_por_espacio' para '{espacio}' debe ser al menos 1.")
+    generales = {
+        "presupuesto_workers": presupuesto,
+        "limites_por_espacio": limites_por_espacio,
+        "db": config.get("db", ingesta.CHROMA_DB_PATH),
+        "backend": config.get("backend", ingesta.EMBEDDING_BACKEND),
+        "max_peticiones_por_host": int(config.get("max_peticiones_por_host", create_pdf.DEFAULT_MAX_REQUESTS_PER_HOST)),
+        "max_peticiones_por_segundo": float(config.get("max_peticiones_por_segundo", create_pdf.DEFAULT_MAX_REQUESTS_PER_SECOND)),
+        "max_reintentos": int(config.get("max_reintentos", create_pdf.HTTP_MAX_RETRIES)),
+    }
+
+    trabajos = []
+    nombres = set()
+    for orden, definicion in enumerate(config.get("trabajos", [])):
+        espacio = str(definicion["espacio"]).upper() if definicion.get("espacio") else None
+        if not espacio and not definicion.get("carpeta"):
+            raise ValueError(f"El trabajo #{orden + 1} necesita 'espacio' (Confluence) o 'carpeta' (archivos locales).")
+        nombre = definicion.get("nombre") or espacio or definicion["carpeta"]
+        if nombre in nombres:
+            raise ValueError(f"Hay dos trabajos con el nombre '{nombre}'.")
+        nombres.add(nombre)
+        coleccion = definicion.get("coleccion") or (espacio.lower() if espacio else ingesta.COLLECTION_NAME)
+        ruta_indice, ruta_bm25 = ingesta.rutas_de_indices(coleccion, generales["db"])
+        formato = definicion.get("formato", "pdf")
+        if formato not in create_pdf.EXPORT_FORMATS:
+            raise ValueError(f"Formato '{formato}' no válido en el trabajo '{nombre}' (opciones: {', '.join(create_pdf.EXPORT_FORMATS)}).")
+        max_workers = max(1, min(int(definicion.get("max_workers", DEFAULT_JOB_MAX_WORKERS)), presupuesto,
+                                 limites_por_espacio.get(espacio, presupuesto)))
+        trabajos.append({
+            "nombre": nombre,
+            "tipo": "espacio" if espacio else "carpeta",
+            "espacio": espacio,
+            "pagina_padre": definicion.get("pagina_padre"),
+            "carpeta": definicion.get("carpeta") or os.path.join(SPACES_OUTPUT_ROOT, nombre_seguro(nombre)),
+            "coleccion": coleccion,
+            "indice": definicion.get("indice", ruta_indice),
+            "bm25": definicion.get("bm25", ruta_bm25),
+            "formato": formato,
+            "body_format": definicion.get("body_format", "storage"),
+            "prioridad": int(definicion.get("prioridad", 0)),
+            "max_workers": max_workers,
+            "min_workers": max(1, min(int(definicion.get("min_workers", 1)), max_workers)),
+            "orden": orden,
+            "estado": "pendiente",
+            "workers": 0,
+            "inicio": None,
+            "fin": None,
+            "stats": {},
+            "error": None,
+        })
+    if not trabajos:
+        raise ValueError("La configuración no tiene trabajos.")
+    return generales, trabajos
+
+class Planificador:
+    """
+    Ejecuta los trabajos en hilos repartiendo un presupuesto común de workers. Se arrancan por prioridad
+    (y en el orden del archivo a igual prioridad); cada uno recibe los workers libres hasta su 'max_workers'
+    y, en los espacios con límite en 'limites_por_espacio', sin pasar de ese límite entre todos sus trabajos.
+    Dos trabajos de la misma colección nunca se ejecutan a la vez (comparten el índice de ingesta).
+    Si el trabajo más prioritario espera por falta de workers, no se adelantan los de menor prioridad.
+    """
+    def __init__(self, trabajos, presupuesto, limites_por_espacio, ejecutar_trabajo, intervalo_estado=STATUS_INTERVAL_SECONDS):
+        self.trabajos = trabajos
+        self.presupuesto = presupuesto
+        self.limites_por_espacio = limites_por_espacio
+        self.ejecutar_trabajo = ejecutar_trabajo
+        self.intervalo_estado = intervalo_estado
+        self._pendientes = sorted(trabajos, key=lambda trabajo: (-trabajo["prioridad"], trabajo["orden"]))
+        self._en_curso = []
+        self._libres = presupuesto
+        self._condicion = threading.Condition()
+
+    def _siguiente(self):
+        """Devuelve (trabajo, workers) del próximo trabajo que puede arrancar, o None."""
+        colecciones_ocupadas = {trabajo["coleccion"] for trabajo in self._en_curso}
+        for trabajo in self._pendientes:
+            if trabajo["coleccion"] in colecciones_ocupadas:
+                continue
+            disponibles = min(self._libres, trabajo["max_workers"])
+            limite_espacio = self.limites_por_espacio.get(trabajo["espacio"])
+            if limite_espacio is not None:
+                usados = sum(otro["workers"] for otro in self._en_curso if otro["espacio"] == trabajo["espacio"])
+                if limite_espacio - usados < trabajo["min_workers"]:
+                    continue
+                disponibles = min(disponibles, limite_espacio - usados)
+            if disponibles >= trabajo["min_workers"]:
+                return trabajo, disponibles
+            if self._libres < trabajo["min_workers"]:
+                return None # Se reservan los workers que se liberen para este trabajo
+        return None
+
+    def _ejecutar(self, trabajo):
+        trabajo["inicio"] = time.monotonic()
+        try:
+            trabajo["estado"] = self.ejecutar_trabajo(trabajo)
+        except Exception as e:
+            logging.error(f"[Trabajos] El trabajo '{trabajo['nombre']}' falló: {e}", exc_info=True)
+            trabajo["estado"] = "fallido"
+            trabajo["error"] = str(e)
+        trabajo["fin"] = time.monotonic()
+        with self._condicion:
+            self._en_curso.remove(trabajo)
+            self._libres += trabajo["workers"]
+            self._condicion.notify()
+        print(f"\n[Trabajos] '{trabajo['nombre']}' terminado: {trabajo['estado']} "
+              f"({trabajo['fin'] - trabajo['inicio']:.1f}s). {resumen_stats(trabajo)}")
+
+    def ejecutar(self):
+        """Arranca los trabajos según se liberan workers y espera a que terminen todos."""
+        ultimo_informe = time.monotonic()
+        with self._condicion:
+            while self._pendientes or self._en_curso:
+                siguiente = self._siguiente()
+                if siguiente is not None:
+                    trabajo, workers = siguiente
+                    self._pendientes.remove(trabajo)
+                    self._en_curso.append(trabajo)
+                    self._libres -= workers
+                    trabajo["workers"] = workers
+                    trabajo["estado"] = "en_curso"
+                    print(f"\n[Trabajos] Iniciando '{trabajo['nombre']}' (prioridad {trabajo['prioridad']}, {workers} workers, "
+                          f"{self._libres}/{self.presupuesto} libres).")
+                    threading.Thread(target=self._ejecutar, args=(trabajo,), name=f"trabajo-{trabajo['nombre']}", daemon=True).start()
+                    continue
+                self._condicion.wait(timeout=max(0.0, self.intervalo_estado - (time.monotonic() - ultimo_informe)))
+                if time.monotonic() - ultimo_informe >= self.intervalo_estado:
+                    print(f"\n--- Estado de los trabajos ({self.presupuesto - self._libres}/{self.presupuesto} workers en uso) ---")
+                    print(tabla_estado(self.trabajos))
+                    ultimo_informe = time.monotonic()
+        return self.trabajos
+
+def resumen_stats(trabajo):
+    return ", ".join(f"{clave}={valor}" for clave, valor in trabajo["stats"].items() if valor) or "-"
+
+def estado_final(stats):
+    """'con_errores' si alguna página, archivo o fragmento falló; si no, 'completado'."""
+    claves_de_error = ("fallid", "por_error")
+    return "con_errores" if any(valor for clave, valor in stats.items() if any(marca in clave for marca in claves_de_error)) else "completado"
+
+def tabla_estado(trabajos):
+    """Tabla de texto con el estado, los workers, la duración y las estadísticas de cada trabajo."""
+    ahora = time.monotonic()
+    lineas = [f"{'Trabajo':<20} {'Colección':<16} {'Prio.':>5} {'Estado':<12} {'Workers':>7} {'Tiempo (s)':>10}  Progreso"]
+    for trabajo in sorted(trabajos, key=lambda trabajo: (JOB_STATES.index(trabajo["estado"]), -trabajo["prioridad"], trabajo["orden"])):
+        duracion = (trabajo["fin"] or ahora) - trabajo["inicio"] if trabajo["inicio"] is not None else None
+        lineas.append(
+            f"{trabajo['nombre'][:20]:<20} {trabajo['coleccion'][:16]:<16} {trabajo['prioridad']:>5} {trabajo['estado']:<12} "
+            f"{trabajo['workers'] or '-':>7} {f'{duracion:.1f}' if duracion is not None else '-':>10}  "
+            f"{trabajo['error'] or resumen_stats(trabajo)}"
+        )
+    return "\n".join(lineas)
+
+def guardar_informe(ruta, trabajos, duracion):
+    """Escribe el informe combinado en JSON (archivo temporal y renombrado)."""
+    informe = {
+        "duracion_s": round(duracion, 3),
+        "estados": {estado: sum(1 for trabajo in trabajos if trabajo["estado"] == estado) for estado in JOB_STATES},
+        "trabajos": [
+            {**{clave: trabajo[clave] for clave in ("nombre", "tipo", "espacio", "pagina_padre", "carpeta", "coleccion", "formato",
+                                                    "prioridad", "workers", "estado", "error", "stats")},
+             "duracion_s": round(trabajo["fin"] - trabajo["inicio"], 3) if trabajo["fin"] is not None else None}
+            for trabajo in trabajos
+        ],
+    }
+    ruta_temporal = f"{ruta}.tmp"
+    with open(ruta_temporal, 'w', encoding='utf-8') as f:
+        json.dump(informe, f, ensure_ascii=False, indent=2)
+    os.replace(ruta_temporal, ruta)
+
+def crear_ejecutor(generales, client, etapa_embeddings):
+    """
+    Devuelve la función que ejecuta un trabajo y su estado final. Los trabajos del mismo wiki y usuario
+    comparten una sesión, así que sus límites por host y por segundo valen para todos a la vez.
+    """
+    sesiones = {}
+    lock_sesiones = threading.Lock()
+
+    def sesion_para(confluence_config):
+        clave = (confluence_config['base_url'], confluence_config['user'])
+        with lock_sesiones:
+            if clave not in sesiones:
+                sesiones[clave] = create_pdf.create_confluence_session(
+                    confluence_config, generales["max_peticiones_por_host"], generales["presupuesto_workers"],
+                    generales["max_peticiones_por_segundo"], generales["max_reintentos"]
+                )
+            return sesiones[clave]
+
+    def ejecutar_trabajo(trabajo):
+        workers = trabajo["workers"]
+        if trabajo["tipo"] == "carpeta":
+            stats = ingesta.ingerir_carpeta(trabajo["carpeta"], trabajo["coleccion"], generales["db"], etapa_embeddings,
+                                            trabajo["indice"], trabajo["bm25"], workers, client=client)
+            if stats is None:
+                trabajo["error"] = f"No se pudo abrir la colección '{trabajo['coleccion']}'"
+                return "fallido"
+            trabajo["stats"] = stats
+            return estado_final(stats)
+
+        confluence_config = create_pdf.load_confluence_config(trabajo["espacio"], trabajo["pagina_padre"])
+        if confluence_config is None:
+            trabajo["error"] = "Falta la configuración de Confluence (CONFLUENCE_URL, CONFLUENCE_USER, CONFLUENCE_TOKEN_OR_PASS)"
+            return "fallido"
+        collection = ingesta.obtener_coleccion(client, trabajo["coleccion"], etapa_embeddings)
+        if collection is None:
+            trabajo["error"] = f"No se pudo abrir la colección '{trabajo['coleccion']}'"
+            return "fallido"
+        os.makedirs(trabajo["carpeta"], exist_ok=True)
+        stats = trabajo["stats"] # Se rellena durante la ejecución, para el informe de estado
+        pipeline.ejecutar_pipeline(
+            confluence_config, collection, trabajo["carpeta"],
+            export_workers=workers, crawl_workers=workers, etapa_embeddings=etapa_embeddings,
+            formato=trabajo["formato"], representacion=trabajo["body_format"], extraction_workers=workers,
+            ruta_indice=trabajo["indice"], ruta_bm25=trabajo["bm25"], session=sesion_para(confluence_config), stats=stats,
+            db_path=generales["db"],
+        )
+        if not stats.get('paginas_descubiertas'):
+            trabajo["error"] = "No se encontraron páginas (o no se pudieron obtener las páginas raíz)"
+            return "fallido"
+        return estado_final(stats)
+
+    return ejecutar_trabajo
+
+def parse_args(argv=None):
+    create_pdf.load_dotenv() # Para que los valores por defecto tengan en cuenta el archivo .env
+    parser = argparse.ArgumentParser(
+        description="Ejecuta en paralelo varios trabajos de indexación (espacios de Confluence y carpetas locales, "
+                    "cada uno hacia su colección) con un presupuesto común de workers.",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""Ejemplo de archivo de trabajos:
+{
+  "presupuesto_workers": 16,
+  "max_peticiones_por_host": 8,
+  "max_peticiones_por_segundo": 10,
+  "limites_por_espacio": {"ENG": 6},
+  "trabajos": [
+    {"espacio": "ENG", "coleccion": "eng", "prioridad": 10, "max_workers": 8, "formato": "markdown"},
+    {"nombre": "ops-runbooks", "espacio": "OPS", "pagina_padre": "123456", "coleccion": "ops"},
+    {"nombre": "compartidos", "carpeta": "shared", "coleccion": "shared", "max_workers": 2}
+  ]
+}
+Los trabajos con 'espacio' usan las credenciales de CONFLUENCE_URL, CONFLUENCE_USER y CONFLUENCE_TOKEN_OR_PASS.""",
+    )
+    parser.add_argument("--config", default=os.getenv("JOBS_CONFIG") or JOBS_CONFIG_PATH,
+                        help=f"Archivo JSON con los trabajos (por defecto: {JOBS_CONFIG_PATH})")
+    parser.add_argument("--trabajos", nargs="+", help="Ejecutar solo los trabajos con estos nombres")
+    parser.add_argument("--presupuesto-workers", type=int, help="Sustituye a 'presupuesto_workers' del archivo")
+    parser.add_argument("--intervalo-estado", type=float, default=STATUS_INTERVAL_SECONDS,
+                        help=f"Segundos entre informes de estado (por defecto: {STATUS_INTERVAL_SECONDS})")
+    parser.add_argument("--informe-json", help="Guardar aquí el informe combinado de todos los trabajos")
+    parser.add_argument("--dry-run", action="store_true", help="Solo muestra los trabajos y el orden en que se arrancarían")
+    parser.add_argument("--log-level", choices=create_pdf.LOG_LEVELS, type=str.upper,
+                        default=(os.getenv("CONFLUENCE_LOG_LEVEL") or create_pdf.DEFAULT_LOG_LEVEL).strip().upper(),
+                        help=f"Nivel del archivo de log '{create_pdf.LOG_FILENAME}' (por defecto: {create_pdf.DEFAULT_LOG_LEVEL})")
+    instrumentation.anadir_argumentos(parser)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    create_pdf.configure_logging(log_level=args.log_level)
+    print("Ejecución de Trabajos de Indexación (espacios y carpetas -> colecciones de ChromaDB)")
+    print("-----------------------------------------------------------------------------------")
+    try:
+        generales, trabajos = cargar_configuracion(args.config)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Error en el archivo de trabajos '{args.config}': {e}")
+        return
+    if args.presupuesto_workers:
+        generales["presupuesto_workers"] = max(1, args.presupuesto_workers)
+        for trabajo in trabajos:
+            trabajo["max_workers"] = min(trabajo["max_workers"], generales["presupuesto_workers"])
+            trabajo["min_workers"] = min(trabajo["min_workers"], trabajo["max_workers"])
+    if args.trabajos:
+        desconocidos = set(args.trabajos) - {trabajo["nombre"] for trabajo in trabajos}
+        if desconocidos:
+            print(f"Error: trabajos desconocidos: {', '.join(sorted(desconocidos))}")
+            return
+        trabajos = [trabajo for trabajo in trabajos if trabajo["nombre"] in args.trabajos]
+
+    print(f"{len(trabajos)} trabajos, presupuesto de {generales['presupuesto_workers']} workers.")
+    for trabajo in sorted(trabajos, key=lambda trabajo: (-trabajo["prioridad"], trabajo["orden"])):
+        origen = f"espacio {trabajo['espacio']}" + (f" (desde {trabajo['pagina_padre']})" if trabajo["pagina_padre"] else "") \
+            if trabajo["tipo"] == "espacio" else f"carpeta '{trabajo['carpeta']}'"
+        print(f"  - {trabajo['nombre']}: {origen} -> colección '{trabajo['coleccion']}' "
+              f"(prioridad {trabajo['prioridad']}, hasta {trabajo['max_workers']} workers"
+              f"{', ' + trabajo['formato'] if trabajo['tipo'] == 'espacio' else ''})")
+    if args.dry_run:
+        return
+
+    instrumentation.configurar_desde_args(args)
+    # Un solo cliente de ChromaDB y un solo modelo de embeddings para todos los trabajos
+    etapa_embeddings = ingesta.cargar_funcion_embedding(ingesta.EMBEDDING_MODEL_NAME, generales["backend"])
+    if etapa_embeddings is None:
+        return
+    client = ingesta.inicializar_cliente(generales["db"])
+
+    inicio = time.monotonic()
+    planificador = Planificador(trabajos, generales["presupuesto_workers"], generales["limites_por_espacio"],
+                                crear_ejecutor(generales, client, etapa_embeddings), args.intervalo_estado)
+    planificador.ejecutar()
+    duracion = time.monotonic() - inicio
+
+    print("\n--- Resumen de los Trabajos ---")
+    print(tabla_estado(trabajos))
+    print(f"Tiempo total: {duracion:.1f}s. " + ", ".join(
+        f"{estado}: {sum(1 for trabajo in trabajos if trabajo['estado'] == estado)}" for estado in JOB_STATES[2:]))
+    print(f"Embeddings: {etapa_embeddings.resumen()}")
+    if args.informe_json:
+        guardar_informe(args.informe_json, trabajos, duracion)
+        print(f"Informe guardado en '{args.informe_json}'.")
+    instrumentation.mostrar_resumen("Tiempo por etapa (todos los trabajos)")
+
+if __name__ == "__main__":
+    main()
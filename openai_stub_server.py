@@ -0,0 +1,81 @@
+import argparse # Para la interfaz de línea de comandos
+import json
+import re
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+# --- CONFIGURACIÓN ---
+# Servidor local que imita /v1/chat/completions de la API de OpenAI, para probar /answer de
+# search_service.py sin conexión: search_service.py --llm-base-url http://127.0.0.1:8001/v1
+STUB_HOST = "127.0.0.1"
+STUB_PORT = 8001
+# Milisegundos de espera entre trozos de la respuesta en streaming (simula la generación)
+STUB_TOKEN_DELAY_MS = 20
+
+def respuesta_simulada(mensajes):
+    """Texto determinista: repite la pregunta y cita todas las fuentes numeradas del prompt."""
+    ultimo = next((mensaje.get("content") or "" for mensaje in reversed(mensajes) if mensaje.get("role") == "user"), "")
+    pregunta = ultimo.rsplit("Pregunta:", 1)[-1].strip()
+    fuentes = sorted({int(numero) for numero in re.findall(r'^\[(\d+)\]', ultimo, flags=re.MULTILINE)})
+    citas = " ".join(f"[{numero}]" for numero in fuentes) or "ninguna"
+    return f"Respuesta de prueba a «{pregunta}» con {len(fuentes)} fuentes: {citas}."
+
+def trozos_de(texto):
+    """Divide el texto en palabras con su espacio, como llegarían los tokens de un modelo real."""
+    return re.findall(r'\S+\s*', texto)
+
+def create_app(retraso_ms=STUB_TOKEN_DELAY_MS):
+    app = FastAPI(title="Servidor de prueba compatible con la API de OpenAI")
+
+    @app.get("/v1/models")
+    def models():
+        return {"object": "list", "data": [{"id": "stub", "object": "model", "owned_by": "local"}]}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        peticion = await request.json()
+        texto = respuesta_simulada(peticion.get("messages") or [])
+        modelo = peticion.get("model", "stub")
+        id_respuesta = f"chatcmpl-{uuid.uuid4().hex}"
+        creado = int(time.time())
+        if not peticion.get("stream"):
+            return {
+                "id": id_respuesta, "object": "chat.completion", "created": creado, "model": modelo,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": texto}, "finish_reason": "stop"}],
+            }
+
+        def eventos():
+            def trozo(delta, fin=None):
+                datos = {"id": id_respuesta, "object": "chat.completion.chunk", "created": creado, "model": modelo,
+                         "choices": [{"index": 0, "delta": delta, "finish_reason": fin}]}
+                return f"data: {json.dumps(datos, ensure_ascii=False)}\n\n"
+
+            yield trozo({"role": "assistant", "content": ""})
+            for palabra in trozos_de(texto):
+                time.sleep(retraso_ms / 1000)
+                yield trozo({"content": palabra})
+            yield trozo({}, "stop")
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(eventos(), media_type="text/event-stream")
+
+    return app
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor local que imita la API de chat de OpenAI para pruebas sin conexión.")
+    parser.add_argument("--host", default=STUB_HOST, help=f"Dirección de escucha (por defecto: {STUB_HOST})")
+    parser.add_argument("--port", type=int, default=STUB_PORT, help=f"Puerto (por defecto: {STUB_PORT})")
+    parser.add_argument("--retraso-ms", type=float, default=STUB_TOKEN_DELAY_MS,
+                        help=f"Milisegundos entre trozos en streaming (por defecto: {STUB_TOKEN_DELAY_MS})")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    import uvicorn # Importación diferida: solo hace falta para arrancar el servidor
+    uvicorn.run(create_app(args.retraso_ms), host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+import gzip # Para guardar comprimido el texto en caché
+import os
+import signal # Para limitar el tiempo de extracción de cada página
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# --- CONFIGURACIÓN ---
+# Procesos de extracción en paralelo (pdfplumber es Python puro y usa un solo núcleo por proceso)
+DEFAULT_EXTRACTION_WORKERS = os.cpu_count() or 1
+# "archivo": cada tarea extrae un PDF completo; "pagina": los PDFs se reparten en bloques de páginas
+DEFAULT_GRANULARITY = "archivo"
+PAGES_PER_TASK = 16
+# Segundos máximos por página; las páginas que lo superan se omiten para no bloquear la ejecución
+PAGE_TIMEOUT_SECONDS = 60
+# Caché en disco del texto extraído, indexada por hash del PDF + versión del extractor.
+# Cambia EXTRACTOR_VERSION si cambia la forma de extraer el texto para invalidar la caché.
+EXTRACTOR_VERSION = "pdfplumber-1"
+TEXT_CACHE_DIR = "./cache_texto_extraido"
+TEXT_CACHE_MAX_BYTES = 2 * 1024 ** 3
+
+class TiempoDePaginaAgotado(Exception):
+    pass
+
+@contextmanager
+def limite_de_tiempo(segundos):
+    """
+    Lanza TiempoDePaginaAgotado si el bloque tarda más de `segundos`. Usa SIGALRM, así que
+    solo tiene efecto en el hilo principal de procesos Unix (como los del pool de extracción).
+    """
+    if not segundos or not hasattr(signal, "SIGALRM") or threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    def al_agotarse(signum, frame):
+        raise TiempoDePaginaAgotado(f"la página tardó más de {segundos}s")
+
+    manejador_anterior = signal.signal(signal.SIGALRM, al_agotarse)
+    signal.setitimer(signal.ITIMER_REAL, segundos)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, manejador_anterior)
+
+def extraer_rango_paginas(ruta_archivo, inicio=0, fin=None, timeout_pagina=PAGE_TIMEOUT_SECONDS):
+    """
+    Extrae el texto de las páginas [inicio, fin) de un PDF.
+    Devuelve una tupla (textos_por_página, páginas_omitidas_por_tiempo).
+    """
+    import pdfplumber # Importación diferida: solo se carga en los procesos que extraen texto
+    textos = []
+    omitidas = []
+    with pdfplumber.open(ruta_archivo) as pdf:
+        paginas = pdf.pages[inicio:fin]
+        for numero, pagina in enumerate(paginas, start=inicio):
+            try:
+                with limite_de_tiempo(timeout_pagina):
+                    texto_pagina = pagina.extract_text()
+            except TiempoDePaginaAgotado:
+                omitidas.append(numero + 1)
+                continue
+            if texto_pagina: # Asegurarse de que se extrajo texto
+                textos.append(texto_pagina)
+    return textos, omitidas
+
+def extraer_texto_pdf(ruta_archivo, timeout_pagina=PAGE_TIMEOUT_SECONDS):
+    """
+    Extrae el texto de todas las páginas de un PDF con pdfplumber.
+    """
+    return extraer_texto_pdf_con_omitidas(ruta_archivo, timeout_pagina)[0]
+
+def extraer_texto_pdf_con_omitidas(ruta_archivo, timeout_pagina=PAGE_TIMEOUT_SECONDS):
+    """
+    Como extraer_texto_pdf, pero devuelve (texto, páginas_omitidas_por_tiempo). Si hay páginas omitidas
+    el texto está incompleto: no debe guardarse en caché ni darse el archivo por procesado.
+    """
+    textos, omitidas = extraer_rango_paginas(ruta_archivo, timeout_pagina=timeout_pagina)
+    if omitidas:
+        print(f"  - Advertencia: páginas {omitidas} de '{ruta_archivo}' omitidas por superar {timeout_pagina}s.")
+    return "\n".join(textos), omitidas # Unir el texto de todas las páginas
+
+def contar_paginas(ruta_archivo):
+    import pdfplumber
+    with pdfplumber.open(ruta_archivo) as pdf:
+        return len(pdf.pages)
+
+def _tarea_archivo(ruta_archivo, timeout_pagina):
+    return extraer_rango_paginas(ruta_archivo, timeout_pagina=timeout_pagina)
+
+def extraer_textos_en_paralelo(rutas, workers=DEFAULT_EXTRACTION_WORKERS, granularidad=DEFAULT_GRANULARITY,
+                               timeout_pagina=PAGE_TIMEOUT_SECONDS):
+    """
+    Extrae el texto de varios PDFs con un pool de procesos y produce tuplas
+    (ruta, texto, omitidas, error) a medida que cada archivo termina; `error` es None si todo fue bien
+    y `omitidas` son las páginas que se saltaron por superar `timeout_pagina`.
+    Con granularidad "pagina" un PDF grande se reparte entre varios procesos en bloques de
+    PAGES_PER_TASK páginas y su texto se produce cuando terminan todos sus bloques.
+    """
+    rutas = list(rutas)
+    if workers <= 1:
+        for ruta_archivo in rutas:
+            try:
+                yield ruta_archivo, *extraer_texto_pdf_con_omitidas(ruta_archivo, timeout_pagina), None
+            except Exception as e:
+                yield ruta_archivo, None, [], e
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futuro_a_tarea = {}
+        bloques_pendientes = {}
+        omitidas_por_ruta = {}
+        for ruta_archivo in rutas:
+            if granularidad == "pagina":
+                try:
+                    total_paginas = contar_paginas(ruta_archivo)
+                except Exception as e:
+                    yield ruta_archivo, None, [], e
+                    continue
+                inicios = list(range(0, total_paginas, PAGES_PER_TASK)) or [0]
+                bloques_pendientes[ruta_archivo] = {inicio: None for inicio in inicios}
+                omitidas_por_ruta[ruta_archivo] = []
+                for inicio in inicios:
+                    futuro = executor.submit(extraer_rango_paginas, ruta_archivo, inicio, inicio + PAGES_PER_TASK, timeout_pagina)
+                    futuro_a_tarea[futuro] = (ruta_archivo, inicio)
+            else:
+                futuro_a_tarea[executor.submit(_tarea_archivo, ruta_archivo, timeout_pagina)] = (ruta_archivo, None)
+
+        for futuro in as_completed(futuro_a_tarea):
+            ruta_archivo, inicio = futuro_a_tarea[futuro]
+            if ruta_archivo not in bloques_pendientes and inicio is not None:
+                continue # Otro bloque del mismo archivo ya falló
+            try:
+                textos, omitidas = futuro.result()
+            except Exception as e:
+                bloques_pendientes.pop(ruta_archivo, None)
+                yield ruta_archivo, None, [], e
+                continue
+            if omitidas:
+                print(f"  - Advertencia: páginas {omitidas} de '{ruta_archivo}' omitidas por superar {timeout_pagina}s.")
+            if inicio is None:
+                yield ruta_archivo, "\n".join(textos), omitidas, None
+                continue
+            bloques = bloques_pendientes[ruta_archivo]
+            bloques[inicio] = textos
+            omitidas_por_ruta[ruta_archivo].extend(omitidas)
+            if all(resultado is not None for resultado in bloques.values()):
+                del bloques_pendientes[ruta_archivo]
+                yield (ruta_archivo, "\n".join(texto for inicio_bloque in sorted(bloques) for texto in bloques[inicio_bloque]),
+                       sorted(omitidas_por_ruta.pop(ruta_archivo)), None)
+
+class CacheTextoExtraido:
+    """
+    Caché en disco del texto extraído de PDFs, comprimido con gzip y con una entrada por
+    (hash de contenido, versión del extractor). Al superar `max_bytes` se eliminan primero
+    las entradas usadas hace más tiempo. Lleva la cuenta de aciertos y fallos.
+    """
+    def __init__(self, directorio=TEXT_CACHE_DIR, max_bytes=TEXT_CACHE_MAX_BYTES, version=EXTRACTOR_VERSION):
+        self.directorio = directorio
+        self.max_bytes = max_bytes
+        self.version = version
+        self.aciertos = 0
+        self.fallos = 0
+        self.desalojadas = 0
+
+    def _ruta(self, sha256):
+        return os.path.join(self.directorio, sha256[:2], f"{sha256}-{self.version}.txt.gz")
+
+    def obtener(self, sha256):
+        ruta = self._ruta(sha256)
+        try:
+            with gzip.open(ruta, 'rt', encoding='utf-8') as f:
+                texto = f.read()
+        except (OSError, EOFError):
+            self.fallos += 1
+            return None
+        os.utime(ruta) # Marca la entrada como usada recientemente
+        self.aciertos += 1
+        return texto
+
+    def guardar(self, sha256, texto):
+        ruta = self._ruta(sha256)
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        ruta_temporal = f"{ruta}.{os.getpid()}.tmp"
+        with gzip.open(ruta_temporal, 'wt', encoding='utf-8', compresslevel=6) as f:
+            f.write(texto)
+        os.replace(ruta_temporal, ruta)
+
+    def desalojar(self):
+        """Elimina las entradas menos usadas hasta que la caché ocupe como mucho `max_bytes`."""
+        entradas = []
+        total = 0
+        for raiz, _, archivos in os.walk(self.directorio):
+            for archivo in archivos:
+                ruta = os.path.join(raiz, archivo)
+                try:
+                    estado = os.stat(ruta)
+                except OSError:
+                    continue
+                entradas.append((estado.st_mtime, estado.st_size, ruta))
+                total += estado.st_size
+        for _, tamano, ruta in sorted(entradas):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(ruta)
+            except OSError:
+                continue
+            total -= tamano
+            self.desalojadas += 1
+        return total
+
+    def resumen(self):
+        consultas = self.aciertos + self.fallos
+        ratio = (self.aciertos / consultas * 100) if consultas else 0.0
+        return f"{self.aciertos} aciertos, {self.fallos} fallos ({ratio:.1f}% de aciertos), {self.desalojadas} entradas desalojadas"
@@ -0,0 +1,431 @@
+import argparse # Para la interfaz de línea de comandos
+import logging
+import os
+import queue # Colas acotadas entre etapas
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import create_pdf # Crawler y exportador de Confluence
+import add_documents_to_chromadb as ingesta # Fragmentación y colección de ChromaDB
+import pdf_text_extraction # Extracción de texto de PDFs
+from query_cache import registrar_en_diario # Diario de ingesta para invalidar cachés de consultas
+import instrumentation # Tiempos por etapa y contadores (compartidos con create_pdf y la ingesta)
+from instrumentation import metricas
+
+# --- CONFIGURACIÓN ---
+# Carpeta donde se guardan los PDFs; por defecto la misma que lee add_documents_to_chromadb.py,
+# así los IDs 'file::<ruta>' coinciden y ese script no vuelve a añadirlos.
+OUTPUT_FOLDER = ingesta.DOCUMENTS_FOLDER
+# Tamaño máximo de cada cola: limita la memoria usada aunque el espacio sea muy grande
+PAGES_QUEUE_SIZE = 64
+PDF_QUEUE_SIZE = 16
+DOCUMENTS_QUEUE_SIZE = 16
+# Documentos por llamada a collection.upsert y espera máxima antes de escribir un lote incompleto
+WRITE_BATCH_SIZE = 8
+WRITE_BATCH_MAX_WAIT_SECONDS = 2.0
+# Con --formato markdown: espera máxima para completar un lote de create_pdf.BODY_BATCH_SIZE páginas antes de pedirlo
+BODY_BATCH_MAX_WAIT_SECONDS = 0.5
+
+_FIN = object() # Marca de fin de etapa
+
+def etapa_crawler(session, confluence_config, root_pages, crawl_workers, pages_queue, n_consumidores, stats, nombres_archivo):
+    """
+    Recorre el árbol en BFS y encola cada página en cuanto se descubre. El nombre de su archivo se reserva
+    al descubrirla, para que con títulos repetidos el nombre dependa del orden del recorrido y no del
+    orden en que terminan las exportaciones.
+    """
+    base_url = confluence_config['base_url']
+    space_key = confluence_config['space_key']
+    vistas = set()
+
+    def encolar(page):
+        if page['id'] in vistas:
+            return
+        vistas.add(page['id'])
+        nombres_archivo.filename_for(page['id'], page['title'])
+        stats['paginas_descubiertas'] += 1
+        pages_queue.put(page)
+
+    inicio = time.perf_counter()
+    ramas_fallidas = set()
+    try:
+        for page in root_pages:
+            encolar(page)
+        for _parent_id, children in create_pdf.iter_children_bfs(session, root_pages, base_url, space_key, crawl_workers,
+                                                                  failed_parents=ramas_fallidas):
+            for child in children:
+                encolar(child)
+    except Exception as e:
+        logging.error(f"[Pipeline] Error en la etapa de recorrido: {e}", exc_info=True)
+    finally:
+        # Incluye el tiempo bloqueado en la cola cuando los exportadores van por detrás
+        metricas.registrar_etapa("recorrido_arbol", time.perf_counter() - inicio, len(vistas), "páginas")
+        stats['paginas_sin_hijos_por_error'] = len(ramas_fallidas)
+        for _ in range(n_consumidores):
+            pages_queue.put(_FIN)
+
+def etapa_exportador(session, base_url, output_dir, pages_queue, pdf_queue, stats, stats_lock, nombres_archivo):
+    """
+    Exporta a PDF cada página recibida y encola la ruta del PDF guardado.
+    """
+    while True:
+        page = pages_queue.get()
+        if page is _FIN:
+            return
+        pdf_path = create_pdf.download_page_as_pdf(session, page['id'], page['title'], base_url, output_dir,
+                                                   nombres_archivo.filename_for(page['id'], page['title']))
+        metricas.contar("paginas_exportadas" if pdf_path else "paginas_fallidas")
+        with stats_lock:
+            stats['pdfs_exportados' if pdf_path else 'pdfs_fallidos'] += 1
+        if pdf_path:
+            pdf_queue.put((page, pdf_path))
+
+def etapa_markdown(session, base_url, output_dir, pages_queue, documents_queue, stats, stats_lock, nombres_archivo,
+                   representacion="storage"):
+    """
+    Alternativa a exportador + extractor: junta hasta BODY_BATCH_SIZE páginas de la cola (o las que lleguen
+    en BODY_BATCH_MAX_WAIT_SECONDS), pide su contenido en una sola búsqueda (create_pdf.iter_page_bodies),
+    guarda cada una como .md y encola sus fragmentos, divididos por secciones. No se renderiza ningún PDF
+    ni hay que extraer su texto.
+    """
+    terminado = False
+    while not terminado:
+        lote = [pages_queue.get()]
+        lote_iniciado = time.monotonic()
+        while lote[-1] is not _FIN and len(lote) < create_pdf.BODY_BATCH_SIZE:
+            try:
+                lote.append(pages_queue.get(timeout=max(0.0, BODY_BATCH_MAX_WAIT_SECONDS - (time.monotonic() - lote_iniciado))))
+            except queue.Empty:
+                break
+        if lote[-1] is _FIN:
+            terminado = True
+            lote.pop()
+        if not lote:
+            continue
+        paginas = {page['id']: page for page in lote}
+        for page_id, page_item in create_pdf.iter_page_bodies(session, base_url, paginas, representacion, len(paginas)):
+            page = paginas[page_id]
+            ruta_md = None
+            if page_item is not None:
+                ruta_md = os.path.join(output_dir, nombres_archivo.filename_for(page['id'], page['title']))
+                try:
+                    with metricas.etapa("conversion_markdown", 1, "páginas"):
+                        texto = create_pdf.page_to_markdown(page_item, representacion)
+                        create_pdf.write_text_file(ruta_md, texto)
+                except Exception as e:
+                    logging.error(f"[Pipeline] Error al convertir o guardar el markdown de '{page['title']}' (ID: {page_id}): {e}")
+                    ruta_md = None
+            metricas.contar("paginas_exportadas" if ruta_md else "paginas_fallidas")
+            with stats_lock:
+                stats['markdown_exportados' if ruta_md else 'markdown_fallidos'] += 1
+            if ruta_md:
+                metadatos = {"source_file": os.path.basename(ruta_md), "file_type": "md", "confluence_page_id": str(page_id)}
+                inicio = time.perf_counter()
+                fragmentos = ingesta.preparar_fragmentos(f"file::{ruta_md}", texto, metadatos)
+                metricas.registrar_etapa("fragmentacion", time.perf_counter() - inicio, len(fragmentos), "fragmentos")
+                documents_queue.put(fragmentos)
+
+def reenviar_extraccion(futuro, page, pdf_path, enviado_en, documents_queue, stats):
+    try:
+        texto, omitidas = futuro.result()
+        # Desde que se envió al pool, incluida la espera en su cola
+        metricas.registrar_etapa("extraccion_pdf", time.perf_counter() - enviado_en, 1, "archivos")
+    except Exception as e:
+        logging.error(f"[Pipeline] Error al extraer texto de '{pdf_path}': {e}")
+        stats['extracciones_fallidas'] += 1
+        return
+    if not texto or not texto.strip():
+        print(f"  - PDF '{pdf_path}' sin texto extraíble. Saltando.")
+        return
+    metadatos = {"source_file": os.path.basename(pdf_path), "file_type": "pdf", "confluence_page_id": str(page['id'])}
+    if omitidas:
+        # Se indexa lo extraído, pero escribir_lote no lo anota en el índice de ingesta para que se reintente
+        metricas.contar("extracciones_incompletas")
+        metadatos["extraccion_incompleta"] = True
+    inicio = time.perf_counter()
+    fragmentos = ingesta.preparar_fragmentos(f"file::{pdf_path}", texto, metadatos)
+    metricas.registrar_etapa("fragmentacion", time.perf_counter() - inicio, len(fragmentos), "fragmentos")
+    documents_queue.put(fragmentos)
+
+def etapa_extractor(pdf_queue, documents_queue, stats, workers=ingesta.EXTRACTION_WORKERS):
+    """
+    Extrae el texto de cada PDF en un pool de procesos y encola sus fragmentos listos para ChromaDB
+    en cuanto termina cada uno. Como mucho hay 2 * workers extracciones en curso.
+    Si un proceso del pool muere (p. ej. por falta de memoria con un PDF), las extracciones en curso
+    cuentan como fallidas y se crea un pool nuevo para el resto. El fin de documents_queue se marca
+    siempre, aunque la etapa falle, para que el escritor no se quede esperando.
+    """
+    workers = max(1, workers)
+    en_curso = {}
+    executor = ProcessPoolExecutor(max_workers=workers)
+    item = None
+    try:
+        while True:
+            item = pdf_queue.get()
+            if item is _FIN:
+                break
+            page, pdf_path = item
+            try:
+                futuro = executor.submit(pdf_text_extraction.extraer_texto_pdf_con_omitidas, pdf_path, ingesta.PAGE_TIMEOUT_SECONDS)
+            except BrokenProcessPool:
+                logging.error("[Pipeline] Un proceso de extracción terminó de forma inesperada. Se crea un pool nuevo.")
+                metricas.contar("pools_extraccion_recreados")
+                recoger_extracciones(en_curso, documents_queue, stats)
+                executor.shutdown(cancel_futures=True)
+                executor = ProcessPoolExecutor(max_workers=workers)
+                futuro = executor.submit(pdf_text_extraction.extraer_texto_pdf_con_omitidas, pdf_path, ingesta.PAGE_TIMEOUT_SECONDS)
+            en_curso[futuro] = (page, pdf_path, time.perf_counter())
+            while len(en_curso) >= 2 * workers:
+                terminados, _ = wait(en_curso, return_when=FIRST_COMPLETED)
+                for terminado in terminados:
+                    reenviar_extraccion(terminado, *en_curso.pop(terminado), documents_queue, stats)
+        recoger_extracciones(en_curso, documents_queue, stats)
+    except Exception as e:
+        logging.error(f"[Pipeline] Error en la etapa de extracción: {e}", exc_info=True)
+        stats['extracciones_fallidas'] += len(en_curso)
+        # Se siguen consumiendo los PDFs para no bloquear a los exportadores; cuentan como fallidos
+        while item is not _FIN:
+            item = pdf_queue.get()
+            if item is not _FIN:
+                stats['extracciones_fallidas'] += 1
+    finally:
+        executor.shutdown(cancel_futures=True)
+        documents_queue.put(_FIN)
+
+def recoger_extracciones(en_curso, documents_queue, stats):
+    """Espera a las extracciones en curso y encola sus fragmentos (las de un pool roto cuentan como fallidas)."""
+    for terminado in list(en_curso):
+        reenviar_extraccion(terminado, *en_curso.pop(terminado), documents_queue, stats)
+
+def cerrar_cola_al_terminar(hilos, cola):
+    """
+    Espera a que terminen todos los hilos de una etapa y marca el fin de la cola siguiente.
+    """
+    for hilo in hilos:
+        hilo.join()
+    cola.put(_FIN)
+
+def escribir_lote(escritor, lote, stats, indice=None):
+    for fragmentos in lote:
+        escritor.anadir_documento(fragmentos)
+    escritor.vaciar()
+    registrar_en_diario("upsert", escritor.collection.name, [fragmentos[0][2]['document_id'] for fragmentos in lote])
+    for fragmentos in lote:
+        metadatos = fragmentos[0][2]
+        if metadatos['document_id'] in escritor.documentos_fallidos:
+            stats['escrituras_fallidas'] += 1
+            continue
+        stats['documentos_indexados'] += 1
+        print(f"  + Indexado: {metadatos['source_file']} (página {metadatos['confluence_page_id']}, {len(fragmentos)} fragmentos)")
+        if indice is not None and not metadatos.get("extraccion_incompleta"):
+            registrar_en_indice(escritor.collection, indice, metadatos['document_id'], fragmentos, escritor.indice_bm25)
+
+def registrar_en_indice(collection, indice, id_documento, fragmentos, indice_bm25=None):
+    """
+    Anota el PDF escrito en el índice de add_documents_to_chromadb.py (para que ese script no lo
+    vuelva a procesar) y borra los fragmentos que quedaron de una versión anterior de la página.
+    """
+    ruta_archivo = id_documento[len("file::"):]
+    ids_nuevos = [id_fragmento for id_fragmento, _, _ in fragmentos]
+    entrada_anterior = indice["files"].get(ruta_archivo) or {}
+    ids_obsoletos = [id_antiguo for id_antiguo in entrada_anterior.get("ids", []) if id_antiguo not in set(ids_nuevos)]
+    try:
+        if ids_obsoletos:
+            collection.delete(ids=ids_obsoletos)
+            if indice_bm25 is not None:
+                indice_bm25.borrar(ids_obsoletos)
+        indice["files"][ruta_archivo] = ingesta.entrada_indice(ruta_archivo, ingesta.calcular_sha256(ruta_archivo), ids_nuevos)
+    except Exception as e:
+        logging.error(f"[Pipeline] No se pudo actualizar el índice de ingesta para '{ruta_archivo}': {e}")
+
+def etapa_escritor(collection, documents_queue, stats, etapa_embeddings=None, ruta_indice=None, ruta_bm25=None,
+                   db_path=ingesta.CHROMA_DB_PATH):
+    """
+    Escribe los fragmentos de los documentos en ChromaDB en lotes pequeños: un lote se envía al llenarse
+    o cuando pasan WRITE_BATCH_MAX_WAIT_SECONDS, para que las páginas sean buscables enseguida.
+    Sin `ruta_indice` ni `ruta_bm25` se usan los índices de la colección de `db_path` (ingesta.rutas_de_indices).
+    """
+    ruta_indice_coleccion, ruta_bm25_coleccion = ingesta.rutas_de_indices(collection.name, db_path)
+    ruta_indice = ruta_indice or ruta_indice_coleccion
+    ruta_bm25 = ruta_bm25 or ruta_bm25_coleccion
+    indice_bm25 = ingesta.abrir_indice_bm25(collection, ruta_bm25)
+    escritor = ingesta.EscritorPorLotes(collection, ingesta.ADD_BATCH_SIZE, etapa_embeddings, indice_bm25)
+    # Solo se mantiene el índice de ingesta si ya existe para esta colección; si no,
+    # add_documents_to_chromadb.py lo reconstruirá a partir de la colección.
+    indice = ingesta.cargar_indice_ingesta(ruta_indice)
+    if indice is not None and not ingesta.indice_es_de(indice, collection.name, db_path):
+        indice = None
+    lote = []
+    lote_iniciado = None
+    while True:
+        timeout = None
+        if lote:
+            timeout = max(0.0, WRITE_BATCH_MAX_WAIT_SECONDS - (time.monotonic() - lote_iniciado))
+        try:
+            doc = documents_queue.get(timeout=timeout)
+        except queue.Empty:
+            doc = None
+        if doc is _FIN:
+            break
+        if doc:
+            if not lote:
+                lote_iniciado = time.monotonic()
+            lote.append(doc)
+        if lote and (len(lote) >= WRITE_BATCH_SIZE or doc is None):
+            escribir_lote(escritor, lote, stats, indice)
+            lote = []
+    if lote:
+        escribir_lote(escritor, lote, stats, indice)
+    if indice is not None:
+        ingesta.guardar_indice_ingesta(indice, ruta_indice)
+    indice_bm25.cerrar()
+
+def ejecutar_pipeline(confluence_config, collection, output_dir=OUTPUT_FOLDER, export_workers=create_pdf.DEFAULT_EXPORT_CONCURRENCY,
+                      crawl_workers=create_pdf.DEFAULT_CRAWL_WORKERS, max_requests_per_host=create_pdf.DEFAULT_MAX_REQUESTS_PER_HOST,
+                      etapa_embeddings=None, formato="pdf", representacion="storage", extraction_workers=ingesta.EXTRACTION_WORKERS,
+                      ruta_indice=None, ruta_bm25=None, session=None, stats=None, db_path=ingesta.CHROMA_DB_PATH):
+    """
+    Ejecuta recorrido -> exportación a PDF -> extracción de texto -> escritura en ChromaDB
+    como etapas concurrentes unidas por colas acotadas. Devuelve las estadísticas de la ejecución.
+    Con formato="markdown" la exportación y la extracción se sustituyen por etapa_markdown.
+    Si se pasa `session` se reutiliza (p. ej. para compartir sus límites por host entre varios pipelines)
+    y si se pasa `stats` se rellena durante la ejecución, para seguir el progreso desde otro hilo.
+    `db_path` es la base de datos de `collection`, para elegir sus índices de ingesta y BM25.
+    """
+    stats = stats if stats is not None else {}
+    if formato == "markdown":
+        stats.update({'paginas_descubiertas': 0, 'paginas_sin_hijos_por_error': 0, 'markdown_exportados': 0, 'markdown_fallidos': 0,
+                      'documentos_indexados': 0, 'escrituras_fallidas': 0})
+    else:
+        stats.update({'paginas_descubiertas': 0, 'paginas_sin_hijos_por_error': 0, 'pdfs_exportados': 0, 'pdfs_fallidos': 0,
+                      'extracciones_fallidas': 0, 'documentos_indexados': 0, 'escrituras_fallidas': 0})
+    stats_lock = threading.Lock()
+
+    if session is None:
+        session = create_pdf.create_confluence_session(confluence_config, max_requests_per_host, export_workers)
+    root_pages, _ = create_pdf.get_root_pages(session, confluence_config)
+    if not root_pages:
+        return stats
+
+    nombres_archivo = create_pdf.ExportFilenameAllocator(extension=create_pdf.EXPORT_FILE_EXTENSIONS[formato])
+    pages_queue = queue.Queue(maxsize=PAGES_QUEUE_SIZE)
+    pdf_queue = queue.Queue(maxsize=PDF_QUEUE_SIZE)
+    documents_queue = queue.Queue(maxsize=DOCUMENTS_QUEUE_SIZE)
+
+    crawler = threading.Thread(
+        target=etapa_crawler, name="pipeline-crawler",
+        args=(session, confluence_config, root_pages, crawl_workers, pages_queue, export_workers, stats, nombres_archivo), daemon=True
+    )
+    if formato == "markdown":
+        exportadores = [
+            threading.Thread(
+                target=etapa_markdown, name=f"pipeline-markdown-{i}",
+                args=(session, confluence_config['base_url'], output_dir, pages_queue, documents_queue, stats, stats_lock,
+                      nombres_archivo, representacion), daemon=True
+            )
+            for i in range(export_workers)
+        ]
+        cierre_exportadores = threading.Thread(target=cerrar_cola_al_terminar, args=(exportadores, documents_queue), daemon=True)
+        for hilo in [crawler, *exportadores, cierre_exportadores]:
+            hilo.start()
+        etapa_escritor(collection, documents_queue, stats, etapa_embeddings, ruta_indice, ruta_bm25, db_path)
+        crawler.join()
+        return stats
+
+    exportadores = [
+        threading.Thread(
+            target=etapa_exportador, name=f"pipeline-export-{i}",
+            args=(session, confluence_config['base_url'], output_dir, pages_queue, pdf_queue, stats, stats_lock, nombres_archivo), daemon=True
+        )
+        for i in range(export_workers)
+    ]
+    extractor = threading.Thread(target=etapa_extractor, name="pipeline-extractor",
+                                 args=(pdf_queue, documents_queue, stats, extraction_workers), daemon=True)
+    cierre_exportadores = threading.Thread(target=cerrar_cola_al_terminar, args=(exportadores, pdf_queue), daemon=True)
+
+    for hilo in [crawler, *exportadores, extractor, cierre_exportadores]:
+        hilo.start()
+    etapa_escritor(collection, documents_queue, stats, etapa_embeddings, ruta_indice, ruta_bm25, db_path) # La escritura en ChromaDB se hace en el hilo principal
+    crawler.join()
+    extractor.join()
+    return stats
+
+def parse_args(argv=None):
+    create_pdf.load_dotenv() # Para que los valores por defecto tengan en cuenta el archivo .env
+    parser = argparse.ArgumentParser(description="Exporta un espacio de Confluence a PDF (o markdown) y lo indexa en ChromaDB en streaming.")
+    parser.add_argument("--output-dir", default=os.getenv("PIPELINE_OUTPUT_FOLDER") or OUTPUT_FOLDER,
+                        help=f"Carpeta donde se guardan los PDFs o .md (por defecto: {OUTPUT_FOLDER})")
+    parser.add_argument("--formato", choices=create_pdf.EXPORT_FORMATS,
+                        default=(os.getenv("CONFLUENCE_EXPORT_FORMAT") or "pdf").strip().lower(),
+                        help="'pdf' (exportar a PDF y extraer su texto) o 'markdown' (pedir el contenido en bloque y "
+                             "convertirlo a markdown, sin renderizar PDFs; los fragmentos respetan las secciones)")
+    parser.add_argument("--body-format", choices=create_pdf.BODY_REPRESENTATIONS, default="storage",
+                        help="Con --formato markdown: convertir body.storage (por defecto) o body.view")
+    parser.add_argument("--db", default=ingesta.CHROMA_DB_PATH, help=f"Ruta de la base de datos ChromaDB (por defecto: {ingesta.CHROMA_DB_PATH})")
+    parser.add_argument("--coleccion", default=ingesta.COLLECTION_NAME, help=f"Nombre de la colección (por defecto: {ingesta.COLLECTION_NAME})")
+    parser.add_argument("--indice", help="Índice local de ingesta (por defecto, el de la colección: ver --help de add_documents_to_chromadb.py)")
+    parser.add_argument("--bm25", help="Índice BM25 (por defecto, el de la colección: ver --help de add_documents_to_chromadb.py)")
+    parser.add_argument("--export-concurrency", type=int,
+                        default=create_pdf.get_int_env("CONFLUENCE_EXPORT_CONCURRENCY", create_pdf.DEFAULT_EXPORT_CONCURRENCY),
+                        help="Exportaciones a PDF simultáneas (con --formato markdown, lotes de contenido simultáneos)")
+    parser.add_argument("--crawl-workers", type=int, default=create_pdf.get_int_env("CONFLUENCE_CRAWL_WORKERS", create_pdf.DEFAULT_CRAWL_WORKERS),
+                        help="Hilos para recorrer el árbol de páginas")
+    parser.add_argument("--max-requests-per-host", type=int,
+                        default=create_pdf.get_int_env("CONFLUENCE_MAX_REQUESTS_PER_HOST", create_pdf.DEFAULT_MAX_REQUESTS_PER_HOST),
+                        help="Peticiones HTTP simultáneas como máximo contra el wiki")
+    parser.add_argument("--backend", choices=["torch", "torch-quantized", "onnx"], default=ingesta.EMBEDDING_BACKEND,
+                        help="Backend para calcular los embeddings")
+    parser.add_argument("--log-level", choices=create_pdf.LOG_LEVELS, type=str.upper,
+                        default=(os.getenv("CONFLUENCE_LOG_LEVEL") or create_pdf.DEFAULT_LOG_LEVEL).strip().upper(),
+                        help=f"Nivel del archivo de log '{create_pdf.LOG_FILENAME}' (por defecto: {create_pdf.DEFAULT_LOG_LEVEL})")
+    instrumentation.anadir_argumentos(parser)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    create_pdf.configure_logging(log_level=args.log_level)
+    instrumentation.configurar_desde_args(args)
+    print(f"Pipeline Confluence -> {'PDF -> Texto' if args.formato == 'pdf' else 'Markdown'} -> ChromaDB (modo streaming)")
+    print("-----------------------------------------------------------------")
+
+    confluence_config = create_pdf.load_confluence_config()
+    if confluence_config is None:
+        return
+    output_dir = args.output_dir
+    os.makedirs(output_dir, exist_ok=True)
+
+    client = ingesta.inicializar_cliente(args.db)
+    embedding_function = ingesta.cargar_funcion_embedding(ingesta.EMBEDDING_MODEL_NAME, args.backend)
+    if embedding_function is None:
+        return
+    collection = ingesta.obtener_coleccion(client, args.coleccion, embedding_function)
+    if collection is None:
+        return
+
+    inicio = time.monotonic()
+    stats = ejecutar_pipeline(
+        confluence_config, collection, output_dir,
+        export_workers=args.export_concurrency,
+        crawl_workers=args.crawl_workers,
+        max_requests_per_host=args.max_requests_per_host,
+        etapa_embeddings=embedding_function,
+        formato=args.formato,
+        representacion=args.body_format,
+        ruta_indice=args.indice,
+        ruta_bm25=args.bm25,
+        db_path=args.db,
+    )
+    duracion = time.monotonic() - inicio
+
+    print("\n--- Resumen del Pipeline ---")
+    for clave, valor in stats.items():
+        print(f"  {clave.replace('_', ' ').capitalize()}: {valor}")
+    print(f"  Tiempo total: {duracion:.1f}s")
+    print(f"  Embeddings: {embedding_function.resumen()}")
+    print(f"Total de fragmentos en la colección '{args.coleccion}' ahora: {collection.count()}")
+    instrumentation.mostrar_resumen("Tiempo por etapa del pipeline")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from array import array # Para obtener los bytes de un embedding sin depender de numpy
+from collections import OrderedDict
+
+# --- CONFIGURACIÓN ---
+# Memoria máxima (aproximada) de cada nivel de la caché
+EMBEDDING_CACHE_MAX_BYTES = 16 * 1024 ** 2
+RESULT_CACHE_MAX_BYTES = 48 * 1024 ** 2
+# Segundos de vida de cada entrada: los embeddings de una consulta no cambian mientras no cambie
+# el modelo; los resultados caducan antes por si la colección se modifica sin pasar por el diario
+EMBEDDING_CACHE_TTL_SECONDS = 24 * 3600
+RESULT_CACHE_TTL_SECONDS = 600
+# Diario de ingesta: los scripts que modifican la colección añaden una línea JSON por operación
+# y la caché lo lee para invalidar las entradas afectadas
+INGEST_JOURNAL_PATH = "./diario_ingesta_chromadb.jsonl"
+# Tamaño a partir del cual el diario se vacía (los lectores lo detectan y vacían su caché de resultados)
+INGEST_JOURNAL_MAX_BYTES = 8 * 1024 ** 2
+# Cada cuántos segundos como mucho se mira si el diario tiene operaciones nuevas
+JOURNAL_POLL_SECONDS = 1.0
+
+def registrar_en_diario(operacion, collection_name, ids_documento=(), ruta_diario=INGEST_JOURNAL_PATH):
+    """
+    Añade una operación al diario de ingesta. `operacion` es "upsert", "delete" o "reset" e
+    `ids_documento` son los IDs de archivo ('file::<ruta>') afectados.
+    """
+    evento = {"ts": time.time(), "operacion": operacion, "collection": collection_name, "documentos": sorted(set(ids_documento))}
+    try:
+        if os.path.exists(ruta_diario) and os.path.getsize(ruta_diario) > INGEST_JOURNAL_MAX_BYTES:
+            evento = {**evento, "operacion": "reset"} # Al vaciar el diario, los lectores deben olvidar todo
+            modo = 'w'
+        else:
+            modo = 'a'
+        with open(ruta_diario, modo, encoding='utf-8') as f:
+            f.write(json.dumps(evento, ensure_ascii=False) + "\n")
+    except OSError as e:
+        print(f"Advertencia: no se pudo escribir en el diario de ingesta '{ruta_diario}': {e}")
+
+def normalizar_consulta(texto):
+    """Minúsculas y espacios colapsados: 'Cómo  configuro la VPN ' y 'cómo configuro la vpn' comparten entrada."""
+    return re.sub(r'\s+', ' ', texto).strip().lower()
+
+class CacheLRUConTTL:
+    """
+    Caché LRU con caducidad por entrada y presupuesto de memoria aproximado en bytes.
+    Se puede usar desde varios hilos a la vez. Si se indica `al_quitar`, se llama con (clave, valor)
+    por cada entrada que sale de la caché (desalojada, caducada, sustituida o quitada), fuera del lock.
+    """
+    def __init__(self, max_bytes, ttl_seconds, al_quitar=None):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.al_quitar = al_quitar
+        self._entradas = OrderedDict() # clave -> (valor, tamaño, caduca_en)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.desalojadas = 0
+
+    def obtener(self, clave):
+        quitadas = []
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None or entrada[2] < time.monotonic():
+                if entrada is not None:
+                    self._quitar(clave, quitadas)
+                self.fallos += 1
+                entrada = None
+            else:
+                self._entradas.move_to_end(clave)
+                self.aciertos += 1
+        self._notificar(quitadas)
+        return entrada[0] if entrada is not None else None
+
+    def guardar(self, clave, valor, tamano):
+        if tamano > self.max_bytes:
+            return
+        quitadas = []
+        with self._lock:
+            if clave in self._entradas:
+                self._quitar(clave, quitadas)
+            self._entradas[clave] = (valor, tamano, time.monotonic() + self.ttl_seconds)
+            self._bytes += tamano
+            while self._bytes > self.max_bytes:
+                clave_antigua = next(iter(self._entradas))
+                self._quitar(clave_antigua, quitadas)
+                self.desalojadas += 1
+        self._notificar(quitadas)
+
+    def quitar(self, claves):
+        quitadas = []
+        with self._lock:
+            for clave in claves:
+                if clave in self._entradas:
+                    self._quitar(clave, quitadas)
+        self._notificar(quitadas)
+
+    def vaciar(self):
+        with self._lock:
+            self._entradas.clear()
+            self._bytes = 0
+
+    def _quitar(self, clave, quitadas):
+        valor, tamano, _ = self._entradas.pop(clave)
+        self._bytes -= tamano
+        quitadas.append((clave, valor))
+
+    def _notificar(self, quitadas):
+        if self.al_quitar is not None:
+            for clave, valor in quitadas:
+                self.al_quitar(clave, valor)
+
+    def resumen(self):
+        with self._lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                "entradas": len(self._entradas),
+                "bytes": self._bytes,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "ratio_aciertos": round(self.aciertos / consultas, 4) if consultas else 0.0,
+                "desalojadas": self.desalojadas,
+            }
+
+class CacheConsultas:
+    """
+    Caché de dos niveles delante de collection.query:
+    - texto normalizado de la consulta -> embedding (se ahorra la pasada por el modelo)
+    - (embedding, k, filtros) -> resultados (se ahorra la búsqueda en el índice HNSW)
+    Las entradas de resultados se invalidan leyendo el diario de ingesta: un "delete" quita las
+    entradas que contenían fragmentos de esos documentos; un "upsert" o "reset" vacía el nivel de
+    resultados, porque los fragmentos nuevos pueden entrar en el top-k de cualquier consulta.
+    """
+    def __init__(self, collection_name, ruta_diario=INGEST_JOURNAL_PATH):
+        self.collection_name = collection_name
+        self.embeddings = CacheLRUConTTL(EMBEDDING_CACHE_MAX_BYTES, EMBEDDING_CACHE_TTL_SECONDS)
+        # Al desalojar o caducar una entrada de resultados se quita también de _claves_por_documento,
+        # para que el mapa no crezca sin límite
+        self.resultados = CacheLRUConTTL(RESULT_CACHE_MAX_BYTES, RESULT_CACHE_TTL_SECONDS, self._olvidar_resultados)
+        self.ruta_diario = ruta_diario
+        self._claves_por_documento = {} # id de documento -> claves de resultados que lo contienen
+        self._lock = threading.RLock() # revisar_diario quita resultados (y así llama a _olvidar_resultados) con el lock tomado
+        self._posicion_diario = os.path.getsize(ruta_diario) if os.path.exists(ruta_diario) else 0
+        self._ultima_lectura_diario = 0.0
+        self.invalidaciones = 0
+
+    def obtener_embedding(self, consulta):
+        return self.embeddings.obtener(normalizar_consulta(consulta))
+
+    def guardar_embedding(self, consulta, embedding):
+        self.embeddings.guardar(normalizar_consulta(consulta), embedding, 8 * len(embedding) + 64)
+
+    @staticmethod
+    def clave_resultados(embedding, k, filtro=None, filtro_documento=None, consulta=None, modo=None):
+        """
+        Clave del nivel de resultados. Las búsquedas que usan el índice léxico (modo distinto de
+        None) incluyen también el texto normalizado de la consulta; `embedding` puede ser None.
+        """
+        digest = hashlib.sha1(array('f', embedding).tobytes() if embedding is not None else b"")
+        if consulta is not None:
+            digest.update(normalizar_consulta(consulta).encode('utf-8'))
+        digest.update(json.dumps([k, filtro, filtro_documento, modo], sort_keys=True, ensure_ascii=False).encode('utf-8'))
+        return digest.hexdigest()
+
+    def obtener_resultados(self, clave):
+        self.revisar_diario()
+        return self.resultados.obtener(clave)
+
+    def guardar_resultados(self, clave, resultados):
+        tamano = len(json.dumps(resultados, ensure_ascii=False, default=str)) + 128
+        with self._lock: # Con el lock, un desalojo desde otro hilo no puede colarse entre guardar y anotar
+            self.resultados.guardar(clave, resultados, tamano)
+            for id_documento in self._documentos_de(resultados):
+                self._claves_por_documento.setdefault(id_documento, set()).add(clave)
+
+    @staticmethod
+    def _documentos_de(resultados):
+        for resultado in resultados:
+            metadatos = resultado.get("metadatos") or {}
+            yield metadatos.get("document_id") or resultado["id"].split("::chunk::", 1)[0]
+
+    def _olvidar_resultados(self, clave, resultados):
+        with self._lock:
+            for id_documento in self._documentos_de(resultados):
+                claves = self._claves_por_documento.get(id_documento)
+                if claves is not None:
+                    claves.discard(clave)
+                    if not claves:
+                        del self._claves_por_documento[id_documento]
+
+    def revisar_diario(self):
+        """Aplica las operaciones añadidas al diario desde la última lectura."""
+        ahora = time.monotonic()
+        with self._lock:
+            if ahora - self._ultima_lectura_diario < JOURNAL_POLL_SECONDS:
+                return
+            self._ultima_lectura_diario = ahora
+            try:
+                tamano = os.path.getsize(self.ruta_diario)
+            except OSError:
+                return
+            if tamano < self._posicion_diario: # El diario se vació
+                self._posicion_diario = 0
+            if tamano == self._posicion_diario:
+                return
+            with open(self.ruta_diario, 'r', encoding='utf-8') as f:
+                f.seek(self._posicion_diario)
+                lineas = f.readlines()
+                self._posicion_diario = f.tell()
+            for linea in lineas:
+                try:
+                    evento = json.loads(linea)
+                except json.JSONDecodeError:
+                    continue # Línea a medio escribir o dañada
+                if evento.get("collection") not in (None, self.collection_name):
+                    continue
+                self.invalidaciones += 1
+                if evento.get("operacion") == "delete":
+                    claves = set()
+                    for id_documento in evento.get("documentos", []):
+                        claves |= self._claves_por_documento.pop(id_documento, set())
+                    self.resultados.quitar(claves)
+                else:
+                    self.resultados.vaciar()
+                    self._claves_por_documento.clear()
+
+    def resumen(self):
+        return {"embeddings": self.embeddings.resumen(), "resultados": self.resultados.resumen(), "invalidaciones": self.invalidaciones}
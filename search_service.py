@@ -0,0 +1,361 @@
+import argparse # Para la interfaz de línea de comandos
+import bisect
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Literal, Optional
+
+from dotenv import load_dotenv
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+
+import add_documents_to_chromadb as ingesta # Cliente, colección y función de embedding
+from query_cache import CacheConsultas # Caché de embeddings de consultas y de resultados
+from bm25_index import IndiceBM25 # Índice léxico construido durante la ingesta
+import answer_pipeline as rag # Respuestas generadas con los fragmentos recuperados
+
+# --- CONFIGURACIÓN ---
+SEARCH_HOST = "127.0.0.1"
+SEARCH_PORT = 8000
+# Resultados por consulta por defecto y máximo permitido
+SEARCH_DEFAULT_K = 5
+SEARCH_MAX_K = 50
+# Consultas como máximo en una llamada a /search/batch
+SEARCH_MAX_BATCH = 64
+# Latencias recientes que se conservan para calcular p50/p99 y ventana (segundos) para las QPS
+METRICS_MAX_SAMPLES = 10000
+METRICS_QPS_WINDOW_SECONDS = 60
+# Búsqueda híbrida: cada método aporta k * HYBRID_CANDIDATES_FACTOR candidatos y la puntuación final es
+# (1 - peso_lexico) * similitud vectorial normalizada + peso_lexico * BM25 normalizado
+HYBRID_CANDIDATES_FACTOR = 4
+HYBRID_LEXICAL_WEIGHT = 0.5
+# Candidatos BM25 como mínimo antes de aplicar los filtros de metadatos
+BM25_MIN_CANDIDATES = 50
+
+class Busqueda(BaseModel):
+    consulta: str
+    k: int = Field(SEARCH_DEFAULT_K, ge=1, le=SEARCH_MAX_K)
+    filtro: Optional[Dict[str, Any]] = None # Filtro de metadatos de ChromaDB (where), p. ej. {"file_type": "pdf"}
+    filtro_documento: Optional[Dict[str, Any]] = None # Filtro sobre el texto (where_document), p. ej. {"$contains": "VPN"}
+    modo: Literal["vector", "bm25", "hibrido"] = "vector" # "bm25" para identificadores exactos (claves de ticket, códigos de error)
+    peso_lexico: float = Field(HYBRID_LEXICAL_WEIGHT, ge=0, le=1) # Solo en modo "hibrido"
+
+class BusquedaEnLote(BaseModel):
+    consultas: List[str] = Field(..., min_length=1, max_length=SEARCH_MAX_BATCH)
+    k: int = Field(SEARCH_DEFAULT_K, ge=1, le=SEARCH_MAX_K)
+    filtro: Optional[Dict[str, Any]] = None
+    filtro_documento: Optional[Dict[str, Any]] = None
+    modo: Literal["vector", "bm25", "hibrido"] = "vector"
+    peso_lexico: float = Field(HYBRID_LEXICAL_WEIGHT, ge=0, le=1)
+
+class Pregunta(BaseModel):
+    pregunta: str = Field(..., min_length=1)
+    filtro: Optional[Dict[str, Any]] = None
+    filtro_documento: Optional[Dict[str, Any]] = None
+    modo: Literal["vector", "bm25", "hibrido"] = "vector"
+    presupuesto_tokens: int = Field(rag.ANSWER_CONTEXT_TOKEN_BUDGET, ge=100, le=100000) # Tokens de contexto para las fuentes
+    stream: bool = True # Eventos SSE según llega la respuesta del LLM; con False, un único JSON
+
+def normalizar_puntuaciones(puntuaciones):
+    """Escala {id: puntuación} a [0, 1] (min-max); si todas son iguales valen 1."""
+    if not puntuaciones:
+        return {}
+    minima, maxima = min(puntuaciones.values()), max(puntuaciones.values())
+    if maxima == minima:
+        return {id_fragmento: 1.0 for id_fragmento in puntuaciones}
+    return {id_fragmento: (valor - minima) / (maxima - minima) for id_fragmento, valor in puntuaciones.items()}
+
+def fusionar_resultados(vectoriales, lexicos, k, peso_lexico=HYBRID_LEXICAL_WEIGHT):
+    """
+    Combina los resultados vectoriales y BM25 de una consulta: cada lista se normaliza a [0, 1]
+    y se suman con pesos (1 - peso_lexico) y peso_lexico. Devuelve los k mejores.
+    """
+    vectorial = normalizar_puntuaciones({r["id"]: -r["distancia"] for r in vectoriales})
+    lexica = normalizar_puntuaciones({r["id"]: r["puntuacion_bm25"] for r in lexicos})
+    por_id = {}
+    for resultado in lexicos + vectoriales: # Los vectoriales pisan a los léxicos para conservar la distancia
+        por_id[resultado["id"]] = {**por_id.get(resultado["id"], {}), **resultado}
+    for id_fragmento, resultado in por_id.items():
+        resultado["puntuacion"] = (1 - peso_lexico) * vectorial.get(id_fragmento, 0.0) + peso_lexico * lexica.get(id_fragmento, 0.0)
+    return sorted(por_id.values(), key=lambda resultado: resultado["puntuacion"], reverse=True)[:k]
+
+class MetricasLatencia:
+    """
+    Latencias recientes por endpoint (para p50/p99) y marcas de tiempo de las peticiones
+    del último minuto (para las QPS). Se puede usar desde varios hilos a la vez.
+    """
+    def __init__(self, max_muestras=METRICS_MAX_SAMPLES, ventana_qps=METRICS_QPS_WINDOW_SECONDS):
+        self.max_muestras = max_muestras
+        self.ventana_qps = ventana_qps
+        self._latencias = {}
+        self._instantes = {}
+        self._totales = {}
+        self._errores = {}
+        self._lock = threading.Lock()
+        self.inicio = time.monotonic()
+
+    def registrar(self, endpoint, segundos, error=False):
+        ahora = time.monotonic()
+        with self._lock:
+            self._latencias.setdefault(endpoint, deque(maxlen=self.max_muestras)).append(segundos)
+            instantes = self._instantes.setdefault(endpoint, deque())
+            instantes.append(ahora)
+            while instantes and instantes[0] < ahora - self.ventana_qps:
+                instantes.popleft()
+            self._totales[endpoint] = self._totales.get(endpoint, 0) + 1
+            if error:
+                self._errores[endpoint] = self._errores.get(endpoint, 0) + 1
+
+    @staticmethod
+    def percentil(ordenadas, p):
+        if not ordenadas:
+            return None
+        return ordenadas[min(len(ordenadas) - 1, int(round(p / 100 * (len(ordenadas) - 1))))]
+
+    def resumen(self):
+        ahora = time.monotonic()
+        resultado = {"uptime_s": round(ahora - self.inicio, 1), "endpoints": {}}
+        with self._lock:
+            for endpoint, latencias in self._latencias.items():
+                ordenadas = sorted(latencias)
+                instantes = self._instantes[endpoint]
+                recientes = len(instantes) - bisect.bisect_left(instantes, ahora - self.ventana_qps)
+                ventana = min(self.ventana_qps, max(ahora - self.inicio, 1e-9))
+                resultado["endpoints"][endpoint] = {
+                    "peticiones": self._totales[endpoint],
+                    "errores": self._errores.get(endpoint, 0),
+                    "qps": round(recientes / ventana, 2),
+                    "p50_ms": round(self.percentil(ordenadas, 50) * 1000, 2),
+                    "p99_ms": round(self.percentil(ordenadas, 99) * 1000, 2),
+                }
+        return resultado
+
+class Buscador:
+    """
+    Colección y modelo de embeddings cargados una sola vez y compartidos por todas las peticiones.
+    Con `usar_cache`, los embeddings de las consultas y sus resultados se guardan en una CacheConsultas.
+    """
+    def __init__(self, db_path=ingesta.CHROMA_DB_PATH, collection_name=ingesta.COLLECTION_NAME, backend=ingesta.EMBEDDING_BACKEND,
+                 usar_cache=True, bm25_path=None):
+        self.collection_name = collection_name
+        bm25_path = bm25_path or ingesta.rutas_de_indices(collection_name, db_path)[1]
+        self.cache = CacheConsultas(collection_name) if usar_cache else None
+        # Sin caché en disco: las consultas no se repiten lo bastante como para guardarlas una a una
+        self.etapa_embeddings = ingesta.EtapaEmbeddings(ingesta.EMBEDDING_MODEL_NAME, backend, usar_cache=False)
+        if not ingesta.cargar_modelo(self.etapa_embeddings):
+            raise RuntimeError("No se pudo cargar el modelo de embeddings.")
+        client = ingesta.inicializar_cliente(db_path)
+        self.collection = ingesta.obtener_coleccion(client, collection_name, self.etapa_embeddings)
+        if self.collection is None:
+            raise RuntimeError(f"No se pudo abrir la colección '{collection_name}'.")
+        self.indice_bm25 = None
+        if os.path.exists(bm25_path):
+            indice_bm25 = IndiceBM25(bm25_path)
+            if indice_bm25.coleccion() == collection_name:
+                self.indice_bm25 = indice_bm25
+            else:
+                indice_bm25.cerrar()
+        if self.indice_bm25 is None:
+            print(f"Advertencia: no hay índice BM25 de la colección '{collection_name}' en '{bm25_path}'; "
+                  "los modos 'bm25' e 'hibrido' no estarán disponibles hasta ejecutar add_documents_to_chromadb.py.")
+
+    def buscar(self, consultas, k=SEARCH_DEFAULT_K, filtro=None, filtro_documento=None, modo="vector", peso_lexico=HYBRID_LEXICAL_WEIGHT):
+        """
+        Devuelve, para cada consulta, una lista de resultados {id, documento, metadatos, distancia}
+        (más puntuacion_bm25 y puntuacion en los modos "bm25" e "hibrido").
+        Las consultas que no están en caché se codifican en un solo lote y se resuelven con una sola llamada a query.
+        """
+        consultas = list(consultas)
+        if modo != "vector" and self.indice_bm25 is None:
+            raise ValueError(f"El modo '{modo}' necesita el índice BM25 de la colección, que no existe todavía.")
+        embeddings = [None] * len(consultas)
+        if modo != "bm25":
+            embeddings = [self.cache.obtener_embedding(consulta) if self.cache else None for consulta in consultas]
+            sin_embedding = [i for i, embedding in enumerate(embeddings) if embedding is None]
+            if sin_embedding:
+                for i, embedding in zip(sin_embedding, self.etapa_embeddings.codificar([consultas[i] for i in sin_embedding])):
+                    embeddings[i] = embedding
+                    if self.cache:
+                        self.cache.guardar_embedding(consultas[i], embedding)
+
+        claves = [None] * len(consultas)
+        if self.cache:
+            claves = [
+                self.cache.clave_resultados(embedding, k, filtro, filtro_documento,
+                                            None if modo == "vector" else consulta, None if modo == "vector" else [modo, peso_lexico])
+                for consulta, embedding in zip(consultas, embeddings)
+            ]
+        resultados = [self.cache.obtener_resultados(clave) if self.cache else None for clave in claves]
+        sin_resultados = [i for i, resultado in enumerate(resultados) if resultado is None]
+        if not sin_resultados:
+            return resultados
+
+        n_candidatos = k if modo == "vector" else k * HYBRID_CANDIDATES_FACTOR
+        vectoriales = {}
+        if modo != "bm25":
+            vectoriales = dict(zip(sin_resultados, self.buscar_vectorial([embeddings[i] for i in sin_resultados], n_candidatos,
+                                                                         filtro, filtro_documento)))
+        for i in sin_resultados:
+            if modo == "vector":
+                resultados[i] = vectoriales[i]
+            elif modo == "bm25":
+                resultados[i] = self.buscar_lexico(consultas[i], k, filtro, filtro_documento)
+            else:
+                lexicos = self.buscar_lexico(consultas[i], n_candidatos, filtro, filtro_documento)
+                resultados[i] = fusionar_resultados(vectoriales[i], lexicos, k, peso_lexico)
+            if self.cache:
+                self.cache.guardar_resultados(claves[i], resultados[i])
+        return resultados
+
+    def buscar_vectorial(self, embeddings, k, filtro=None, filtro_documento=None):
+        respuesta = self.collection.query(
+            query_embeddings=embeddings, n_results=k, where=filtro or None,
+            where_document=filtro_documento or None, include=['documents', 'metadatas', 'distances'],
+        )
+        return [
+            [
+                {"id": id_fragmento, "documento": documento, "metadatos": metadatos, "distancia": distancia}
+                for id_fragmento, documento, metadatos, distancia in zip(
+                    respuesta['ids'][i], respuesta['documents'][i], respuesta['metadatas'][i], respuesta['distances'][i]
+                )
+            ]
+            for i in range(len(embeddings))
+        ]
+
+    def buscar_lexico(self, consulta, k, filtro=None, filtro_documento=None):
+        """
+        Los k mejores fragmentos según BM25. Los textos y metadatos se leen de la colección, que
+        también aplica los filtros a los candidatos.
+        """
+        filtrada = bool(filtro or filtro_documento)
+        candidatos = self.indice_bm25.buscar(consulta, max(k * HYBRID_CANDIDATES_FACTOR, BM25_MIN_CANDIDATES) if filtrada else k)
+        if not candidatos:
+            return []
+        data = self.collection.get(ids=[id_fragmento for id_fragmento, _ in candidatos], where=filtro or None,
+                                   where_document=filtro_documento or None, include=['documents', 'metadatas'])
+        encontrados = {id_fragmento: (documento, metadatos)
+                       for id_fragmento, documento, metadatos in zip(data['ids'], data['documents'], data['metadatas'])}
+        resultados = []
+        for id_fragmento, puntuacion in candidatos:
+            if id_fragmento in encontrados:
+                documento, metadatos = encontrados[id_fragmento]
+                resultados.append({"id": id_fragmento, "documento": documento, "metadatos": metadatos,
+                                   "distancia": None, "puntuacion_bm25": puntuacion})
+            if len(resultados) >= k:
+                break
+        return resultados
+
+def create_app(db_path=ingesta.CHROMA_DB_PATH, collection_name=ingesta.COLLECTION_NAME, backend=ingesta.EMBEDDING_BACKEND, usar_cache=True,
+               bm25_path=None, backend_llm=None, llm_modelo=rag.LLM_MODEL, llm_base_url=rag.LLM_BASE_URL):
+    """
+    Crea la aplicación FastAPI. El modelo y la colección se cargan al arrancar el servidor,
+    no al importar el módulo ni en cada petición. `backend_llm` (cualquier objeto con
+    `generar(mensajes)`) sustituye al cliente de OpenAI que se crea con `llm_modelo` y `llm_base_url`.
+    """
+    @asynccontextmanager
+    async def lifespan(app):
+        app.state.buscador = Buscador(db_path, collection_name, backend, usar_cache, bm25_path)
+        app.state.metricas = MetricasLatencia()
+        app.state.respondedor = None
+        try:
+            app.state.respondedor = rag.Respondedor(app.state.buscador, backend_llm or rag.BackendOpenAI(llm_modelo, llm_base_url))
+        except Exception as e: # Sin el paquete openai o sin clave: la búsqueda sigue disponible
+            print(f"Advertencia: /answer no estará disponible: {e}")
+        yield
+
+    app = FastAPI(title="Búsqueda semántica en ChromaDB", lifespan=lifespan)
+
+    def ejecutar(endpoint, funcion):
+        # Los endpoints son síncronos: FastAPI los ejecuta en su pool de hilos, así varias
+        # peticiones se atienden a la vez sin bloquear el bucle de eventos
+        inicio = time.perf_counter()
+        error = False
+        try:
+            return funcion()
+        except ValueError as e: # Filtros mal formados y similares
+            error = True
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception:
+            error = True
+            raise
+        finally:
+            app.state.metricas.registrar(endpoint, time.perf_counter() - inicio, error)
+
+    @app.post("/search")
+    def search(busqueda: Busqueda):
+        return ejecutar("/search", lambda: {
+            "consulta": busqueda.consulta,
+            "resultados": app.state.buscador.buscar([busqueda.consulta], busqueda.k, busqueda.filtro, busqueda.filtro_documento,
+                                                    busqueda.modo, busqueda.peso_lexico)[0],
+        })
+
+    @app.post("/search/batch")
+    def search_batch(busqueda: BusquedaEnLote):
+        return ejecutar("/search/batch", lambda: {
+            "resultados": [
+                {"consulta": consulta, "resultados": resultados}
+                for consulta, resultados in zip(
+                    busqueda.consultas,
+                    app.state.buscador.buscar(busqueda.consultas, busqueda.k, busqueda.filtro, busqueda.filtro_documento,
+                                              busqueda.modo, busqueda.peso_lexico),
+                )
+            ],
+        })
+
+    @app.post("/answer")
+    def answer(pregunta: Pregunta):
+        if app.state.respondedor is None:
+            raise HTTPException(status_code=503, detail="No hay un backend de LLM configurado.")
+        opciones = {"filtro": pregunta.filtro, "filtro_documento": pregunta.filtro_documento, "modo": pregunta.modo,
+                    "presupuesto_tokens": pregunta.presupuesto_tokens}
+        if not pregunta.stream:
+            return ejecutar("/answer", lambda: app.state.respondedor.responder(pregunta.pregunta, **opciones))
+
+        def al_terminar(segundos, primer_token, error):
+            app.state.metricas.registrar("/answer", segundos, error)
+            if primer_token is not None:
+                app.state.metricas.registrar("/answer (primer token)", primer_token)
+
+        # El generador es síncrono: Starlette lo recorre en su pool de hilos
+        return StreamingResponse(app.state.respondedor.responder_sse(pregunta.pregunta, al_terminar, **opciones),
+                                 media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+    @app.get("/metrics")
+    def metrics():
+        buscador = app.state.buscador
+        metricas = {"coleccion": buscador.collection_name, **app.state.metricas.resumen()}
+        if buscador.cache is not None:
+            metricas["cache"] = buscador.cache.resumen()
+        return metricas
+
+    return app
+
+def parse_args(argv=None):
+    load_dotenv() # Antes de leer los valores por defecto que vienen de variables de entorno (OPENAI_*)
+    parser = argparse.ArgumentParser(description="Servicio HTTP de búsqueda semántica sobre una colección de ChromaDB.")
+    parser.add_argument("--host", default=SEARCH_HOST, help=f"Dirección de escucha (por defecto: {SEARCH_HOST})")
+    parser.add_argument("--port", type=int, default=SEARCH_PORT, help=f"Puerto (por defecto: {SEARCH_PORT})")
+    parser.add_argument("--db", default=ingesta.CHROMA_DB_PATH, help=f"Ruta de la base de datos ChromaDB (por defecto: {ingesta.CHROMA_DB_PATH})")
+    parser.add_argument("--coleccion", default=ingesta.COLLECTION_NAME, help=f"Colección (por defecto: {ingesta.COLLECTION_NAME})")
+    parser.add_argument("--backend", choices=["torch", "torch-quantized", "onnx"], default=ingesta.EMBEDDING_BACKEND,
+                        help="Backend para calcular los embeddings de las consultas (el mismo que se usó al ingerir)")
+    parser.add_argument("--sin-cache", action="store_true", help="Desactivar la caché de consultas")
+    parser.add_argument("--llm-modelo", default=os.getenv("OPENAI_MODEL", rag.LLM_MODEL),
+                        help=f"Modelo para /answer (por defecto: OPENAI_MODEL o {rag.LLM_MODEL})")
+    parser.add_argument("--llm-base-url", default=os.getenv("OPENAI_BASE_URL") or rag.LLM_BASE_URL,
+                        help="Servidor compatible con la API de OpenAI para /answer (por defecto: OPENAI_BASE_URL o api.openai.com)")
+    parser.add_argument("--bm25", help="Índice BM25 para los modos 'bm25' e 'hibrido' (por defecto, el de la colección: "
+                                       "ver --help de add_documents_to_chromadb.py)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    import uvicorn # Importación diferida: solo hace falta para arrancar el servidor
+    uvicorn.run(create_app(args.db, args.coleccion, args.backend, not args.sin_cache, args.bm25,
+                           llm_modelo=args.llm_modelo, llm_base_url=args.llm_base_url), host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+import argparse # Para la interfaz de línea de comandos
+import json
+import os
+import shutil
+import time
+
+from export_chromadb_data import iterar_lotes # Lectura de la colección por lotes con limit/offset
+from delete_chromadb_data import borrar_indices_de_coleccion # Índices de ingesta y BM25 de la colección restaurada
+from query_cache import registrar_en_diario # Diario de ingesta para invalidar cachés de consultas
+
+# --- CONFIGURACIÓN ---
+# Ruta a la carpeta de tu base de datos ChromaDB persistente
+CHROMA_DB_PATH = "./my_chroma_db"
+# Nombre de la colección por defecto
+COLLECTION_NAME = "shared"
+# Carpeta donde se crean las instantáneas
+SNAPSHOTS_FOLDER = "./snapshots_chromadb"
+# Registros leídos de la colección por llamada al crear la instantánea
+SNAPSHOT_BATCH_SIZE = 2000
+# Registros por llamada a collection.add al restaurar (se recorta a client.max_batch_size si es menor)
+RESTORE_BATCH_SIZE = 5000
+# Archivos de una instantánea: vectores float32 (N x D) que se pueden abrir con mmap,
+# un registro JSON por línea en el mismo orden (id, documento, metadatos) y el manifiesto
+EMBEDDINGS_FILENAME = "embeddings.npy"
+RECORDS_FILENAME = "records.jsonl"
+MANIFEST_FILENAME = "manifest.json"
+SNAPSHOT_FORMAT_VERSION = 1
+# La restauración se hace en '<colección>-restaurando' y solo al terminar se renombra; la colección
+# que se reemplaza se aparta antes como '<colección>-reemplazada' y se borra al final
+RESTORE_TEMP_SUFFIX = "-restaurando"
+RESTORE_REPLACED_SUFFIX = "-reemplazada"
+COLLECTION_NAME_MAX_LENGTH = 63 # Límite de ChromaDB para los nombres de colección
+
+def crear_instantanea(db_path, collection_name, destino, tamano_lote=SNAPSHOT_BATCH_SIZE):
+    """
+    Vuelca ids, documentos, metadatos y embeddings de una colección a la carpeta `destino`.
+    Los embeddings se escriben directamente en un .npy abierto con open_memmap, así que la
+    memoria usada no depende del tamaño de la colección. Devuelve True si se completó.
+    """
+    import chromadb # Importaciones diferidas, como en el resto de scripts
+    import numpy as np
+
+    if os.path.exists(destino):
+        print(f"Error: '{destino}' ya existe. Elige otra carpeta de destino para la instantánea.")
+        return False
+    try:
+        client = chromadb.PersistentClient(path=db_path)
+        collection = client.get_collection(name=collection_name)
+    except Exception as e:
+        print(f"Error al abrir la colección '{collection_name}' en '{db_path}': {e}")
+        return False
+
+    total = collection.count()
+    print(f"Creando instantánea de la colección '{collection_name}' ({total} fragmentos) en '{destino}'...")
+    carpeta_temporal = f"{destino}.tmp"
+    shutil.rmtree(carpeta_temporal, ignore_errors=True)
+    os.makedirs(carpeta_temporal)
+
+    vectores = None
+    dimension = None
+    escritos = 0
+    inicio = time.monotonic()
+    try:
+        with open(os.path.join(carpeta_temporal, RECORDS_FILENAME), 'w', encoding='utf-8') as f_registros:
+            for data in iterar_lotes(collection, ['documents', 'metadatas', 'embeddings'], tamano_lote):
+                embeddings_lote = np.asarray(data['embeddings'], dtype=np.float32)
+                if vectores is None:
+                    dimension = embeddings_lote.shape[1]
+                    vectores = np.lib.format.open_memmap(os.path.join(carpeta_temporal, EMBEDDINGS_FILENAME), mode='w+',
+                                                         dtype=np.float32, shape=(total, dimension))
+                if escritos + len(data['ids']) > total:
+                    raise RuntimeError("la colección creció durante la instantánea; vuelve a intentarlo sin ingestas en curso")
+                vectores[escritos:escritos + len(data['ids'])] = embeddings_lote
+                for i, doc_id in enumerate(data['ids']):
+                    registro = {"id": doc_id, "document": data['documents'][i], "metadata": data['metadatas'][i]}
+                    f_registros.write(json.dumps(registro, ensure_ascii=False))
+                    f_registros.write("\n")
+                escritos += len(data['ids'])
+                duracion = max(time.monotonic() - inicio, 1e-9)
+                print(f"    Progreso: {escritos}/{total} fragmentos ({escritos / duracion:.1f} fragmentos/s)")
+        if vectores is not None:
+            vectores.flush()
+            del vectores
+
+        manifiesto = {
+            "format_version": SNAPSHOT_FORMAT_VERSION,
+            "collection": collection_name,
+            "collection_metadata": collection.metadata,
+            "count": escritos, # Filas válidas de embeddings.npy (puede ser menor que su tamaño si se borraron fragmentos)
+            "dimension": dimension,
+            "dtype": "float32",
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        }
+        with open(os.path.join(carpeta_temporal, MANIFEST_FILENAME), 'w', encoding='utf-8') as f:
+            json.dump(manifiesto, f, ensure_ascii=False, indent=2)
+    except Exception as e:
+        shutil.rmtree(carpeta_temporal, ignore_errors=True)
+        print(f"Error al crear la instantánea: {e}")
+        return False
+
+    os.replace(carpeta_temporal, destino)
+    print(f"¡Instantánea creada! {escritos} fragmentos guardados en '{destino}' en {time.monotonic() - inicio:.1f}s.")
+    return True
+
+def leer_registros(ruta_registros, tamano_lote):
+    """Produce listas de hasta `tamano_lote` registros de records.jsonl."""
+    lote = []
+    with open(ruta_registros, 'r', encoding='utf-8') as f:
+        for linea in f:
+            lote.append(json.loads(linea))
+            if len(lote) >= tamano_lote:
+                yield lote
+                lote = []
+    if lote:
+        yield lote
+
+def nombre_auxiliar(collection_name, sufijo):
+    return collection_name[:COLLECTION_NAME_MAX_LENGTH - len(sufijo)] + sufijo
+
+def restaurar_instantanea(origen, db_path, collection_name=None, sobrescribir=False, tamano_lote=RESTORE_BATCH_SIZE):
+    """
+    Carga una instantánea en una colección (nueva o vacía) con los embeddings guardados,
+    sin calcular ningún embedding. Funciona con una base de datos recién creada en otra máquina.
+    Se restaura en una colección temporal que solo sustituye a la de destino si se completa, así que
+    un fallo a medias no deja la colección vacía ni incompleta. Devuelve True si se completó.
+    """
+    import chromadb
+    import numpy as np
+
+    try:
+        with open(os.path.join(origen, MANIFEST_FILENAME), 'r', encoding='utf-8') as f:
+            manifiesto = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Error al leer el manifiesto de la instantánea '{origen}': {e}")
+        return False
+    if manifiesto.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+        print(f"Error: versión de instantánea no soportada: {manifiesto.get('format_version')}")
+        return False
+    collection_name = collection_name or manifiesto["collection"]
+    total = manifiesto["count"]
+
+    client = chromadb.PersistentClient(path=db_path)
+    existentes = {coleccion.name for coleccion in client.list_collections()}
+    if collection_name in existentes and client.get_collection(name=collection_name).count() and not sobrescribir:
+        print(f"Error: la colección '{collection_name}' ya tiene datos. Usa --sobrescribir para reemplazarla.")
+        return False
+    nombre_temporal = nombre_auxiliar(collection_name, RESTORE_TEMP_SUFFIX)
+    if nombre_temporal in existentes:
+        client.delete_collection(name=nombre_temporal) # Restos de una restauración que no terminó
+    # Sin función de embedding: todos los registros llevan su vector
+    collection = client.create_collection(name=nombre_temporal, metadata=manifiesto.get("collection_metadata") or None,
+                                          embedding_function=None)
+
+    tamano_lote = min(tamano_lote, getattr(client, "max_batch_size", tamano_lote) or tamano_lote)
+    vectores = np.load(os.path.join(origen, EMBEDDINGS_FILENAME), mmap_mode='r') if total else None
+    print(f"Restaurando {total} fragmentos en la colección '{collection_name}' de '{db_path}' (lotes de {tamano_lote})...")
+    restaurados = 0
+    inicio = time.monotonic()
+    try:
+        for lote in leer_registros(os.path.join(origen, RECORDS_FILENAME), tamano_lote):
+            collection.add(
+                ids=[registro["id"] for registro in lote],
+                documents=[registro["document"] for registro in lote],
+                metadatas=[registro["metadata"] for registro in lote],
+                embeddings=vectores[restaurados:restaurados + len(lote)].tolist(),
+            )
+            restaurados += len(lote)
+            duracion = max(time.monotonic() - inicio, 1e-9)
+            print(f"    Progreso: {restaurados}/{total} fragmentos ({restaurados / duracion:.1f} fragmentos/s)")
+    except Exception as e:
+        print(f"Error al restaurar la instantánea tras {restaurados} fragmentos: {e}")
+        client.delete_collection(name=nombre_temporal)
+        print(f"La colección '{collection_name}' no se ha modificado.")
+        return False
+
+    if not sustituir_coleccion(client, collection, collection_name, collection_name in existentes):
+        return False
+    # Los índices de ingesta y BM25 eran de la colección anterior: se reconstruyen a partir de la restaurada
+    # en la próxima ingesta, y las cachés de consultas se invalidan con el diario
+    borrar_indices_de_coleccion(collection_name, db_path)
+    registrar_en_diario("reset", collection_name)
+    print(f"¡Instantánea restaurada! {restaurados} fragmentos en la colección '{collection_name}' en {time.monotonic() - inicio:.1f}s.")
+    return True
+
+def sustituir_coleccion(client, restaurada, collection_name, existe):
+    """
+    Renombra la colección restaurada a `collection_name`. La que ya existía se aparta antes con otro
+    nombre y se borra solo cuando el cambio de nombre ha funcionado. Devuelve True si se completó.
+    """
+    nombre_temporal = restaurada.name
+    anterior = None
+    try:
+        if existe:
+            nombre_reemplazada = nombre_auxiliar(collection_name, RESTORE_REPLACED_SUFFIX)
+            if nombre_reemplazada in {coleccion.name for coleccion in client.list_collections()}:
+                client.delete_collection(name=nombre_reemplazada)
+            anterior = client.get_collection(name=collection_name)
+            anterior.modify(name=nombre_reemplazada)
+        restaurada.modify(name=collection_name)
+    except Exception as e:
+        print(f"Error al sustituir la colección '{collection_name}' por la restaurada: {e}")
+        if anterior is not None and anterior.name != collection_name:
+            try:
+                anterior.modify(name=collection_name)
+            except Exception as e_deshacer:
+                print(f"Error al devolver su nombre a la colección '{anterior.name}': {e_deshacer}. Renómbrala a '{collection_name}' a mano.")
+        print(f"La instantánea quedó restaurada en la colección '{nombre_temporal}'.")
+        return False
+    if anterior is not None:
+        client.delete_collection(name=anterior.name)
+    return True
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Crea y restaura instantáneas de colecciones de ChromaDB sin recalcular embeddings.")
+    parser.add_argument("--db", default=CHROMA_DB_PATH, help=f"Ruta de la base de datos ChromaDB (por defecto: {CHROMA_DB_PATH})")
+    subparsers = parser.add_subparsers(dest="comando", required=True)
+
+    snapshot = subparsers.add_parser("snapshot", help="Vuelca una colección a una carpeta")
+    snapshot.add_argument("--coleccion", default=COLLECTION_NAME, help=f"Colección a volcar (por defecto: {COLLECTION_NAME})")
+    snapshot.add_argument("--destino", help=f"Carpeta de la instantánea (por defecto: {SNAPSHOTS_FOLDER}/<colección>-<fecha>)")
+    snapshot.add_argument("--tamano-lote", type=int, default=SNAPSHOT_BATCH_SIZE, help="Registros leídos por llamada")
+
+    restore = subparsers.add_parser("restore", help="Carga una instantánea en una colección")
+    restore.add_argument("origen", help="Carpeta de la instantánea")
+    restore.add_argument("--coleccion", help="Colección de destino (por defecto, la de la instantánea)")
+    restore.add_argument("--sobrescribir", action="store_true", help="Reemplazar la colección si ya tiene datos")
+    restore.add_argument("--tamano-lote", type=int, default=RESTORE_BATCH_SIZE, help="Registros por llamada a collection.add")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.comando == "snapshot":
+        destino = args.destino or os.path.join(SNAPSHOTS_FOLDER, f"{args.coleccion}-{time.strftime('%Y%m%d-%H%M%S')}")
+        os.makedirs(os.path.dirname(os.path.abspath(destino)), exist_ok=True)
+        crear_instantanea(args.db, args.coleccion, destino, max(1, args.tamano_lote))
+    else:
+        restaurar_instantanea(args.origen, args.db, args.coleccion, args.sobrescribir, max(1, args.tamano_lote))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+import re
+from html.parser import HTMLParser
+
+# --- CONFIGURACIÓN ---
+# Macros de Confluence cuyo contenido no aporta texto para indexar (navegación, listados, adjuntos...)
+SKIPPED_MACROS = {"toc", "toc-zone", "children", "pagetree", "pagetreesearch", "attachments", "recently-updated",
+                  "contentbylabel", "content-report-table", "gallery", "viewfile", "view-file", "drawio", "jira", "livesearch"}
+# Macros cuyo cuerpo es código y se convierte en un bloque ```
+CODE_MACROS = {"code", "noformat"}
+# Elementos cuyo contenido se descarta por completo
+SKIPPED_TAGS = {"ac:parameter", "ac:image", "ac:emoticon", "ac:placeholder", "ac:task-id", "ac:task-status", "script", "style"}
+# Elementos HTML sin etiqueta de cierre (pueden aparecer en body.view)
+VOID_TAGS = {"br", "hr", "img", "input", "meta", "link", "col", "wbr", "source"}
+# Elementos que separan bloques de texto (párrafos)
+BLOCK_TAGS = {"p", "div", "blockquote", "section", "article", "dl", "dt", "dd", "ac:rich-text-body", "ac:layout",
+              "ac:layout-section", "ac:layout-cell", "ac:task-body", "figure", "figcaption"}
+HEADING_TAGS = {"h1", "h2", "h3", "h4", "h5", "h6"}
+LIST_TAGS = {"ul", "ol", "ac:task-list"}
+LIST_ITEM_TAGS = {"li", "ac:task"}
+# Elementos de recursos de Confluence que dan el texto de un ac:link sin cuerpo
+LINK_RESOURCE_TITLE_ATTRIBUTES = {"ri:page": "ri:content-title", "ri:blog-post": "ri:content-title",
+                                  "ri:attachment": "ri:filename", "ri:space": "ri:space-key", "ri:url": "ri:value"}
+LINE_BREAK = "\x00" # Marca de <br> dentro de un bloque: sobrevive a la normalización de espacios
+
+class StorageToMarkdown(HTMLParser):
+    """
+    Convierte el XHTML del formato de almacenamiento de Confluence (body.storage), o el HTML de
+    body.view, en markdown. Es incremental: se le pasan trozos con feed() y los bloques terminados
+    (encabezados, párrafos, elementos de lista, filas de tabla, bloques de código) se recogen con take()
+    sin esperar al final del documento. Solo conserva la estructura útil para indexar: los enlaces se
+    reducen a su texto y las imágenes, parámetros de macros y macros de navegación se omiten.
+    `heading_offset` baja el nivel de todos los encabezados (p. ej. 1 si el título de la página es el '#').
+    """
+    def __init__(self, heading_offset=0):
+        super().__init__(convert_charrefs=True)
+        self.heading_offset = heading_offset
+        self._out = []
+        self._emitted = False
+        self._last_tight = False
+        self._inline = []
+        self._prefix = ""
+        self._tight = False
+        self._heading_level = None
+        self._lists = [] # Pila de [etiqueta, número del elemento actual]
+        self._quote_depth = 0
+        self._skip_depth = 0
+        self._macros = [] # Pila de nombres de ac:structured-macro abiertas
+        self._code = None # Trozos del bloque de código en curso (<pre> o macro code)
+        self._row = None # Celdas de la fila de tabla en curso
+        self._rows_in_table = 0
+        self._cell = None # Trozos de la celda en curso
+        self._cell_depth = 0
+        self._link = None # (destino del texto, longitud al abrir el enlace, título del recurso)
+
+    # --- Salida ---
+
+    def _emit(self, block, tight=False):
+        if self._quote_depth:
+            block = "\n".join(f"{'> ' * self._quote_depth}{line}" for line in block.split("\n"))
+        if self._emitted:
+            self._out.append("\n" if tight and self._last_tight else "\n\n")
+        self._out.append(block)
+        self._emitted = True
+        self._last_tight = tight
+
+    def _flush(self):
+        """Emite el texto acumulado como un bloque. Si no hay texto, se conserva el prefijo (p. ej. '- ')."""
+        text = normalize_inline(self._inline)
+        self._inline = []
+        if not text:
+            return
+        self._emit(f"{self._prefix}{text}", self._tight)
+        self._prefix = ""
+        self._tight = False
+
+    def take(self):
+        """Devuelve el markdown de los bloques terminados desde la última llamada."""
+        markdown = "".join(self._out)
+        self._out = []
+        return markdown
+
+    def close(self):
+        super().close()
+        if self._code is not None:
+            self._emit_code()
+        self._flush()
+
+    # --- Eventos del parser ---
+
+    def _target(self):
+        return self._cell if self._cell is not None else self._inline
+
+    def _emit_code(self):
+        code = "".join(self._code).strip("\n")
+        self._code = None
+        if code.strip():
+            self._emit(f"```\n{code}\n```")
+
+    def handle_starttag(self, tag, attrs):
+        if self._skip_depth:
+            if tag not in VOID_TAGS:
+                self._skip_depth += 1
+            return
+        attributes = dict(attrs)
+        if tag in SKIPPED_TAGS or (tag == "ac:structured-macro" and attributes.get("ac:name") in SKIPPED_MACROS):
+            if tag not in VOID_TAGS:
+                self._skip_depth = 1
+            return
+        if tag == "ac:structured-macro":
+            self._macros.append(attributes.get("ac:name"))
+        if self._code is not None:
+            return
+        if tag in LINK_RESOURCE_TITLE_ATTRIBUTES:
+            if self._link is not None and self._link[2] is None:
+                self._link = (*self._link[:2], attributes.get(LINK_RESOURCE_TITLE_ATTRIBUTES[tag]))
+            return
+        if tag == "ac:link":
+            target = self._target()
+            self._link = (target, len(target), None)
+            return
+        if tag == "time" and attributes.get("datetime"):
+            self._target().append(f" {attributes['datetime']} ")
+            return
+
+        if self._cell is not None:
+            # Dentro de una celda solo se conserva el texto (tablas anidadas, listas y párrafos incluidos)
+            if tag in ("td", "th"):
+                self._cell_depth += 1
+            if tag == "code":
+                self._cell.append("`")
+            elif tag not in ("a", "span", "strong", "b", "em", "i", "u", "sub", "sup"):
+                self._cell.append(" ")
+            return
+
+        if tag == "pre" or (tag == "ac:structured-macro" and attributes.get("ac:name") in CODE_MACROS):
+            self._flush()
+            self._code = []
+        elif tag in HEADING_TAGS:
+            self._flush()
+            self._heading_level = min(6, int(tag[1]) + self.heading_offset)
+        elif tag in LIST_TAGS:
+            self._flush()
+            self._lists.append([tag, 0])
+        elif tag in LIST_ITEM_TAGS:
+            self._flush()
+            if not self._lists:
+                self._lists.append(["ul", 0])
+            current = self._lists[-1]
+            current[1] += 1
+            marker = f"{current[1]}." if current[0] == "ol" else ("- [ ]" if current[0] == "ac:task-list" else "-")
+            self._prefix = f"{'  ' * (len(self._lists) - 1)}{marker} "
+            self._tight = True
+        elif tag == "table":
+            self._flush()
+            self._rows_in_table = 0
+        elif tag == "tr":
+            self._flush()
+            self._row = []
+        elif tag in ("td", "th") and self._row is not None:
+            self._cell = []
+            self._cell_depth = 1
+        elif tag == "br":
+            self._inline.append(LINE_BREAK)
+        elif tag == "hr":
+            self._flush()
+            self._emit("---")
+        elif tag == "code":
+            self._inline.append("`")
+        elif tag in BLOCK_TAGS:
+            self._flush()
+            if tag == "blockquote":
+                self._quote_depth += 1
+
+    def handle_endtag(self, tag):
+        if self._skip_depth:
+            if tag not in VOID_TAGS:
+                self._skip_depth -= 1
+            return
+        if tag == "ac:structured-macro":
+            name = self._macros.pop() if self._macros else None
+            if self._code is not None and name in CODE_MACROS:
+                self._emit_code()
+            return
+        if self._code is not None:
+            if tag == "pre":
+                self._emit_code()
+            return
+        if tag == "ac:link":
+            if self._link is not None:
+                target, length, title = self._link
+                if title and not normalize_inline(target[length:]):
+                    target.append(title)
+                self._link = None
+            return
+
+        if self._cell is not None:
+            if tag in ("td", "th"):
+                self._cell_depth -= 1
+                if self._cell_depth == 0:
+                    self._row.append(normalize_inline(self._cell).replace("|", "\\|"))
+                    self._cell = None
+                    return
+            if tag == "code":
+                self._cell.append("`")
+            elif tag not in ("a", "span", "strong", "b", "em", "i", "u", "sub", "sup"):
+                self._cell.append(" ")
+            return
+
+        if tag in HEADING_TAGS and self._heading_level is not None:
+            text = normalize_inline(self._inline).replace("\n", " ")
+            self._inline = []
+            if text:
+                self._emit(f"{'#' * self._heading_level} {text}")
+            self._heading_level = None
+        elif tag in LIST_ITEM_TAGS:
+            self._flush()
+            self._prefix = ""
+            self._tight = False
+        elif tag in LIST_TAGS:
+            self._flush()
+            if self._lists:
+                self._lists.pop()
+            if not self._lists:
+                self._last_tight = False # Línea en blanco entre una lista y lo que la sigue
+        elif tag == "tr" and self._row is not None:
+            if any(self._row):
+                self._emit(f"| {' | '.join(self._row)} |", tight=True)
+                if self._rows_in_table == 0:
+                    self._emit(f"|{'---|' * len(self._row)}", tight=True)
+                self._rows_in_table += 1
+            self._row = None
+        elif tag == "table":
+            self._row = None
+            self._last_tight = False
+        elif tag == "code":
+            self._inline.append("`")
+        elif tag in BLOCK_TAGS:
+            self._flush()
+            if tag == "blockquote" and self._quote_depth:
+                self._quote_depth -= 1
+
+    def handle_data(self, data):
+        if self._skip_depth:
+            return
+        if self._code is not None:
+            self._code.append(data)
+        else:
+            self._target().append(data)
+
+    def unknown_decl(self, data):
+        # <![CDATA[...]]> (el cuerpo de las macros de código) llega aquí en las versiones de Python que no lo tratan como texto
+        if data.startswith("CDATA["):
+            self.handle_data(data[len("CDATA["):])
+
+def normalize_inline(pieces):
+    """Une los trozos de texto de un bloque colapsando los espacios; los <br> se conservan como saltos de línea."""
+    text = re.sub(r"[ \t\r\n\f\v ]+", " ", "".join(pieces))
+    return re.sub(r" ?\x00 ?", "\n", text).strip()
+
+def iter_markdown(chunks, heading_offset=0):
+    """Convierte los trozos de XHTML de `chunks` y produce el markdown según se completan los bloques."""
+    parser = StorageToMarkdown(heading_offset)
+    for chunk in chunks:
+        parser.feed(chunk)
+        markdown = parser.take()
+        if markdown:
+            yield markdown
+    parser.close()
+    markdown = parser.take()
+    if markdown:
+        yield markdown
+
+def storage_to_markdown(xhtml, heading_offset=0):
+    return "".join(iter_markdown([xhtml], heading_offset))